@@ -1,16 +1,10 @@
-from RealtimeSTT import AudioToTextRecorder
-import assist # Il tuo modulo per le chiamate OpenAI e TTS
-import tools
+import os
 import time
+import queue
 import threading
-from pygame import mixer
-import shared_variables # Per latest_text e lock
-import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv, find_dotenv
-from rich.console import Console 
-from rich.spinner import Spinner
-import logging 
-from rich.logging import RichHandler # ADDED IMPORT FOR RICH LOGGING
 
 # --- Debug Iniziale per .env ---
 # These print statements will remain as they are, not converted to logging,
@@ -26,14 +20,205 @@ stl_folder_check = os.getenv("STL_DEFAULT_FOLDER")
 # print(f"[DEBUG] Valore di STL_DEFAULT_FOLDER (all'avvio): {stl_folder_check}")
 # --- Fine Debug Iniziale ---
 
+import startup_profile
+# Creato prima degli altri import, così il profilo dell'avvio li include
+profiler = startup_profile.StartupProfiler.from_env()
+
+import tools # leggero: i moduli di analisi (NumPy) vengono importati solo quando servono
+import shared_variables # Per la coda delle trascrizioni
+from rich.console import Console 
+from rich.spinner import Spinner
+from rich.live import Live
+from rich.text import Text
+import latency_stats
+import gcode_cache
+import stt_config
+import voice_pipeline
+import hotwords
+import tts
+from rich.logging import RichHandler # ADDED IMPORT FOR RICH LOGGING
+
 console = Console() 
 
+# Risposte di Arturo mostrate man mano che arrivano (STREAM_RESPONSES=0 per attendere la risposta completa)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") != "0"
+
+TRANSCRIPT_WAIT_SECONDS = 1.0 # attesa massima di una trascrizione prima di ricontrollare modalità e Ctrl+C
+ECHO_WINDOW_SECONDS = 0.5     # frasi finite entro questo tempo dalla fine della risposta vocale sono considerate eco
+_recording_stopped_at = None  # istante (perf_counter) in cui il VAD ha chiuso l'ultima registrazione
+_waiting_for_voice = False    # il prompt testuale è in attesa perché la voce si sta ancora caricando
+
+# --- Caricamento in background ---
+# Assistente (Gemini e tool), riconoscimento vocale, audio e sintesi vocale si caricano in parallelo
+# mentre il prompt è già utilizzabile; chi li usa aspetta solo se non sono ancora pronti.
+_startup_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="startup")
+_assistant_future = None
+_recorder_future = None
+_mixer_future = None
+_tts_future = None
+
+def _load_assistant():
+    with profiler.phase("Assistente (Gemini e tool)"):
+        import assist
+    with profiler.phase("Coda di stampa e monitor stampanti"):
+        tools.resume_print_queue() # Riprende i lavori di stampa rimasti in coda
+        tools.start_printer_monitor() # Avvisi in tempo reale dalle stampanti
+    return assist
+
+def _list_models():
+    # Elenco dei modelli Gemini (un round-trip di rete), solo se richiesto con GEMINI_LIST_MODELS=1
+    with profiler.phase("Elenco modelli Gemini"):
+        _assistant_future.result().log_available_models()
+
+def _load_recorder():
+    with profiler.phase("Riconoscimento vocale (RealtimeSTT)"):
+        # Modello, dispositivo e tipo di calcolo da .env o preferences.json (CPU int8 se non c'è una GPU)
+        config = stt_config.load_stt_config(tools.load_preferences())
+        logging.info(f"Riconoscimento vocale: {config.describe()}") # This will be INFO level
+        from RealtimeSTT import AudioToTextRecorder
+        return AudioToTextRecorder(
+            spinner=False,
+            post_speech_silence_duration=0.75,
+            silero_sensitivity=0.4,
+            on_recording_stop=_on_recording_stop,
+            **config.recorder_kwargs(),
+        )
+
+def _load_mixer():
+    with profiler.phase("Audio (pygame)"):
+        from pygame import mixer
+        mixer.init()
+        return mixer
+
+def _load_tts():
+    mixer = _mixer_future.result()
+    with profiler.phase("Sintesi vocale"):
+        speech = tts.TextToSpeech.from_env(mixer)
+    if speech is None:
+        logging.warning("Nessun motore di sintesi vocale locale (TTS_VOICE con una voce Piper, o espeak-ng): risposte solo testuali.")
+    else:
+        logging.info(f"Sintesi vocale: {speech.engine.id}") # This will be INFO level
+    return speech
+
+def _on_recorder_loaded(future):
+    if future.exception() is not None:
+        logging.error(f"Riconoscimento vocale non disponibile ({future.exception()}): continuo in modalità testo.")
+    elif _waiting_for_voice:
+        console.print("[green]Riconoscimento vocale pronto.[/green] Premi Invio per passare alla voce.")
+
+def _print_profile_when_loaded(futures):
+    wait(futures)
+    profiler.print_report()
+
+def _loaded(future):
+    """Risultato di un caricamento in background concluso con successo, altrimenti None (senza attendere)."""
+    if future is None or not future.done() or future.exception() is not None:
+        return None
+    return future.result()
+
+def get_assist():
+    """Il modulo assist, attendendo la fine del caricamento se necessario."""
+    return _assistant_future.result()
+
+def get_tts():
+    """La sintesi vocale, attendendo la fine del caricamento se necessario; None se non disponibile."""
+    try:
+        return _tts_future.result()
+    except Exception as e:
+        logging.error(f"Sintesi vocale non disponibile: {e}")
+        return None
+
+def _speak(sentence, interrupted):
+    # Motore dello Speaker: la prima frase attende il caricamento della voce, le altre sono già sintetizzate
+    if tools.is_silent_mode():
+        return
+    speech = get_tts()
+    if speech is not None:
+        speech.speak(sentence, interrupted)
+
+def _prepare_speech(sentence):
+    speech = _loaded(_tts_future)
+    if speech is not None and not tools.is_silent_mode():
+        speech.prepare(sentence)
+
+def _cancel_speech():
+    speech = _loaded(_tts_future)
+    if speech is not None:
+        speech.cancel_pending()
+
+def stop_audio():
+    speech = _loaded(_tts_future)
+    if speech is not None:
+        speech.stop()
+
+def ask_arturo(question, speech_end=None, cancel=None, on_sentence=None):
+    """
+    Invia la domanda all'AI, mostra la risposta in console (in streaming se attivo) e la restituisce completa.
+    speech_end è l'istante (perf_counter) di fine del parlato per le domande a voce, usato per misurare
+    la latenza fino all'invio della richiesta; cancel (threading.Event) interrompe la risposta (barge-in);
+    on_sentence riceve ogni frase completa appena disponibile, per pronunciarla subito.
+    """
+    splitter = voice_pipeline.SentenceSplitter()
+    if not STREAM_RESPONSES:
+        with console.status(Spinner("dots", text=" Arturo sta pensando...")):
+            assist = get_assist()
+            _record_speech_to_llm(speech_end)
+            response = assist.ask_question_memory(question, cancel=cancel)
+        if cancel is not None and cancel.is_set():
+            console.print("[dim]Arturo: (risposta interrotta)[/dim]")
+            return response
+        console.print(f"[b style='dark_orange']Arturo:[/b style='dark_orange'] [dark_orange]{response}[/dark_orange]") # MODIFIED for color
+        if on_sentence is not None:
+            for sentence in splitter.feed(response) + [splitter.flush()]:
+                if sentence:
+                    on_sentence(sentence)
+        return response
+
+    text = Text("Arturo: ", style="bold dark_orange")
+    chunks = []
+    # Lo spinner resta finché non arriva il primo pezzo di testo, poi la risposta cresce sul posto
+    with Live(Spinner("dots", text=" Arturo sta pensando..."), console=console, refresh_per_second=15) as live:
+        assist = get_assist()
+        _record_speech_to_llm(speech_end)
+        for chunk in assist.ask_question_stream(question, cancel=cancel):
+            if not chunks:
+                live.update(text)
+            chunks.append(chunk)
+            text.append(chunk, style="dark_orange")
+            if on_sentence is not None:
+                for sentence in splitter.feed(chunk):
+                    on_sentence(sentence)
+    if cancel is not None and cancel.is_set():
+        console.print("[dim](risposta interrotta)[/dim]")
+        return "".join(chunks)
+    if on_sentence is not None and (rest := splitter.flush()):
+        on_sentence(rest)
+    stats = latency_stats.get_latency_stats()
+    ttft, total = stats.last("llm_ttft"), stats.last("llm_turn")
+    if ttft is not None and total is not None:
+        console.print(f"[dim]Primo token in {ttft:.2f}s, risposta completa in {total:.2f}s[/dim]")
+    return "".join(chunks)
+
+def _record_speech_to_llm(speech_end):
+    if speech_end is not None:
+        latency_stats.get_latency_stats().record("speech_to_llm", time.perf_counter() - speech_end)
+
+def _on_recording_stop():
+    # Callback di RealtimeSTT: il VAD ha rilevato la fine della frase
+    global _recording_stopped_at
+    _recording_stopped_at = time.perf_counter()
+
 def listen_thread(recorder_instance): 
-    """Thread che ascolta continuamente e aggiorna latest_text."""
+    """Thread che ascolta continuamente e mette in coda ogni trascrizione, nell'ordine in cui è stata pronunciata."""
     while True:
         text = recorder_instance.text()
-        with shared_variables.latest_text_lock:
-            shared_variables.latest_text = text
+        received = time.perf_counter()
+        if not text:
+            continue
+        # recorder.text() restituisce solo dopo la fine della registrazione, quindi l'istante è di questa frase
+        speech_end = _recording_stopped_at if _recording_stopped_at is not None else received
+        latency_stats.get_latency_stats().record("stt_transcription", received - speech_end)
+        shared_variables.transcripts.put((text, speech_end))
 
 if __name__ == '__main__':
     # --- Configura Rich Logging ---
@@ -54,151 +239,106 @@ if __name__ == '__main__':
     logging.getLogger("genai").setLevel(logging.INFO)
     # --- Fine Configurazione Logging ----
 
-    mixer.init()  
-
-    recorder = AudioToTextRecorder(
-        spinner=False,
-        model="large-v3-turbo", 
-        language="it",
-        post_speech_silence_duration=0.75,
-        silero_sensitivity=0.4,
-        device="cuda",
-        compute_type="float16"
-    )
-    
-    hot_words = ["arturo", "artur", "vez","coglione","testa di cazzo","miserabile","scemo di merda","porco dio"] 
-    expecting_user_response = False 
-    last_tts_end_time = 0.0 
+    _assistant_future = _startup_pool.submit(_load_assistant)
+    _recorder_future = _startup_pool.submit(_load_recorder)
+    _mixer_future = _startup_pool.submit(_load_mixer)
+    _tts_future = _startup_pool.submit(_load_tts)
+    _recorder_future.add_done_callback(_on_recorder_loaded)
+    if os.getenv("GEMINI_LIST_MODELS", "0") == "1":
+        _startup_pool.submit(_list_models)
+    if profiler.enabled:
+        threading.Thread(target=_print_profile_when_loaded, args=([_assistant_future, _recorder_future, _mixer_future, _tts_future],), daemon=True).start()
+
+    recorder = None # disponibile appena RealtimeSTT ha caricato il modello
+    hotword_matcher = hotwords.HotwordMatcher.from_preferences(tools.load_preferences()) # lista e tolleranza da preferences.json
+    # Stadi della conversazione: i turni girano su un thread proprio, così l'ascolto continua e si può interrompere
+    speaker = voice_pipeline.Speaker(speak=_speak, prepare=_prepare_speech, cancel=_cancel_speech)
+    pipeline = voice_pipeline.VoicePipeline(ask_arturo, speaker)
 
     initial_greeting = "Ciao vez, sono Arturo. In cosa posso aiutarti?"
     console.print(initial_greeting) 
     if not tools.is_silent_mode(): 
-        # assist.TTS(initial_greeting) # TODO: Re-enable TTS when a Gemini-compatible solution is implemented
-        last_tts_end_time = time.time() 
-
-    if not tools.is_silent_mode() and not recorder.is_recording:
-        # This specific print can be converted to logging.debug if preferred,
-        # but the subtask specified modifying/adding basicConfig.
-        # For now, keeping it as print to match original intent unless specified otherwise.
-        # print("[DEBUG] Avvio registratore all'inizio...")
-        recorder.start()
-
-    listener = threading.Thread(target=listen_thread, args=(recorder,), daemon=True)
-    listener.start()
-
-    console.print("Ti ascolto...") 
+        speaker.say(initial_greeting)
+    profiler.mark("Prompt pronto")
 
     try:
         while True:
-            if tools.is_silent_mode():
-                if recorder.is_recording:
+            if recorder is None and _loaded(_recorder_future) is not None:
+                recorder = _recorder_future.result()
+                listener = threading.Thread(target=listen_thread, args=(recorder,), daemon=True)
+                listener.start()
+
+            # Modalità testo: silenziosa, o vocale con il riconoscimento ancora in caricamento (o non disponibile)
+            if tools.is_silent_mode() or recorder is None:
+                if recorder is not None and recorder.is_recording:
                     # Similar to above, this print can be logging.debug
                     # print("[DEBUG] Modalità silenziosa: fermo il registratore.")
                     recorder.stop()
                 
-                user_input = console.input("[b style='dark_cyan']Tu (testo):[/b style='dark_cyan'] ") # MODIFIED for color
+                _waiting_for_voice = not tools.is_silent_mode() and not _recorder_future.done()
+                label = "Tu (testo, voce in caricamento)" if _waiting_for_voice else "Tu (testo)"
+                user_input = console.input(f"[b style='dark_cyan']{label}:[/b style='dark_cyan'] ") # MODIFIED for color
+                _waiting_for_voice = False
                 if user_input.lower() == 'exit': 
                     break
+                if not user_input.strip():
+                    continue
                 
-                with console.status(Spinner("dots", text=" Arturo sta pensando...")):
-                    response = assist.ask_question_memory(user_input) 
-                
-                console.print(f"[b style='dark_orange']Arturo:[/b style='dark_orange'] [dark_orange]{response}[/dark_orange]") # MODIFIED for color
-                
-                if "silent mode disabled" in response.lower() and not recorder.is_recording:
-                    # print("[DEBUG] Modalità silenziosa disabilitata. Riattivo l'ascolto vocale al prossimo ciclo.")
-                    continue 
-
-            else: # Modalità Vocale
-                if not recorder.is_recording:
-                    # print("[DEBUG] Modalità vocale: avvio il registratore.")
-                    recorder.start()
-                    console.print("Ti ascolto...") 
-
+                pipeline.submit(user_input)
+                pipeline.wait()
+                continue
 
-            time.sleep(0.5)
-            text_from_stt = "" # Usa una variabile temporanea per chiarezza
-            with shared_variables.latest_text_lock:
-                text_from_stt = shared_variables.latest_text
-                shared_variables.latest_text = "" # Svuota il buffer solo dopo aver letto il testo
-
-            # Ora elabora il testo solo se non è vuoto
-            if text_from_stt:
-                console.print(f"[b style='dark_cyan']Utente:[/b style='dark_cyan'] [dark_cyan]{text_from_stt}[/dark_cyan]") # Stampa l'input dell'utente una volta qui
-
-                # Modifica la condizione per l'eco se necessario
-                if (time.time() - last_tts_end_time) < 0.5: # Ridotto a 0.5s, o rimuovi del tutto per test
-                    logging.debug("[DEBUG] Testo ignorato (probabile eco).")
-                    continue # Passa al prossimo ciclo se è eco
-
-                # Assegna il testo elaborato per il resto della logica nel blocco corrente
-                current_text_for_processing = text_from_stt # Usa un nome diverso per chiarezza, o semplicemente continua a usare text_from_stt
-
-                # --- Inizio Blocco Logica di Elaborazione Testo (ora correttamente annidato) ---
-                hotword_found = any(hot_word in current_text_for_processing.lower() for hot_word in hot_words)
-                logging.debug(f"[SUPER DEBUG] Testo='{current_text_for_processing.lower()}' | Hotwords={hot_words} | 'arturo' in Testo?={'arturo' in current_text_for_processing.lower()} | Risultato Finale={hotword_found}")
-
-                if mixer.music.get_busy() and hotword_found:
-                    logging.debug("[DEBUG] Interruzione TTS richiesta dall'utente.")
-                    mixer.music.stop()
-
-                if hotword_found or expecting_user_response:
-                    logging.debug("[DEBUG] Condizione per chiamare l'AI soddisfatta. Invio...")
-
-                    if recorder.is_recording:
-                        logging.debug("[DEBUG] Metto in pausa il registratore per il TTS dell'AI...")
-                        recorder.stop()
-
-                    with console.status(Spinner("dots", text=" Arturo sta pensando...")):
-                        # Usa current_text_for_processing per la chiamata all'AI
-                        response = assist.ask_question_memory(current_text_for_processing + " " + time.strftime("%D:%H:%M:%S"))
-
-                    console.print(f"[b style='dark_orange']Arturo:[/b style='dark_orange'] [dark_orange]{response}[/dark_orange]")
-
-                    expecting_user_response = response.strip().endswith('?')
-
-                    if not tools.is_silent_mode():
-                        # print("[DEBUG] Avvio TTS per la risposta di Arturo...") # TODO: Re-enable TTS
-                        # assist.TTS(response) # TODO: Re-enable TTS
-                        # print("[DEBUG] TTS di Arturo completato.")
-                        last_tts_end_time = time.time()
-
-                        lunghezza_risposta = len(response)
-                        pausa_stimata = min(max(0.5, lunghezza_risposta * 0.065), 10.0)
-                        logging.debug(f"[DEBUG] Pausa calcolata dopo TTS: {pausa_stimata:.2f}s (basata su {lunghezza_risposta} caratteri)")
-                        time.sleep(pausa_stimata)
-
-                    if not recorder.is_recording and not tools.is_silent_mode():
-                        logging.debug("[DEBUG] Riattivo il registratore...")
-                        recorder.start()
-                        console.print("Ti ascolto...")
-
-                    # Non svuotare current_text_for_processing qui, è una variabile locale al blocco if
-                    continue # Passa al prossimo ciclo dopo aver elaborato l'input
-
-                else:
-                    logging.debug("[DEBUG] Hotword non trovata e nessuna risposta attesa. Ignoro.")
-                    pass # Input ignorato, continua il loop
-
-            # --- Fine Blocco Logica di Elaborazione Testo ---
-
-
-            # Questo controllo di sicurezza ora non dipende da 'current_text'
-            if not text_from_stt and not mixer.music.get_busy() and not recorder.is_recording and not tools.is_silent_mode():
-                logging.debug("[DEBUG] Controllo di sicurezza: riattivo il registratore.")
+            # Modalità Vocale: il registratore resta acceso anche mentre Arturo pensa o parla
+            if not recorder.is_recording:
+                # print("[DEBUG] Modalità vocale: avvio il registratore.")
                 recorder.start()
-                console.print("Ti ascolto...")
-
-
-
+                console.print("Ti ascolto...") 
+
+            # Attende la prossima trascrizione senza pause fisse: arriva appena listen_thread la mette in coda.
+            # Il timeout serve solo a rileggere la modalità e a lasciar passare Ctrl+C, non ritarda le trascrizioni.
+            try:
+                text_from_stt, speech_end = shared_variables.transcripts.get(timeout=TRANSCRIPT_WAIT_SECONDS)
+            except queue.Empty:
+                continue
+
+            console.print(f"[b style='dark_cyan']Utente:[/b style='dark_cyan'] [dark_cyan]{text_from_stt}[/dark_cyan]") # Stampa l'input dell'utente una volta qui
+
+            hotword_found = hotword_matcher.match(text_from_stt) is not None
+
+            # Mentre Arturo parla il microfono sente anche la sua voce: conta solo chi lo chiama per nome
+            if pipeline.speaking() and not hotword_found:
+                logging.debug("[DEBUG] Testo ignorato durante la risposta vocale (probabile eco).")
+                continue
+            # Eco: frase terminata subito dopo la fine della risposta vocale di Arturo
+            if _loaded(_tts_future) is not None and pipeline.last_reply_end is not None and 0 <= speech_end - pipeline.last_reply_end < ECHO_WINDOW_SECONDS:
+                logging.debug("[DEBUG] Testo ignorato (probabile eco).")
+                continue
+
+            if pipeline.speaking() and hotword_found:
+                logging.debug("[DEBUG] Interruzione TTS richiesta dall'utente.")
+                speaker.stop()
+
+            expecting_user_response = not pipeline.busy() and pipeline.last_answer.strip().endswith('?')
+            if not (hotword_found or expecting_user_response):
+                logging.debug("[DEBUG] Hotword non trovata e nessuna risposta attesa. Ignoro.")
+                continue
+
+            if pipeline.busy():
+                console.print("[yellow]Interrompo la risposta in corso.[/yellow]")
+            logging.debug("[DEBUG] Condizione per chiamare l'AI soddisfatta. Invio...")
+            pipeline.submit(text_from_stt + " " + time.strftime("%D:%H:%M:%S"), speech_end=speech_end)
 
     except KeyboardInterrupt:
         console.print("\nArturo interrotto dall'utente.") 
-        if mixer.music.get_busy():
-            mixer.music.stop()
-        if recorder.is_recording:
+        pipeline.barge_in()
+        stop_audio()
+        if recorder is not None and recorder.is_recording:
             recorder.stop()
     finally:
+        if latency_stats.get_latency_stats().report():
+            latency_stats.get_latency_stats().print_report()
+        gcode_cache.get_default_cache().flush()   # statistiche e accessi dei lookup non ancora salvati
         console.print("Uscita da Arturo.") 
-        if recorder.is_recording: 
+        if recorder is not None and recorder.is_recording: 
             recorder.stop()
+        _startup_pool.shutdown(wait=False)
@@ -0,0 +1,114 @@
+# benchmarks/bench_chat_session.py
+"""
+Benchmark del costo lato Python di un turno di conversazione.
+
+Uso:
+    python benchmarks/bench_chat_session.py [turni]
+
+Confronta la ricostruzione completa della storia a ogni turno (il vecchio
+ask_question_memory: conversione di tutta la conversation_history, dump JSON
+indentato e nuovo start_chat) con chat_session.ChatSession, che aggiunge solo
+i messaggi nuovi. Gemini è sostituito da un modello finto senza rete; ogni
+turno contiene una domanda, una chiamata a un tool con un risultato di 2000
+caratteri e la risposta finale. Il tempo medio per turno è riportato a
+intervalli crescenti di lunghezza della conversazione, con logging a livello
+INFO e DEBUG; la sessione persistente include la stima dei token e la
+compattazione (con riassunto estrattivo) quando si supera il budget.
+"""
+import os
+import sys
+import json
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import google.generativeai as genai
+from google.generativeai.types import content_types
+from chat_session import ChatSession
+
+TOOL_RESULT = "file_" * 400
+REPLY = genai.protos.Content(role="model", parts=[genai.protos.Part(text="risposta")])
+CHECKPOINTS = (10, 50, 100, 250, 500)
+
+
+class FakeChat:
+    """Stands in for the SDK ChatSession: keeps the history as Content objects, no network."""
+
+    def __init__(self, history):
+        self.history = list(history)
+
+    def send_message(self, content, stream=False):
+        content = content_types.to_content(content)
+        if not content.role:
+            content.role = "user"
+        self.history.append(content)
+        self.history.append(REPLY)
+        return REPLY
+
+
+class FakeModel:
+    def start_chat(self, history, enable_automatic_function_calling=False):
+        return FakeChat(history)
+
+
+def legacy_turn(model, conversation_history, question):
+    # Percorso precedente: storia ricostruita e chat riaperta a ogni domanda
+    conversation_history.append({"role": "user", "content": question})
+    gemini_history = []
+    for msg in conversation_history:
+        role = msg["role"]
+        if role == "system":
+            continue
+        parts = []
+        if "content" in msg and msg["content"] is not None:
+            parts.append({"text": msg["content"]})
+        if parts:
+            gemini_history.append({"role": "model" if role == "assistant" else role, "parts": parts})
+    logging.debug(f"Storia conversazione inviata a Gemini (adattata): {json.dumps(gemini_history, indent=2, ensure_ascii=False)}")
+    chat = model.start_chat(history=gemini_history, enable_automatic_function_calling=False)
+    chat.send_message(question)
+    conversation_history.append({"role": "assistant", "parts": [{"function_call": {"name": "octoprint_list_files", "args": {}}}]})
+    conversation_history.append({"role": "tool", "parts": [{"function_response": {"name": "octoprint_list_files", "response": {"content": TOOL_RESULT}}}]})
+    chat.send_message(TOOL_RESULT)
+    conversation_history.append({"role": "assistant", "content": "Ecco i file, Glitch."})
+
+
+def session_turn(session, question):
+    session.send_user_message(question)
+    session.record_function_call("octoprint_list_files", {})
+    session.send_function_response("octoprint_list_files", TOOL_RESULT)
+    session.record_answer("Ecco i file, Glitch.")
+
+
+def run(label, turn, turns):
+    results = []
+    done, start = 0, time.perf_counter()
+    for checkpoint in CHECKPOINTS:
+        if checkpoint > turns:
+            break
+        t0 = time.perf_counter()
+        for i in range(done, checkpoint):
+            turn(f"domanda numero {i}")
+        results.append((checkpoint, (time.perf_counter() - t0) / (checkpoint - done)))
+        done = checkpoint
+    total = time.perf_counter() - start
+    print(f"{label} (totale {total:.2f}s):")
+    for checkpoint, per_turn in results:
+        print(f"  fino al turno {checkpoint:4d}: {per_turn * 1000:8.3f} ms/turno")
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    logging.basicConfig(handlers=[logging.NullHandler()])
+    for level in (logging.INFO, logging.DEBUG):
+        logging.getLogger().setLevel(level)
+        print(f"--- logging {logging.getLevelName(level)} ---")
+        model = FakeModel()
+        history = [{"role": "system", "content": "prompt di sistema"}]
+        run("Storia ricostruita a ogni turno", lambda q: legacy_turn(model, history, q), turns)
+        session = ChatSession(FakeModel(), [{"role": "system", "content": "prompt di sistema"}])
+        run("Sessione persistente", lambda q: session_turn(session, q), turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/bench_gcode_analyzer.py
+"""
+Benchmark di gcode_analyzer su un G-code sintetico in stile PrusaSlicer.
+
+Uso:
+    python benchmarks/bench_gcode_analyzer.py [dimensione_MB] [percorso_gcode]
+
+Se il percorso non esiste viene generato un file della dimensione richiesta
+(default 500 MB) nella cartella temporanea.
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gcode_analyzer
+
+
+def generate_gcode(path, size_mb):
+    """Writes a synthetic sliced file: layers of short extrusions with retract/travel."""
+    target = size_mb * 1024 * 1024
+    header = "; generated by PrusaSlicer (synthetic)\nG90\nM83\nG28\nG1 Z0.2 F720\n"
+    with open(path, "w") as f:
+        f.write(header)
+        written = len(header)
+        layer = 0
+        while written < target:
+            layer += 1
+            z = 0.2 * layer
+            lines = [f";LAYER_CHANGE\n;Z:{z:.1f}\n;HEIGHT:0.2\nG1 Z{z:.3f} F720\n"]
+            for i in range(2000):
+                x = 50 + (i % 100) * 1.234
+                y = 50 + (i // 100) * 2.345
+                lines.append(f"G1 X{x:.3f} Y{y:.3f} E{0.04123 + (i % 7) * 0.001:.5f} F{1800 + (i % 5) * 300}\n")
+                if i % 50 == 49:
+                    lines.append("G1 E-.8 F2100\n")
+                    lines.append(f"G1 X{y:.3f} Y{x:.3f} F9000\n")
+                    lines.append("G1 E.8 F2100\n")
+            chunk = "".join(lines)
+            f.write(chunk)
+            written += len(chunk)
+        f.write("; filament_diameter = 1.75\n; filament_density = 1.24\n")
+        f.write("; estimated printing time (normal mode) = 9h 12m 5s\n")
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(tempfile.gettempdir(), f"bench_{size_mb}mb.gcode")
+    if not os.path.exists(path):
+        print(f"Genero {path} ({size_mb} MB)...")
+        generate_gcode(path, size_mb)
+
+    t0 = time.perf_counter()
+    stats = gcode_analyzer.analyze(path)
+    elapsed = time.perf_counter() - t0
+    actual_mb = os.path.getsize(path) / (1024 * 1024)
+    print(f"{actual_mb:.0f} MB, {stats['moves']} movimenti, {stats['layer_count']} layer")
+    print(f"Tempo: {elapsed:.2f}s ({actual_mb / elapsed:.0f} MB/s, {stats['moves'] / elapsed / 1e6:.1f} M movimenti/s)")
+    print(f"Filamento: {stats['filament_length_mm']:.0f} mm, {stats['filament_mass_g']:.1f} g; travel {stats['travel_distance_mm']:.0f} mm")
+
+
+if __name__ == "__main__":
+    main()
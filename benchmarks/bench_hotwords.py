@@ -0,0 +1,131 @@
+# benchmarks/bench_hotwords.py
+"""
+Benchmark e precision/recall del riconoscimento delle hotword.
+
+Uso:
+    python benchmarks/bench_hotwords.py [corpus.tsv] [ripetizioni]
+
+Senza argomenti usa il corpus qui sotto: trascrizioni con la hotword
+scritta correttamente, storpiata dal riconoscimento (accenti, doppie,
+lettere sbagliate) e frasi senza hotword, anche con parole simili. Un corpus
+proprio è un file con una trascrizione per riga nel formato
+``1<TAB>testo`` (hotword presente) o ``0<TAB>testo``. Confronta la vecchia
+ricerca di sottostringhe con HotwordMatcher in sola regex, con la
+normalizzazione fonetica e con la distanza di modifica, riportando
+precision, recall e tempo medio per frase.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hotwords
+from rich.table import Table
+from rich import print as rprint
+
+CORPUS = [
+    (1, "Arturo, elenca i file."),
+    (1, "arturo stampa il cubo"),
+    (1, "Artur, qual è lo stato della stampante?"),
+    (1, "Arturò, fai lo slicing di benchy.stl"),
+    (1, "Arturro carica il gcode su octoprint"),
+    (1, "Arthuro avvia la stampa"),
+    (1, "artuto mi dici la temperatura dell'ugello"),
+    (1, "ehi arturio quanto manca alla fine"),
+    (1, "Artù elenca i profili di slicing"),
+    (1, "Ciao Arturo come va"),
+    (1, "allora Arturo, metti il riempimento al venti per cento"),
+    (1, "vez, ferma la stampa"),
+    (1, "arturo"),
+    (1, "Arturo."),
+    (1, "ok artura orienta il modello"),
+    (1, "sei proprio un coglione"),
+    (1, "miserabile, ferma tutto"),
+    (0, "elenca i file"),
+    (0, "sono avvezzo a stampare in PETG"),
+    (0, "quell'altura si vede dal laboratorio"),
+    (0, "è un'opera d'arte"),
+    (0, "l'autore del modello è su Printables"),
+    (0, "la stampante è pronta"),
+    (0, "mettiamo i supporti sotto lo sbalzo"),
+    (0, "aumenta la temperatura del piatto a sessanta gradi"),
+    (0, "la struttura è troppo sottile"),
+    (0, "avvertimi quando finisce"),
+    (0, "Toscanini era un direttore d'orchestra"),
+    (0, "grazie mille"),
+    (0, "ho cambiato l'ugello ieri"),
+    (0, "apri la cartella dei modelli"),
+    (0, "la vezzosa signora"),
+    # Quasi uguali alle hotword a più parole o agli insulti: devono restare negative
+    (0, "lo scostamento è misurabile con il calibro"),
+    (0, "i bordi sono misurabili al decimo"),
+    (0, "chiudi la porta di vetro della stampante"),
+    (0, "la testa di stampa è sporca"),
+    (0, "porto dieci pezzi in laboratorio"),
+]
+
+
+def legacy_match(text, words=hotwords.DEFAULT_HOTWORDS):
+    """The previous check in ai-slicer.py: a substring search per hotword."""
+    return any(word in text.lower() for word in words)
+
+
+def load_corpus(path):
+    corpus = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                label, text = line.rstrip("\n").split("\t", 1)
+                corpus.append((int(label), text))
+    return corpus
+
+
+def evaluate(predict, corpus, repeat):
+    """Returns (precision, recall, microseconds per utterance, misclassified utterances)."""
+    tp = fp = fn = 0
+    wrong = []
+    for label, text in corpus:
+        found = bool(predict(text))
+        tp += bool(label) and found
+        fp += not label and found
+        fn += bool(label) and not found
+        if found != bool(label):
+            wrong.append(text)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for _, text in corpus:
+            predict(text)
+    elapsed = (time.perf_counter() - t0) / (repeat * len(corpus))
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return precision, recall, elapsed * 1e6, wrong
+
+
+def main():
+    corpus = load_corpus(sys.argv[1]) if len(sys.argv) > 1 else CORPUS
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    variants = [
+        ("Sottostringhe (precedente)", legacy_match),
+        ("Regex", hotwords.HotwordMatcher(max_distance=0, phonetic=False).match),
+        ("Regex + fonetica", hotwords.HotwordMatcher(max_distance=0).match),
+        ("Regex + fonetica + distanza 1", hotwords.HotwordMatcher(max_distance=1).match),
+    ]
+
+    table = Table(title=f"Hotword ({len(corpus)} frasi)", style="cyan", title_style="bold magenta")
+    table.add_column("Metodo", style="green")
+    table.add_column("Precision", justify="right")
+    table.add_column("Recall", justify="right")
+    table.add_column("µs/frase", justify="right")
+    errors = {}
+    for label, predict in variants:
+        precision, recall, micros, wrong = evaluate(predict, corpus, repeat)
+        table.add_row(label, f"{precision:.1%}", f"{recall:.1%}", f"{micros:.1f}")
+        errors[label] = wrong
+    rprint(table)
+    for label, wrong in errors.items():
+        if wrong:
+            print(f"{label}: sbagliate {wrong}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# benchmarks/bench_mesh_analysis.py
+"""
+Benchmark di mesh_analysis su una sfera tassellata salvata come STL binario.
+
+Uso:
+    python benchmarks/bench_mesh_analysis.py [milioni_di_triangoli] [percorso_stl]
+
+Se il percorso non esiste viene generata una sfera chiusa con circa il numero
+di triangoli richiesto (default 5 milioni) nella cartella temporanea.
+"""
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mesh_analysis
+
+
+def sphere_triangles(target_triangles, radius=40.0):
+    """Closed UV sphere: quads between rings split in two, single triangles at the poles."""
+    rings = max(4, int(np.sqrt(target_triangles / 4)))
+    segments = 2 * rings
+    theta = np.linspace(0.0, np.pi, rings + 1)
+    phi = np.linspace(0.0, 2 * np.pi, segments + 1)
+    t, p = np.meshgrid(theta, phi, indexing="ij")
+    points = np.stack([np.sin(t) * np.cos(p), np.sin(t) * np.sin(p), np.cos(t)], axis=-1) * radius
+    points[..., 2] += radius
+    points[:, -1] = points[:, 0]  # chiude la cucitura con gli stessi vertici
+    points[0, :] = points[0, 0]
+    points[-1, :] = points[-1, 0]
+    a, b, c, d = points[:-1, :-1], points[1:, :-1], points[1:, 1:], points[:-1, 1:]
+    lower = np.stack([a, b, c], axis=2)[:-1].reshape(-1, 3, 3)  # al polo sud b == c
+    upper = np.stack([a, c, d], axis=2)[1:].reshape(-1, 3, 3)   # al polo nord a == d
+    return np.concatenate([lower, upper]).astype(np.float32)
+
+
+def write_binary_stl(path, triangles):
+    records = np.zeros(len(triangles), dtype=[("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attributes", "<u2")])
+    records["vertices"] = triangles
+    with open(path, "wb") as f:
+        f.write(b"binary STL (synthetic)".ljust(80, b" "))
+        f.write(np.uint32(len(triangles)).tobytes())
+        f.write(records.tobytes())
+
+
+def main():
+    millions = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(tempfile.gettempdir(), f"bench_sphere_{millions:g}M.stl")
+    if not os.path.exists(path):
+        print(f"Genero {path} (~{millions:g} M triangoli)...")
+        write_binary_stl(path, sphere_triangles(int(millions * 1e6)))
+
+    t0 = time.perf_counter()
+    report = mesh_analysis.analyze(path)
+    elapsed = time.perf_counter() - t0
+    print(f"{report['triangles']} triangoli: caricamento {report['load_seconds']:.2f}s, totale {elapsed:.2f}s "
+          f"({report['triangles'] / elapsed / 1e6:.1f} M triangoli/s)")
+    print(f"Volume {report['volume_cm3']:.1f} cm³, sbalzi {report['overhang_area_mm2']:.0f} mm², "
+          f"chiusa: {report['is_watertight']}, pareti sottili: {report['thin_walls']['samples']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/bench_model_library.py
+"""
+Benchmark di model_library su una cartella sintetica di piccoli STL annidati.
+
+Uso:
+    python benchmarks/bench_model_library.py [numero_di_file]
+
+Default: 10000 file in 100 sottocartelle. Misura la prima scansione, la
+riscansione senza modifiche, il calcolo di hash e statistiche, le ricerche
+per id, per nome e fuzzy.
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import model_library
+from bench_mesh_analysis import sphere_triangles, write_binary_stl
+
+WORDS = ["supporto", "cuffie", "vaso", "benchy", "staffa", "ingranaggio", "coperchio", "scatola",
+         "gancio", "porta", "cavo", "ruota", "adattatore", "clip", "base", "torre"]
+
+
+def timed(label, fn, repeat=1):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - t0) / repeat
+    print(f"{label}: {elapsed * 1000:.2f} ms")
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rng = random.Random(0)
+    triangles = sphere_triangles(200)
+
+    with tempfile.TemporaryDirectory() as root:
+        names = []
+        for i in range(count):
+            folder = os.path.join(root, f"cartella_{i % 100:03d}")
+            os.makedirs(folder, exist_ok=True)
+            name = "_".join(rng.sample(WORDS, 3)) + f"_{i}.stl"
+            write_binary_stl(os.path.join(folder, name), triangles)
+            names.append(name)
+
+        library = model_library.ModelLibrary(root, os.path.join(root, ".model_library.db"))
+        counts = timed(f"Prima scansione ({count} file)", library.scan)
+        print(f"  {counts}")
+        timed("Riscansione senza modifiche", library.scan)
+        timed("Hash e statistiche", library.enrich)
+
+        timed("Ricerca per id (media)", lambda: library.get(rng.randint(1, count)), repeat=1000)
+        timed("Ricerca per nome (media)", lambda: library.find_by_name(rng.choice(names)), repeat=1000)
+        matches = timed("Ricerca fuzzy (media)", lambda: library.search("suporto cufie"), repeat=100)
+        print(f"  Migliore: {matches[0]['relative_path']} ({matches[0]['score']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# benchmarks/bench_orientation_optimizer.py
+"""
+Benchmark di orientation_optimizer su una sfera tassellata.
+
+Uso:
+    python benchmarks/bench_orientation_optimizer.py [milioni_di_triangoli] [candidati]
+
+Default: 1 milione di triangoli, 1000 orientamenti candidati.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import orientation_optimizer
+from bench_mesh_analysis import sphere_triangles
+
+
+def main():
+    millions = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    candidates = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    triangles = sphere_triangles(int(millions * 1e6))
+
+    t0 = time.perf_counter()
+    result = orientation_optimizer.optimize(triangles, candidates=candidates)
+    elapsed = time.perf_counter() - t0
+    print(f"{result['triangles']} triangoli, {result['candidates']} orientamenti in {elapsed:.2f}s "
+          f"({result['candidates'] / elapsed:.0f} orientamenti/s)")
+    print(f"Migliore: {result['best']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# benchmarks/bench_print_time_estimator.py
+"""
+Benchmark di print_time_estimator su un G-code sintetico in stile PrusaSlicer.
+
+Uso:
+    python benchmarks/bench_print_time_estimator.py [dimensione_MB] [percorso_gcode]
+
+Riporta separatamente il tempo totale (lettura + stima) e quello del solo
+modello cinematico sui movimenti già letti.
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gcode_analyzer
+import print_time_estimator
+from bench_gcode_analyzer import generate_gcode
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(tempfile.gettempdir(), f"bench_{size_mb}mb.gcode")
+    if not os.path.exists(path):
+        print(f"Genero {path} ({size_mb} MB)...")
+        generate_gcode(path, size_mb)
+
+    t0 = time.perf_counter()
+    result = print_time_estimator.estimate(path)
+    elapsed = time.perf_counter() - t0
+    print(f"{result['moves']} movimenti, stima {result['estimated_time']} (slicer: {result['slicer_estimated_time']})")
+    print(f"Totale: {elapsed:.2f}s ({result['moves'] / elapsed / 1e6:.1f} M movimenti/s)")
+
+    blocks = list(gcode_analyzer.iter_moves(path))
+    estimator = print_time_estimator.PrintTimeEstimator()
+    t0 = time.perf_counter()
+    for i, block in enumerate(blocks):
+        estimator.add(block, last=i == len(blocks) - 1)
+    elapsed = time.perf_counter() - t0
+    print(f"Solo modello cinematico: {elapsed:.2f}s ({estimator.moves / elapsed / 1e6:.1f} M movimenti/s)")
+
+
+if __name__ == "__main__":
+    main()
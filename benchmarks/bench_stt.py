@@ -0,0 +1,176 @@
+# benchmarks/bench_stt.py
+"""
+Benchmark del riconoscimento vocale (faster-whisper) su file WAV registrati.
+
+Uso:
+    python benchmarks/bench_stt.py <cartella_wav> [--configs dispositivo:calcolo:modello,...] [--runs N]
+
+Ogni ``nome.wav`` nella cartella può avere accanto ``nome.txt`` con la
+trascrizione di riferimento. Per ogni configurazione (default:
+``cpu:int8:small,cpu:int8:base,cuda:float16:large-v3-turbo``; "auto" è
+accettato in ogni campo e risolto come in ``stt_config.resolve``) misura il
+caricamento del modello, la latenza per file (media, p50, p95), il fattore
+di tempo reale (tempo di elaborazione / durata dell'audio, sotto 1 è più
+veloce del parlato), il word error rate e la quota di termini del lessico
+della stampa 3D (PLA, ugello, supporti...) presenti nei riferimenti ma
+mancanti nelle trascrizioni. Le configurazioni che non si possono caricare
+su questa macchina (es. CUDA senza GPU) vengono segnalate e saltate.
+"""
+import os
+import re
+import sys
+import time
+import wave
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import stt_config
+from rich.table import Table
+from rich import print as rprint
+
+DEFAULT_CONFIGS = "cpu:int8:small,cpu:int8:base,cuda:float16:large-v3-turbo"
+
+# Termini del dominio che il riconoscimento sbaglia più spesso (confrontati dopo la normalizzazione)
+VOCABULARY = ["pla", "petg", "abs", "tpu", "ugello", "piatto", "estrusore", "filamento", "supporti",
+              "riempimento", "layer", "brim", "gcode", "octoprint", "prusaslicer", "stl", "slicing",
+              "arturo", "millimetri", "temperatura"]
+
+
+def normalize(text):
+    """Lowercase words without punctuation; "G-code" and "gcode" compare equal."""
+    text = text.lower().replace("-", "")
+    return re.findall(r"\w+", text)
+
+
+def word_errors(reference, hypothesis):
+    """Word-level Levenshtein distance (substitutions + insertions + deletions)."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+
+def vocabulary_misses(reference, hypothesis):
+    """(domain terms in the reference, how many of them are missing from the hypothesis)."""
+    expected = [word for word in reference if word in VOCABULARY]
+    found = set(hypothesis)
+    return len(expected), sum(1 for word in expected if word not in found)
+
+
+def wav_duration(path):
+    with wave.open(path, "rb") as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def load_samples(folder):
+    samples = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(".wav"):
+            continue
+        path = os.path.join(folder, name)
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as f:
+                reference = f.read().strip()
+        samples.append({"name": name, "path": path, "duration": wav_duration(path), "reference": reference})
+    return samples
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def bench_config(spec, samples, runs):
+    from faster_whisper import WhisperModel
+
+    device, compute_type, model = (spec.split(":") + ["auto", "auto", "auto"])[:3]
+    config = stt_config.resolve(model=model, device=device, compute_type=compute_type)
+    result = {"spec": spec, "config": config.describe()}
+    if device.lower() == "cuda" and config.device != "cuda":
+        result["error"] = "nessuna GPU CUDA"   # resolve() ripiegherebbe sulla CPU, duplicando un'altra riga
+        return result
+    t0 = time.perf_counter()
+    try:
+        whisper = WhisperModel(config.model, device=config.device, compute_type=config.compute_type)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+    result["load_s"] = time.perf_counter() - t0
+
+    latencies, audio_seconds, processing_seconds = [], 0.0, 0.0
+    errors = words = terms = missed = 0
+    for sample in samples:
+        for run in range(runs):
+            t0 = time.perf_counter()
+            segments, _ = whisper.transcribe(sample["path"], language=config.language, beam_size=5)
+            text = " ".join(segment.text for segment in segments)   # i segmenti sono generati in modo pigro
+            elapsed = time.perf_counter() - t0
+            latencies.append(elapsed)
+            audio_seconds += sample["duration"]
+            processing_seconds += elapsed
+        # Qualità misurata sull'ultima trascrizione: con beam search è deterministica
+        if sample["reference"]:
+            reference, hypothesis = normalize(sample["reference"]), normalize(text)
+            errors += word_errors(reference, hypothesis)
+            words += len(reference)
+            expected, misses = vocabulary_misses(reference, hypothesis)
+            terms += expected
+            missed += misses
+        print(f"  [{spec}] {sample['name']}: {elapsed * 1000:.0f} ms -> {text.strip()}")
+
+    result.update({
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "rtf": processing_seconds / audio_seconds if audio_seconds else None,
+        "wer": errors / words if words else None,
+        "vocab_error": missed / terms if terms else None,
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark STT su file WAV")
+    parser.add_argument("folder", help="Cartella con i file .wav (e le trascrizioni .txt)")
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS, help="dispositivo:calcolo:modello separati da virgola")
+    parser.add_argument("--runs", type=int, default=3, help="Trascrizioni per file (la prima include il riscaldamento)")
+    args = parser.parse_args()
+
+    samples = load_samples(args.folder)
+    if not samples:
+        sys.exit(f"Nessun file .wav in {args.folder}")
+    total = sum(sample["duration"] for sample in samples)
+    print(f"{len(samples)} file, {total:.1f} s di audio, {sum(1 for s in samples if s['reference'])} con riferimento")
+
+    results = [bench_config(spec.strip(), samples, args.runs) for spec in args.configs.split(",") if spec.strip()]
+
+    def fmt(value, pattern):
+        return pattern.format(value) if value is not None else "-"
+
+    table = Table(title="Benchmark STT", style="cyan", title_style="bold magenta")
+    table.add_column("Configurazione", style="green")
+    table.add_column("Caricamento s", justify="right")
+    table.add_column("Media ms", justify="right")
+    table.add_column("p50 ms", justify="right")
+    table.add_column("p95 ms", justify="right")
+    table.add_column("RTF", justify="right")
+    table.add_column("WER", justify="right")
+    table.add_column("Errori lessico", justify="right")
+    for result in results:
+        if "error" in result:
+            table.add_row(result["config"], f"non disponibile: {result['error']}", "", "", "", "", "", "")
+            continue
+        table.add_row(result["config"], f"{result['load_s']:.1f}", f"{result['mean_ms']:.0f}",
+                      f"{result['p50_ms']:.0f}", f"{result['p95_ms']:.0f}", fmt(result["rtf"], "{:.2f}"),
+                      fmt(result["wer"], "{:.1%}"), fmt(result["vocab_error"], "{:.1%}"))
+    rprint(table)
+
+
+if __name__ == "__main__":
+    main()
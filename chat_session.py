@@ -0,0 +1,360 @@
+# chat_session.py
+"""
+Sessione di chat persistente con Gemini.
+
+Una sola ChatSession dell'SDK resta aperta per tutta la conversazione: ogni
+turno aggiunge solo i messaggi nuovi (domanda, chiamate ai tool, risposte
+dei tool, risposta finale) invece di ricostruire la storia completa e
+riaprire la chat a ogni domanda. Il costo lato Python di un turno resta
+quindi costante anche dopo centinaia di turni.
+
+Accanto alla chat dell'SDK viene tenuto un log locale leggero
+(``conversation_history`` in assist.py) usato per debug e statistiche.
+La serializzazione JSON per il log DEBUG avviene solo se il livello DEBUG
+è effettivamente attivo, e riguarda solo il messaggio nuovo.
+
+Prima di ogni domanda la storia viene compattata se supera un budget di
+token (stimati in locale, circa 4 caratteri per token, senza chiamate di
+rete): prima vengono troncati gli output dei tool dei turni vecchi (liste
+di file, pagine web), poi, se non basta, i turni più vecchi vengono
+riassunti in un unico messaggio. Gli ultimi turni restano sempre intatti.
+"""
+import os
+import json
+import logging
+
+import google.generativeai as genai
+
+DEFAULT_TOKEN_BUDGET = 32000    # token stimati oltre i quali la storia viene compattata
+CHARS_PER_TOKEN = 4
+KEEP_RECENT_TURNS = 4           # turni recenti mai troncati né riassunti
+TOOL_OUTPUT_MAX_CHARS = 600     # lunghezza massima degli output dei tool nei turni vecchi
+COMPACTION_TARGET = 0.6         # una volta superato il budget si compatta fino a questa frazione,
+                                # così riassunti (che costano una chiamata al modello) restano rari
+SUMMARY_MAX_CHARS = 4000
+SUMMARY_PREFIX = "[Riassunto della conversazione precedente]"
+SUMMARY_ACK = "Ok, ne terrò conto."
+
+
+def estimate_tokens(text):
+    """Rough token estimate (about 4 characters per token for Italian/English text)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_text(text, max_chars=TOOL_OUTPUT_MAX_CHARS):
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [troncato, {len(text)} caratteri in origine]"
+
+
+def _content_text(content, response_chars=None):
+    # Testo di un Content dell'SDK: testo, chiamate ai tool e risposte dei tool
+    pieces = []
+    for part in content.parts:
+        if "function_call" in part:
+            args = dict(part.function_call.args) if part.function_call.args else {}
+            pieces.append(f"{part.function_call.name}({json.dumps(args, ensure_ascii=False, default=str)})")
+        elif "function_response" in part:
+            response = part.function_response.response
+            value = response.get("content") if response and "content" in response else response
+            text = value if isinstance(value, str) else json.dumps(dict(value) if value else {}, ensure_ascii=False, default=str)
+            pieces.append(text if response_chars is None else truncate_text(text, response_chars))
+        elif part.text:
+            pieces.append(part.text)
+    return "\n".join(pieces)
+
+
+def _is_turn_start(content):
+    # Un turno inizia con un messaggio dell'utente che contiene testo (non una risposta di un tool)
+    return content.role == "user" and any(part.text for part in content.parts)
+
+
+def _split_turns(items, is_start):
+    # Divide una storia in testa (prima del primo turno) e turni
+    head, turns = [], []
+    for item in items:
+        if is_start(item):
+            turns.append([item])
+        elif turns:
+            turns[-1].append(item)
+        else:
+            head.append(item)
+    return head, turns
+
+
+def extractive_summary(turns_text, max_chars=SUMMARY_MAX_CHARS):
+    """Fallback summary: the old turns themselves, each line shortened, newest kept if too long."""
+    lines = [truncate_text(line.strip(), 200) for line in turns_text.splitlines() if line.strip()]
+    summary = "\n".join(lines)
+    return summary if len(summary) <= max_chars else "..." + summary[-max_chars:]
+
+
+class ChatSession:
+    """
+    Long-lived Gemini chat that is extended one message at a time.
+
+    Args:
+        model: A genai.GenerativeModel (or any object with a compatible ``start_chat``).
+        history (list, optional): Local conversation log to append to; a new list if omitted.
+        token_budget (int, optional): Estimated tokens above which the history is compacted.
+        keep_recent_turns (int, optional): Latest turns that are never truncated or summarized.
+        tool_output_max_chars (int, optional): Length old tool outputs are truncated to.
+        summarizer (callable, optional): ``summarizer(text) -> str`` used to summarize old
+            turns; an extractive summary is used if omitted or if it fails.
+    """
+
+    def __init__(self, model, history=None, token_budget=DEFAULT_TOKEN_BUDGET, keep_recent_turns=KEEP_RECENT_TURNS,
+                 tool_output_max_chars=TOOL_OUTPUT_MAX_CHARS, summarizer=None):
+        self.model = model
+        self.history = history if history is not None else []
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.tool_output_max_chars = tool_output_max_chars
+        self.summarizer = summarizer
+        self.tokens_saved_total = 0
+        self.last_compaction = None
+        self._chat = None
+        self._token_cache = {}   # id(content) -> (content, token), il riferimento evita il riuso degli id
+        self._counted = 0        # messaggi della storia già sommati in _total
+        self._total = 0
+        self._turn_start = None  # (storia dell'SDK, sua lunghezza, lunghezza del log) all'inizio del turno in corso
+
+    @classmethod
+    def from_env(cls, model, history=None, summarizer=None):
+        """Builds a session configured from CHAT_TOKEN_BUDGET, CHAT_KEEP_RECENT_TURNS and CHAT_TOOL_OUTPUT_MAX_CHARS."""
+        return cls(
+            model,
+            history,
+            token_budget=int(os.getenv("CHAT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)),
+            keep_recent_turns=int(os.getenv("CHAT_KEEP_RECENT_TURNS", KEEP_RECENT_TURNS)),
+            tool_output_max_chars=int(os.getenv("CHAT_TOOL_OUTPUT_MAX_CHARS", TOOL_OUTPUT_MAX_CHARS)),
+            summarizer=summarizer,
+        )
+
+    @property
+    def chat(self):
+        # La chat dell'SDK viene aperta una sola volta, al primo messaggio
+        if self._chat is None:
+            self._chat = self.model.start_chat(history=[], enable_automatic_function_calling=False)
+        return self._chat
+
+    def reset(self):
+        """Starts a new conversation, keeping only the system entries of the local log."""
+        self._chat = None
+        self._token_cache = {}
+        self._counted = self._total = 0
+        self.history[:] = [m for m in self.history if m.get("role") == "system"]
+
+    def _record(self, entry):
+        self.history.append(entry)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Nuovo messaggio nella conversazione: {json.dumps(entry, ensure_ascii=False, default=str)}")
+
+    def _tokens(self, content):
+        cached = self._token_cache.get(id(content))
+        if cached is None or cached[0] is not content:
+            cached = (content, estimate_tokens(_content_text(content)))
+            self._token_cache[id(content)] = cached
+        return cached[1]
+
+    def token_count(self):
+        """Estimated tokens of the history that is sent to the model with the next message."""
+        if self._chat is None:
+            return 0
+        # Tra una compattazione e l'altra la storia cresce solo in coda: si contano solo i messaggi nuovi
+        contents = self._chat.history
+        for content in contents[self._counted:]:
+            self._total += self._tokens(content)
+        self._counted = len(contents)
+        return self._total
+
+    def compact(self):
+        """
+        Shrinks the SDK chat history (and the local log) if it exceeds the token budget.
+
+        Returns:
+            dict: tokens before/after, tokens saved, truncated tool outputs and summarized turns.
+        """
+        if self._chat is None:
+            return None
+        before = self.token_count()
+        report = {"tokens_before": before, "tokens_after": before, "tokens_saved": 0,
+                  "truncated_outputs": 0, "summarized_turns": 0}
+        if before <= self.token_budget:
+            self.last_compaction = report
+            return report
+
+        head, turns = _split_turns(list(self._chat.history), _is_turn_start)
+        keep = min(self.keep_recent_turns, len(turns))
+        old_turns, recent_turns = turns[:len(turns) - keep], turns[len(turns) - keep:]
+
+        # 1. Output dei tool dei turni vecchi troncati
+        report["truncated_outputs"] += self._truncate_turns(old_turns)
+        log_keep = keep
+        total = self._sum_tokens(head, turns)
+        target = int(self.token_budget * COMPACTION_TARGET)
+
+        # 2. Turni vecchi (compreso un eventuale riassunto precedente) riassunti in un solo messaggio
+        if total > target and old_turns:
+            summary = self._summarize(head + [c for turn in old_turns for c in turn])
+            head = [
+                genai.protos.Content(role="user", parts=[genai.protos.Part(text=f"{SUMMARY_PREFIX}\n{summary}")]),
+                genai.protos.Content(role="model", parts=[genai.protos.Part(text=SUMMARY_ACK)]),
+            ]
+            report["summarized_turns"] = len(old_turns)
+            self._compact_log(summary, keep)
+            old_turns = []
+            total = self._sum_tokens(head, recent_turns)
+
+        # 3. Ancora oltre l'obiettivo: si troncano anche i turni recenti, tranne l'ultimo
+        if total > target and len(recent_turns) > 1:
+            report["truncated_outputs"] += self._truncate_turns(recent_turns[:-1])
+            log_keep = 1
+
+        if report["truncated_outputs"]:
+            self._truncate_log_outputs(log_keep)
+        self._chat.history = head + [c for turn in old_turns + recent_turns for c in turn]
+        contents = self._chat.history
+        self._token_cache = {id(c): (c, self._tokens(c)) for c in contents}
+        after = sum(self._tokens(c) for c in contents)
+        self._counted, self._total = len(contents), after
+        report.update(tokens_after=after, tokens_saved=before - after)
+        self.tokens_saved_total += report["tokens_saved"]
+        self.last_compaction = report
+        logging.info(f"Conversazione compattata: {before} -> {after} token stimati (-{before - after}), "
+                     f"{report['truncated_outputs']} output troncati, {report['summarized_turns']} turni riassunti") # This will be INFO level
+        return report
+
+    def _sum_tokens(self, head, turns):
+        return sum(self._tokens(c) for c in head) + sum(self._tokens(c) for turn in turns for c in turn)
+
+    def _truncate_turns(self, turns):
+        # Tronca sul posto gli output dei tool dei turni indicati, restituisce quanti messaggi sono cambiati
+        changed = 0
+        for turn in turns:
+            for i, content in enumerate(turn):
+                truncated = self._truncate_responses(content)
+                if truncated is not content:
+                    turn[i] = truncated
+                    changed += 1
+        return changed
+
+    def _truncate_responses(self, content):
+        # Restituisce un nuovo Content con le risposte dei tool troncate, o lo stesso se non serve
+        if not any("function_response" in part for part in content.parts):
+            return content
+        parts, changed = [], False
+        for part in content.parts:
+            if "function_response" in part:
+                text = _content_text(genai.protos.Content(parts=[part]))
+                short = truncate_text(text, self.tool_output_max_chars)
+                if short != text:
+                    part = genai.protos.Part(function_response=genai.protos.FunctionResponse(
+                        name=part.function_response.name, response={"content": short}))
+                    changed = True
+            parts.append(part)
+        return genai.protos.Content(role=content.role, parts=parts) if changed else content
+
+    def _summarize(self, contents):
+        text = "\n".join(f"{'Utente' if c.role == 'user' else 'Arturo' if c.role == 'model' else 'Tool'}: "
+                         f"{_content_text(c, response_chars=300)}" for c in contents)
+        if self.summarizer is not None:
+            try:
+                summary = (self.summarizer(text) or "").strip()
+                if summary:
+                    return summary[:SUMMARY_MAX_CHARS]
+            except Exception as e:
+                logging.warning(f"Riassunto della conversazione non riuscito, uso quello estrattivo: {e}")
+        return extractive_summary(text)
+
+    def _compact_log(self, summary, keep_turns):
+        # Il log locale segue la stessa compattazione: sistema, riassunto, ultimi turni
+        head, turns = _split_turns(self.history, lambda m: m.get("role") == "user")
+        system = [m for m in head if m.get("role") == "system"]
+        kept = [m for turn in (turns[-keep_turns:] if keep_turns else []) for m in turn]
+        self.history[:] = system + [{"role": "summary", "content": summary}] + kept
+
+    def _truncate_log_outputs(self, keep_turns):
+        _, turns = _split_turns(self.history, lambda m: m.get("role") == "user")
+        for turn in turns[:len(turns) - keep_turns]:
+            for message in turn:
+                for part in message.get("parts", []):
+                    response = part.get("function_response", {}).get("response", {})
+                    if isinstance(response.get("content"), str):
+                        response["content"] = truncate_text(response["content"], self.tool_output_max_chars)
+
+    def send_user_message(self, text, stream=False):
+        """
+        Sends a user message, compacting the history first if it exceeds the token budget, and returns the model response.
+
+        Args:
+            text (str): The user message.
+            stream (bool, optional): Return a streaming response to iterate chunk by chunk. Defaults to False.
+        """
+        if self._chat is not None:
+            try:
+                self._chat.history
+            except Exception as e:
+                # Una risposta in streaming interrotta lascia la storia incoerente: si scarta il turno incompleto
+                logging.warning(f"Ultimo scambio con Gemini incompleto, lo scarto: {e}")
+                self.cancel_turn()
+            try:
+                self.compact()
+            except Exception as e:
+                logging.warning(f"Compattazione della conversazione non riuscita: {e}")
+        history = self.chat.history
+        self._turn_start = (history, len(history), len(self.history))
+        self._record({"role": "user", "content": text})
+        return self.chat.send_message(text, stream=stream)
+
+    def cancel_turn(self):
+        """
+        Drops the current turn (the user message, any partial answer and the tool calls with their
+        results) from the SDK history and the local log, after the user interrupted it. A turn cut
+        in the middle could leave a function call without its response, which Gemini rejects.
+        """
+        if self._chat is None or self._turn_start is None:
+            return
+        # La lista della storia confermata dall'SDK: cresce solo in coda, e non si legge chat.history perché
+        # con uno stream lasciato a metà solleverebbe un'eccezione (come chat.rewind())
+        history, sdk_start, log_start = self._turn_start
+        self._chat.history = history[:sdk_start]
+        del self.history[log_start:]
+        if self._counted > sdk_start:
+            self._counted = self._total = 0
+        self._turn_start = None
+
+    def record_function_calls(self, calls):
+        """Logs the function calls requested by the model in one message, as (name, args) pairs."""
+        self._record({"role": "assistant", "parts": [{"function_call": {"name": name, "args": args}} for name, args in calls]})
+
+    def record_function_call(self, name, args):
+        """Logs a function call requested by the model (already part of the SDK chat history)."""
+        self.record_function_calls([(name, args)])
+
+    def send_function_responses(self, results, stream=False):
+        """
+        Sends the results of all the function calls of a model message back in a single message.
+
+        Args:
+            results (list): (name, content) pairs, in the order the calls were requested.
+            stream (bool, optional): Return a streaming response. Defaults to False.
+        """
+        self._record({"role": "tool", "parts": [{"function_response": {"name": name, "response": {"content": content}}}
+                                                for name, content in results]})
+        return self.chat.send_message(genai.protos.Content(
+            role="function",
+            parts=[genai.protos.Part(function_response=genai.protos.FunctionResponse(
+                name=name,
+                response={"content": content},
+            )) for name, content in results],
+        ), stream=stream)
+
+    def send_function_response(self, name, content, stream=False):
+        """Sends the result of a single function call back to the model and returns its (optionally streaming) response."""
+        return self.send_function_responses([(name, content)], stream=stream)
+
+    def record_answer(self, text):
+        """Logs the final text answer of a turn, which is then complete and no longer cancellable."""
+        self._record({"role": "assistant", "content": text})
+        self._turn_start = None
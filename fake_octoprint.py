@@ -0,0 +1,345 @@
+# fake_octoprint.py
+"""
+Server OctoPrint simulato per provare in locale la farm e lo scheduler di stampa.
+
+Avvia una o più stampanti finte, ognuna sulla propria porta, che rispondono
+alle API usate dall'assistente (/api/version, /api/printer, /api/job,
+/api/files, compreso il caricamento multipart, /api/login e il WebSocket
+/sockjs/websocket con i messaggi "current" ed "event") e simulano la stampa: il
+tempo è quello stimato scritto nel G-code da PrusaSlicer, accelerato di un
+fattore configurabile.
+
+Uso:
+    python fake_octoprint.py [--printers 3] [--port 5100] [--speed 600] [--write-printers printers.json]
+
+Con --write-printers viene scritto un registro per PRINTERS_FILE che punta
+alle stampanti simulate. Per simulare un guasto:
+    curl -X POST http://127.0.0.1:5100/fake/error   (e /fake/reset per ripristinare)
+"""
+import re
+import json
+import time
+import base64
+import select
+import struct
+import hashlib
+import argparse
+import threading
+from urllib.parse import unquote
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 5100
+DEFAULT_SPEED = 600.0            # 1 ora di stampa simulata dura 6 secondi
+DEFAULT_PRINT_SECONDS = 1800     # se il G-code non contiene una stima
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+ESTIMATE_PATTERN = re.compile(rb"estimated printing time \(normal mode\)\s*=\s*([^\r\n]+)")
+
+
+def _parse_duration(text):
+    seconds = 0
+    for value, unit in re.findall(r"(\d+)\s*([dhms])", text):
+        seconds += int(value) * {"d": 86400, "h": 3600, "m": 60, "s": 1}[unit]
+    return seconds or None
+
+
+class FakePrinter:
+    """State of one simulated printer."""
+
+    def __init__(self, name, speed):
+        self.name = name
+        self.speed = speed
+        self.files = {}
+        self.state = "Operational"
+        self.current = None          # nome del file selezionato
+        self.print_seconds = None    # durata simulata (non accelerata)
+        self.started = None
+        self.stopped_elapsed = 0.0   # secondi simulati stampati quando la stampa si è fermata
+        self.events = []             # eventi inviati ai client WebSocket
+        self.lock = threading.Lock()
+
+    def emit(self, event_type):
+        self.events.append({"type": event_type, "payload": {"name": self.current, "path": self.current, "origin": "local"}})
+
+    def _advance(self):
+        # Chiamato con il lock: chiude la stampa quando il tempo simulato è trascorso
+        if self.state == "Printing" and self._elapsed() >= self.print_seconds:
+            self.state = "Operational"
+            self.stop()
+            self.emit("PrintDone")
+
+    def _elapsed(self):
+        return (time.time() - self.started) * self.speed if self.started else self.stopped_elapsed
+
+    def stop(self, state=None):
+        self.stopped_elapsed = min(self._elapsed(), self.print_seconds or 0.0)
+        self.started = None
+        if state:
+            self.state = state
+
+    def start(self, filename):
+        data = self.files[filename]
+        match = ESTIMATE_PATTERN.search(data[-65536:]) or ESTIMATE_PATTERN.search(data[:65536])
+        self.print_seconds = (_parse_duration(match.group(1).decode(errors="ignore")) if match else None) or DEFAULT_PRINT_SECONDS
+        self.current = filename
+        self.state = "Printing"
+        self.stopped_elapsed = 0.0
+        self.started = time.time()
+        self.emit("PrintStarted")
+
+    def printer_status(self):
+        with self.lock:
+            self._advance()
+            if self.state == "Offline":
+                return None
+            printing = self.state == "Printing"
+            return {
+                "state": {"text": self.state, "flags": {"operational": self.state != "Error", "printing": printing,
+                                                        "ready": self.state == "Operational", "error": self.state == "Error"}},
+                "temperature": {"tool0": {"actual": 215.0 if printing else 25.0, "target": 215.0 if printing else 0.0},
+                                "bed": {"actual": 60.0 if printing else 24.0, "target": 60.0 if printing else 0.0}},
+            }
+
+    def job_status(self):
+        with self.lock:
+            self._advance()
+            completion, left, elapsed = None, None, None
+            if self.current and self.print_seconds:
+                elapsed = min(self._elapsed(), self.print_seconds)
+                completion = round(100.0 * elapsed / self.print_seconds, 2)
+                left = int(self.print_seconds - elapsed)
+            return {
+                "job": {"file": {"name": self.current, "path": self.current, "origin": "local"},
+                        "estimatedPrintTime": self.print_seconds},
+                "progress": {"completion": completion, "printTime": int(elapsed) if elapsed is not None else None,
+                             "printTimeLeft": left},
+                "state": self.state,
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    printer = None    # impostato per ogni server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        p = self.printer
+        path = self.path.split("?")[0]
+        if path == "/sockjs/websocket" and self.headers.get("Upgrade", "").lower() == "websocket":
+            return self._serve_websocket()
+        if path == "/api/version":
+            return self._send(200, {"api": "0.1", "server": "1.10.0", "text": f"OctoPrint (simulata: {p.name})"})
+        if path == "/api/printer":
+            status = p.printer_status()
+            return self._send(409, {"error": "Printer is not operational"}) if status is None else self._send(200, status)
+        if path == "/api/job":
+            return self._send(200, p.job_status())
+        if path.startswith("/api/files/local/"):
+            name = unquote(path[len("/api/files/local/"):])
+            with p.lock:
+                data = p.files.get(name)
+            if data is None:
+                return self._send(404, {"error": "File not found"})
+            return self._send(200, {"name": name, "path": name, "origin": "local", "size": len(data),
+                                    "hash": hashlib.sha1(data).hexdigest(), "type": "machinecode"})
+        if path in ("/api/files", "/api/files/local"):
+            with p.lock:
+                files = [{"name": n, "path": n, "origin": "local", "size": len(d), "type": "machinecode"} for n, d in p.files.items()]
+            return self._send(200, {"files": files})
+        return self._send(404, {"error": "Not found"})
+
+    def _serve_websocket(self):
+        """Push interface: "connected", then "current" every 500 ms x throttle and every new "event"."""
+        p = self.printer
+        accept = base64.b64encode(hashlib.sha1(self.headers["Sec-WebSocket-Key"].encode() + WEBSOCKET_GUID).digest())
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode())
+        self.end_headers()
+        self.close_connection = True
+        conn = self.connection
+
+        def send(message):
+            payload = json.dumps(message).encode()
+            length = len(payload)
+            header = bytes([0x81, length]) if length < 126 else (
+                bytes([0x81, 126]) + struct.pack("!H", length) if length < 65536 else bytes([0x81, 127]) + struct.pack("!Q", length))
+            conn.sendall(header + payload)
+
+        send({"connected": {"version": "1.10.0", "display_version": "1.10.0 (simulata)", "plugin_hash": "", "config_hash": ""}})
+        with p.lock:
+            seen = len(p.events)
+        throttle, next_current, buffer = 1, 0.0, b""
+        try:
+            while True:
+                readable, _, _ = select.select([conn], [], [], 0.05)
+                if readable:
+                    data = conn.recv(65536)
+                    if not data:
+                        return
+                    buffer += data
+                    while len(buffer) >= 6:
+                        opcode, length, offset = buffer[0] & 0x0F, buffer[1] & 0x7F, 2
+                        if length == 126:
+                            length, offset = struct.unpack("!H", buffer[2:4])[0], 4
+                        elif length == 127:
+                            length, offset = struct.unpack("!Q", buffer[2:10])[0], 10
+                        if len(buffer) < offset + 4 + length:
+                            break
+                        mask = buffer[offset:offset + 4]
+                        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(buffer[offset + 4:offset + 4 + length]))
+                        buffer = buffer[offset + 4 + length:]
+                        if opcode == 0x8:
+                            return
+                        if opcode == 0x1:
+                            message = json.loads(payload)
+                            throttle = message.get("throttle", throttle)
+
+                printer, job = p.printer_status(), p.job_status()
+                with p.lock:
+                    events, seen = p.events[seen:], len(p.events)
+                for event in events:
+                    send({"event": event})
+                if time.time() >= next_current:
+                    state = printer["state"] if printer else {"text": "Offline", "flags": {}}
+                    temps = [dict(printer["temperature"], time=int(time.time()))] if printer else []
+                    send({"current": {"state": state, "job": job["job"], "progress": job["progress"], "temps": temps,
+                                      "logs": [], "messages": []}})
+                    next_current = time.time() + 0.5 * throttle
+        except OSError:
+            return
+
+    def do_POST(self):
+        p = self.printer
+        path = self.path.split("?")[0]
+        body = self._body()
+        if path == "/api/files/local":
+            header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode()
+            message = BytesParser(policy=HTTP).parsebytes(header + body)
+            fields, upload = {}, None
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                if part.get_filename():
+                    upload = (part.get_filename(), part.get_payload(decode=True))
+                else:
+                    fields[name] = part.get_content().strip()
+            if upload is None:
+                return self._send(400, {"error": "No file included"})
+            if fields.get("path"):
+                upload = (f"{fields['path'].strip('/')}/{upload[0]}", upload[1])
+            with p.lock:
+                p._advance()
+                if fields.get("print") == "true" and p.state != "Operational":
+                    return self._send(409, {"error": "Printer is busy"})
+                p.files[upload[0]] = upload[1]
+                if fields.get("print") == "true":
+                    p.start(upload[0])
+                elif fields.get("select") == "true":
+                    p.current = upload[0]
+            return self._send(201, {"done": True, "files": {"local": {"name": upload[0], "origin": "local"}}})
+        if path == "/api/login":
+            return self._send(200, {"name": "fake", "session": "fake-session", "active": True})
+        if path.startswith("/api/files/local/"):
+            name = unquote(path[len("/api/files/local/"):])
+            request = json.loads(body or b"{}")
+            with p.lock:
+                p._advance()
+                if name not in p.files:
+                    return self._send(404, {"error": "File not found"})
+                if request.get("command") != "select" or (request.get("print") and p.state != "Operational"):
+                    return self._send(409, {"error": f"Cannot {request.get('command')} in state {p.state}"})
+                if request.get("print"):
+                    p.start(name)
+                else:
+                    p.current = name
+            return self._send(204)
+        if path == "/api/job":
+            command = json.loads(body or b"{}").get("command")
+            with p.lock:
+                p._advance()
+                if command == "cancel" and p.state == "Printing":
+                    p.stop("Operational")
+                    p.emit("PrintCancelled")
+                    return self._send(204)
+                if command in ("start", "select") and p.state == "Operational":
+                    filename = json.loads(body).get("file", p.current)
+                    if filename not in p.files:
+                        return self._send(404, {"error": "File not found"})
+                    if command == "start" or json.loads(body).get("print"):
+                        p.start(filename)
+                    else:
+                        p.current = filename
+                    return self._send(204)
+            return self._send(409, {"error": f"Cannot {command} in state {p.state}"})
+        if path == "/fake/error":
+            with p.lock:
+                printing = p.state == "Printing"
+                p.stop("Error")
+                p.emit("Error")
+                if printing:
+                    p.emit("PrintFailed")
+            return self._send(204)
+        if path == "/fake/offline":
+            with p.lock:
+                p.stop("Offline")
+                p.emit("Disconnected")
+            return self._send(204)
+        if path == "/fake/reset":
+            with p.lock:
+                p.stop("Operational")
+                p.current = None
+            return self._send(204)
+        return self._send(404, {"error": "Not found"})
+
+
+def serve(count=1, port=DEFAULT_PORT, speed=DEFAULT_SPEED, host="127.0.0.1"):
+    """Starts ``count`` fake printers on consecutive ports (daemon threads) and returns their registry entries."""
+    printers = []
+    for i in range(count):
+        printer = FakePrinter(f"fake-{i + 1}", speed)
+        handler = type("Handler", (_Handler,), {"printer": printer})
+        server = ThreadingHTTPServer((host, port + i), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name=f"fake-octoprint-{i + 1}", daemon=True).start()
+        printers.append({"name": printer.name, "url": f"http://{host}:{port + i}", "api_key": "fake"})
+    return printers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stampanti OctoPrint simulate")
+    parser.add_argument("--printers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--speed", type=float, default=DEFAULT_SPEED, help="fattore di accelerazione del tempo")
+    parser.add_argument("--write-printers", metavar="FILE", help="scrive il registro delle stampanti per PRINTERS_FILE")
+    args = parser.parse_args()
+
+    printers = serve(args.printers, args.port, args.speed)
+    if args.write_printers:
+        with open(args.write_printers, "w") as f:
+            json.dump({"default": printers[0]["name"], "printers": printers}, f, indent=2)
+    for p in printers:
+        print(f"{p['name']}: {p['url']}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
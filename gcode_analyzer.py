@@ -0,0 +1,539 @@
+# gcode_analyzer.py
+"""
+Analisi in streaming dei file G-code prodotti da PrusaSlicer.
+
+Il file viene mappato in memoria e processato a blocchi che terminano su un
+fine riga; ogni blocco è tokenizzato con operazioni vettoriali NumPy (niente
+cicli Python per riga), quindi anche file da centinaia di MB vengono letti in
+memoria costante e in pochi secondi.
+
+Il tokenizer (iter_moves) è condiviso con lo stimatore dei tempi di stampa.
+"""
+import os
+import re
+import mmap
+import time
+import logging
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from latency_stats import format_duration  # definita lì per chi non deve importare NumPy
+
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+
+DEFAULT_FILAMENT_DIAMETER = 1.75  # mm
+DEFAULT_FILAMENT_DENSITY = 1.24   # g/cm³ (PLA)
+
+# Limiti degli intervalli dell'istogramma delle velocità, in mm/s
+FEEDRATE_BIN_EDGES = (0, 10, 20, 40, 60, 80, 100, 150, 200, 300, np.inf)
+
+# Marcatori di cambio layer: PrusaSlicer/SuperSlicer e Cura
+LAYER_MARKERS = (b";LAYER_CHANGE", b";LAYER:")
+
+# Byte letti all'inizio e alla fine del file da scan_comments
+COMMENT_SCAN_BYTES = 1024 * 1024
+
+ESTIMATED_TIME_KEY = b"; estimated printing time (normal mode) = "
+CONFIG_KEYS = {
+    "filament_diameter": b"; filament_diameter = ",
+    "filament_density": b"; filament_density = ",
+}
+
+# Movimenti letti dal tokenizer. Le coordinate sono assolute (mm), de è
+# l'estrusione del movimento (mm di filamento), f la velocità in mm/min.
+MoveBlock = namedtuple("MoveBlock", "x0 y0 z0 x1 y1 z1 de f layer")
+
+_AXIS_CODE = np.full(256, -1, dtype=np.int8)
+for _code, _letter in enumerate(b"XYZEF"):
+    _AXIS_CODE[_letter] = _code
+X, Y, Z, E, F = range(5)
+
+_TERMINATORS = np.zeros(256, dtype=bool)
+_TERMINATORS[[ord(" "), ord("\n"), ord("\r"), ord(";")]] = True
+
+# Comandi che modificano lo stato della macchina
+MOTION, G92, G90, G91, G28, M82, M83 = range(1, 8)
+
+# I numeri vengono letti allineandoli sul punto decimale: 6 cifre intere e 5
+# decimali coprono tutte le parole F/X/Y/Z/E emesse da PrusaSlicer
+_INT_DIGITS = 6
+_FRAC_DIGITS = 5
+_NUMBER_WINDOW = _INT_DIGITS + 1 + _FRAC_DIGITS
+_DIGIT_WEIGHTS = np.array(
+    [10.0 ** (_INT_DIGITS - 1 - c) for c in range(_INT_DIGITS)] + [0.0] +
+    [10.0 ** -(c + 1) for c in range(_FRAC_DIGITS)]
+)
+# Maschere precalcolate per l'intervallo di colonne [lo, hi) occupato dal numero
+_WINDOW_MASKS = np.zeros(((_NUMBER_WINDOW + 1) ** 2, _NUMBER_WINDOW), dtype=np.uint8)
+for _lo in range(_NUMBER_WINDOW + 1):
+    for _hi in range(_lo, _NUMBER_WINDOW + 1):
+        _WINDOW_MASKS[_lo * (_NUMBER_WINDOW + 1) + _hi, _lo:_hi] = 1
+
+
+class _ParserState:
+    """Machine state carried from one block to the next."""
+
+    def __init__(self):
+        self.position = np.zeros(4)  # X, Y, Z, E
+        self.feedrate = 0.0
+        self.relative_xyz = False
+        self.relative_e = False
+        self.layer = 0
+
+
+def _iter_blocks(mm, block_size):
+    """Yields (start, end) byte ranges that end right after a newline."""
+    size = len(mm)
+    start = 0
+    while start < size:
+        end = min(start + block_size, size)
+        if end < size:
+            newline = mm.rfind(b"\n", start, end)
+            if newline < start:
+                # Riga più lunga del blocco: estendo fino al prossimo fine riga
+                newline = mm.find(b"\n", end)
+                if newline < 0:
+                    newline = size - 1
+            end = newline + 1
+        yield start, end
+        start = end
+
+
+def _byte_view(mm, start, end):
+    buf = np.frombuffer(mm, dtype=np.uint8, count=end - start, offset=start)
+    if buf[-1] != 10:
+        # Ultima riga senza fine riga: serve una copia per aggiungerlo
+        buf = np.append(buf, np.uint8(10))
+    return buf
+
+
+def _parse_numbers(buf, first, end):
+    """Parses the decimal numbers buf[first:end] without per-number Python code."""
+    values = np.full(len(first), np.nan)
+    ok = end > first
+    if not ok.any():
+        return values
+    first, end = first[ok], end[ok]
+
+    # Punto decimale di ciascun numero (se manca, il numero termina sulla cifra delle unità)
+    dot = end.copy()
+    dots = np.flatnonzero(buf == ord("."))
+    owner = np.searchsorted(first, dots, side="right") - 1
+    valid = (owner >= 0) & (dots < end[np.maximum(owner, 0)])
+    dot[owner[valid]] = dots[valid]
+
+    # Una finestra per numero, allineata sul punto decimale; i caratteri fuori dal numero valgono zero
+    padded = np.zeros(len(buf) + _NUMBER_WINDOW, dtype=np.uint8)
+    padded[_INT_DIGITS:_INT_DIGITS + len(buf)] = buf
+    rows = np.lib.stride_tricks.sliding_window_view(padded, _NUMBER_WINDOW)[dot]
+    lo = np.clip(first - dot + _INT_DIGITS, 0, _NUMBER_WINDOW)
+    hi = np.clip(end - dot + _INT_DIGITS, 0, _NUMBER_WINDOW)
+    rows -= ord("0")
+    rows *= rows < 10
+    rows *= _WINDOW_MASKS[lo * (_NUMBER_WINDOW + 1) + hi]
+    parsed = rows.astype(np.float64) @ _DIGIT_WEIGHTS
+    parsed[buf[first] == ord("-")] *= -1
+
+    too_long = np.flatnonzero(dot - first > _INT_DIGITS + 1)
+    for i in too_long:
+        try:
+            parsed[i] = float(buf[first[i]:end[i]].tobytes())
+        except ValueError:
+            parsed[i] = np.nan
+    values[ok] = parsed
+    return values
+
+
+def _ffill_index(is_set):
+    """For each row, the index of the last row (<=) where is_set is True. Row 0 must be set."""
+    idx = np.where(is_set, np.arange(len(is_set)), 0)
+    return np.maximum.accumulate(idx)
+
+
+def _tokenize_block(buf):
+    """
+    Finds the state-changing commands of a block and their X/Y/Z/E/F words.
+
+    Returns (kinds, values, layer_offsets, n_markers): one column per command
+    (values has one row per X/Y/Z/E/F word, NaN when missing) and the number of layer markers preceding each command.
+    This step does not depend on the machine state, so blocks can be tokenized
+    in parallel.
+    """
+    newlines = np.flatnonzero(buf == 10)
+    starts = np.empty(len(newlines), dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = newlines[:-1] + 1
+    last = len(buf) - 1
+    c0 = buf[starts]
+    c1 = buf[np.minimum(starts + 1, last)]
+    c2 = buf[np.minimum(starts + 2, last)]
+    c3 = buf[np.minimum(starts + 3, last)]
+
+    kinds = np.zeros(len(starts), dtype=np.int8)
+    is_g = c0 == ord("G")
+    kinds[is_g & (c1 >= ord("0")) & (c1 <= ord("3")) & _TERMINATORS[c2]] = MOTION
+    is_g9x = is_g & (c1 == ord("9")) & _TERMINATORS[c3]
+    kinds[is_g9x & (c2 == ord("2"))] = G92
+    kinds[is_g9x & (c2 == ord("0"))] = G90
+    kinds[is_g9x & (c2 == ord("1"))] = G91
+    kinds[is_g & (c1 == ord("2")) & (c2 == ord("8")) & _TERMINATORS[c3]] = G28
+    is_m8x = (c0 == ord("M")) & (c1 == ord("8")) & _TERMINATORS[c3]
+    kinds[is_m8x & (c2 == ord("2"))] = M82
+    kinds[is_m8x & (c2 == ord("3"))] = M83
+
+    # Marcatori di layer tra le righe di commento
+    comment_lines = np.flatnonzero(c0 == ord(";"))
+    marker_lines = np.zeros(0, dtype=np.int64)
+    if len(comment_lines):
+        width = max(len(m) for m in LAYER_MARKERS)
+        idx = np.minimum(starts[comment_lines][:, None] + np.arange(width), last)
+        heads = buf[idx]
+        is_marker = np.zeros(len(comment_lines), dtype=bool)
+        for marker in LAYER_MARKERS:
+            pattern = np.frombuffer(marker, dtype=np.uint8)
+            is_marker |= (heads[:, :len(pattern)] == pattern).all(axis=1)
+        marker_lines = comment_lines[is_marker]
+
+    event_lines = np.flatnonzero(kinds)
+    line_to_event = np.full(len(starts), -1, dtype=np.int64)
+    line_to_event[event_lines] = np.arange(len(event_lines))
+
+    # Parole X/Y/Z/E/F: una lettera preceduta da uno spazio, prima di un eventuale commento
+    spaces = np.flatnonzero(buf == 32)
+    codes = _AXIS_CODE[buf[np.minimum(spaces + 1, last)]]
+    word_idx = np.flatnonzero(codes >= 0)
+    letters = spaces[word_idx] + 1
+    word_lines = np.searchsorted(newlines, letters)
+    word_events = line_to_event[word_lines]
+    keep = word_events >= 0
+
+    comment_start = newlines.copy()
+    semicolons = np.flatnonzero(buf == ord(";"))
+    if len(semicolons):
+        sc_lines = np.searchsorted(newlines, semicolons)
+        first = np.ones(len(sc_lines), dtype=bool)
+        first[1:] = sc_lines[1:] != sc_lines[:-1]
+        comment_start[sc_lines[first]] = semicolons[first]
+    keep &= letters < comment_start[word_lines]
+    word_idx, letters, word_lines, word_events = word_idx[keep], letters[keep], word_lines[keep], word_events[keep]
+
+    # Fine del numero: primo tra lo spazio successivo, il commento e il fine riga
+    next_space = np.append(spaces, last)[word_idx + 1]
+    end = np.minimum(next_space, comment_start[word_lines])
+    end -= buf[end - 1] == 13
+    numbers = _parse_numbers(buf, letters + 1, end)
+
+    values = np.full((5, len(event_lines)), np.nan)
+    values[codes[word_idx], word_events] = numbers
+    layer_offsets = np.searchsorted(marker_lines, event_lines)
+    return kinds[event_lines], values, layer_offsets, len(marker_lines)
+
+
+def _resolve_block(tokens, state):
+    """Turns the commands of a tokenized block into absolute moves and advances ``state``."""
+    kinds, values, layer_offsets, n_markers = tokens
+    n = len(kinds) + 1  # la colonna 0 è lo stato ereditato dal blocco precedente
+    ev = np.zeros(n, dtype=np.int8)
+    ev[1:] = kinds
+    vals = np.empty((5, n))
+    vals[:, 0] = np.nan
+    vals[:, 1:] = values
+    has_value = ~np.isnan(vals)
+    ev_motion = ev == MOTION
+    ev_g92 = ev == G92
+    ev_g28 = ev == G28
+
+    # Modalità relative/assolute: ultimo G90/G91 (XYZ), ultimo G90/G91/M82/M83 (E)
+    xyz_setter = (ev == G90) | (ev == G91)
+    xyz_setter[0] = True
+    xyz_value = ev == G91
+    xyz_value[0] = state.relative_xyz
+    relative_xyz = xyz_value[_ffill_index(xyz_setter)]
+
+    e_setter = xyz_setter | (ev == M82) | (ev == M83)
+    e_value = (ev == G91) | (ev == M83)
+    e_value[0] = state.relative_e
+    relative_e = e_value[_ffill_index(e_setter)]
+
+    # Posizione = ultimo valore assoluto ("ancora") + somma dei delta relativi successivi
+    g92_bare = ev_g92 & ~has_value[:4].any(axis=0)
+    g28_bare = ev_g28 & ~has_value[:3].any(axis=0)
+    positions = np.empty((4, n))
+    for axis in (X, Y, Z, E):
+        relative = relative_e if axis == E else relative_xyz
+        given = has_value[axis]
+        anchor = (ev_motion & ~relative & given) | (ev_g92 & given) | g92_bare
+        anchor_value = np.where(given, vals[axis], 0.0)
+        if axis != E:
+            homed = ev_g28 & (given | g28_bare)
+            anchor |= homed
+            anchor_value[homed] = 0.0
+        anchor[0] = True
+        anchor_value[0] = state.position[axis]
+        relative_given = ev_motion & relative & given
+        if relative_given.any():
+            cumulative = np.cumsum(np.where(relative_given, vals[axis], 0.0))
+            ref = _ffill_index(anchor)
+            positions[axis] = anchor_value[ref] + cumulative - cumulative[ref]
+        else:
+            positions[axis] = anchor_value[_ffill_index(anchor)]
+
+    feed_given = has_value[F]
+    feed_given[0] = True
+    feed = np.where(feed_given, vals[F], 0.0)
+    feed[0] = state.feedrate
+    feed = feed[_ffill_index(feed_given)]
+
+    moves = np.flatnonzero(ev_motion)
+    before = moves - 1
+    px, py, pz, pe = positions
+    block = MoveBlock(
+        x0=px[before], y0=py[before], z0=pz[before],
+        x1=px[moves], y1=py[moves], z1=pz[moves],
+        de=pe[moves] - pe[before],
+        f=feed[moves],
+        layer=state.layer + layer_offsets[before],
+    )
+
+    state.position = positions[:, -1].copy()
+    state.feedrate = float(feed[-1])
+    state.relative_xyz = bool(relative_xyz[-1])
+    state.relative_e = bool(relative_e[-1])
+    state.layer += n_markers
+    return block
+
+
+def _scan_comments(mm, start, end, found, keys=None):
+    """Looks up the slicer's summary comments (estimated time, filament settings) in a block."""
+    keys = keys or dict(CONFIG_KEYS, estimated_time=ESTIMATED_TIME_KEY)
+    for name, key in keys.items():
+        if name in found:
+            continue
+        pos = mm.find(key, start, end)
+        if pos >= 0:
+            line_end = mm.find(b"\n", pos, end)
+            value = mm[pos + len(key):line_end if line_end >= 0 else end]
+            found[name] = value.decode("utf-8", errors="replace").strip()
+
+
+def scan_comments(gcode_path, keys, edge_bytes=COMMENT_SCAN_BYTES):
+    """
+    Reads ``key = value`` slicer comments from the head and tail of a G-code file.
+
+    PrusaSlicer writes its summary and full config at the end of the file, Cura
+    writes a header at the start, so the body (the moves) is not scanned.
+
+    Args:
+        gcode_path (str): Path of the G-code file.
+        keys (dict): Maps result names to the comment prefix, e.g. b"; filament_diameter = ".
+        edge_bytes (int): Bytes scanned at each end of the file.
+    """
+    found = {}
+    if os.path.getsize(gcode_path) == 0:
+        return found
+    with open(gcode_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        _scan_comments(mm, max(0, size - edge_bytes), size, found, keys)
+        _scan_comments(mm, 0, min(size, edge_bytes), found, keys)
+    return found
+
+
+def _default_workers():
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def iter_moves(gcode_path, block_size=DEFAULT_BLOCK_SIZE, comments=None, workers=None):
+    """
+    Yields MoveBlock arrays for the G0-G3 moves of a G-code file, block by block.
+
+    Blocks are tokenized on a small thread pool (NumPy releases the GIL) while the
+    machine state is resolved in file order; at most ``2 * workers`` blocks are
+    held in memory at any time.
+
+    Args:
+        gcode_path (str): Path of the G-code file.
+        block_size (int): Approximate bytes per block.
+        comments (dict, optional): If given, filled with the slicer summary comments
+                                   found in the file (estimated_time, filament_diameter, ...).
+        workers (int, optional): Tokenizer threads; defaults to the CPU count (max 4).
+    """
+    if os.path.getsize(gcode_path) == 0:
+        return
+    workers = workers or _default_workers()
+    state = _ParserState()
+
+    def tokenize(start, end):
+        buf = _byte_view(mm, start, end)
+        try:
+            return _tokenize_block(buf)
+        finally:
+            del buf  # la vista sul mmap va rilasciata prima di chiudere la mappa
+
+    with open(gcode_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gcode") as executor:
+        pending = deque()
+        for start, end in _iter_blocks(mm, block_size):
+            if comments is not None:
+                _scan_comments(mm, start, end, comments)
+            pending.append(executor.submit(tokenize, start, end))
+            if len(pending) >= 2 * workers:
+                yield _resolve_block(pending.popleft().result(), state)
+        while pending:
+            yield _resolve_block(pending.popleft().result(), state)
+
+
+def parse_duration(text):
+    """Converts PrusaSlicer durations such as '1d 2h 3m 4s' to seconds."""
+    units = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+    matches = re.findall(r"(\d+)\s*([dhms])", text or "")
+    if not matches:
+        return None
+    return sum(int(value) * units[unit] for value, unit in matches)
+
+
+def _first_float(text):
+    try:
+        return float(str(text).split(",")[0])
+    except (TypeError, ValueError):
+        return None
+
+
+class GCodeStats:
+    """Accumulates print statistics over MoveBlocks."""
+
+    def __init__(self):
+        self.moves = 0
+        self.extrusion_mm = 0.0
+        self.print_distance_mm = 0.0
+        self.travel_distance_mm = 0.0
+        self.layer_extrusion = np.zeros(0)
+        self.layer_z = np.zeros(0)
+        self.z_extrusion = {}
+        self.bbox_min = np.full(3, np.inf)
+        self.bbox_max = np.full(3, -np.inf)
+        n_bins = len(FEEDRATE_BIN_EDGES) - 1
+        self.print_feed_counts = np.zeros(n_bins, dtype=np.int64)
+        self.print_feed_distance = np.zeros(n_bins)
+        self.travel_feed_counts = np.zeros(n_bins, dtype=np.int64)
+        self.travel_feed_distance = np.zeros(n_bins)
+
+    def _grow_layers(self, size):
+        if size > len(self.layer_extrusion):
+            self.layer_extrusion = np.pad(self.layer_extrusion, (0, size - len(self.layer_extrusion)))
+            self.layer_z = np.pad(self.layer_z, (0, size - len(self.layer_z)))
+
+    def add(self, block):
+        dx = block.x1 - block.x0
+        dy = block.y1 - block.y0
+        dz = block.z1 - block.z0
+        xy = np.hypot(dx, dy)
+        distance = np.sqrt(xy * xy + dz * dz)
+        extruding = (block.de > 0) & (xy > 0)
+        travel = ~extruding & (distance > 0)
+
+        self.moves += int(np.count_nonzero(distance > 0))
+        self.extrusion_mm += float(block.de.sum())
+        self.print_distance_mm += float(distance[extruding].sum())
+        self.travel_distance_mm += float(distance[travel].sum())
+
+        if len(block.layer):
+            self._grow_layers(int(block.layer.max()) + 1)
+            self.layer_extrusion += np.bincount(block.layer, weights=block.de, minlength=len(self.layer_extrusion))
+            if extruding.any():
+                np.maximum.at(self.layer_z, block.layer[extruding], block.z1[extruding])
+
+        if extruding.any():
+            ends = [(start[extruding], stop[extruding])
+                    for start, stop in ((block.x0, block.x1), (block.y0, block.y1), (block.z0, block.z1))]
+            self.bbox_min = np.minimum(self.bbox_min, [min(a.min(), b.min()) for a, b in ends])
+            self.bbox_max = np.maximum(self.bbox_max, [max(a.max(), b.max()) for a, b in ends])
+
+            # Per i file senza marcatori di layer si raggruppa per quota Z (a tratti costante)
+            z = np.round(block.z1[extruding], 3)
+            runs = np.flatnonzero(np.diff(z)) + 1
+            run_starts = np.concatenate(([0], runs))
+            sums = np.add.reduceat(block.de[extruding], run_starts)
+            for key, amount in zip(z[run_starts].tolist(), sums.tolist()):
+                self.z_extrusion[key] = self.z_extrusion.get(key, 0.0) + amount
+
+        speed = block.f / 60.0
+        for mask, counts, dist in ((extruding, self.print_feed_counts, self.print_feed_distance),
+                                   (travel, self.travel_feed_counts, self.travel_feed_distance)):
+            c, _ = np.histogram(speed[mask], bins=FEEDRATE_BIN_EDGES)
+            d, _ = np.histogram(speed[mask], bins=FEEDRATE_BIN_EDGES, weights=distance[mask])
+            counts += c
+            dist += d
+
+    def per_layer(self):
+        """Returns (layer_z, extrusion_mm) per layer, skipping the pre-print section."""
+        if len(self.layer_extrusion) > 1:
+            return self.layer_z[1:], self.layer_extrusion[1:]
+        if self.z_extrusion:
+            zs = sorted(self.z_extrusion)
+            return np.array(zs), np.array([self.z_extrusion[z] for z in zs])
+        return np.zeros(0), np.zeros(0)
+
+
+def _histogram_rows(counts, distance):
+    rows = []
+    for i, (count, dist) in enumerate(zip(counts.tolist(), distance.tolist())):
+        lo, hi = FEEDRATE_BIN_EDGES[i], FEEDRATE_BIN_EDGES[i + 1]
+        label = f"{lo:g}-{hi:g}" if np.isfinite(hi) else f">{lo:g}"
+        rows.append({"mm_s": label, "moves": count, "distance_mm": round(dist, 1)})
+    return rows
+
+
+def analyze(gcode_path, filament_diameter=None, filament_density=None, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Computes print statistics for a G-code file in constant memory.
+
+    Args:
+        gcode_path (str): Path of the G-code file.
+        filament_diameter (float, optional): mm; defaults to the value in the file, then 1.75.
+        filament_density (float, optional): g/cm³; defaults to the value in the file, then 1.24.
+
+    Returns:
+        dict: layer count, extrusion per layer, filament length and mass, travel
+        distance, bounding box, feed-rate histograms and the slicer's time estimate.
+    """
+    t0 = time.perf_counter()
+    stats = GCodeStats()
+    comments = {}
+    for block in iter_moves(gcode_path, block_size=block_size, comments=comments):
+        stats.add(block)
+
+    diameter = filament_diameter or _first_float(comments.get("filament_diameter")) or DEFAULT_FILAMENT_DIAMETER
+    density = filament_density or _first_float(comments.get("filament_density")) or DEFAULT_FILAMENT_DENSITY
+    volume_cm3 = stats.extrusion_mm * np.pi * (diameter / 2.0) ** 2 / 1000.0
+    layer_z, layer_extrusion = stats.per_layer()
+    has_bbox = np.isfinite(stats.bbox_min).all()
+
+    elapsed = time.perf_counter() - t0
+    size_mb = os.path.getsize(gcode_path) / (1024 * 1024)
+    logging.info(f"G-code analizzato: {gcode_path} ({size_mb:.1f} MB) in {elapsed:.2f}s") # This will be INFO level
+    return {
+        "file": gcode_path,
+        "size_mb": round(size_mb, 2),
+        "moves": stats.moves,
+        "layer_count": int(len(layer_extrusion)),
+        "layer_z_mm": [round(z, 3) for z in layer_z.tolist()],
+        "extrusion_per_layer_mm": [round(e, 2) for e in layer_extrusion.tolist()],
+        "filament_length_mm": round(stats.extrusion_mm, 1),
+        "filament_volume_cm3": round(volume_cm3, 2),
+        "filament_mass_g": round(volume_cm3 * density, 2),
+        "filament_diameter_mm": diameter,
+        "filament_density_g_cm3": density,
+        "print_distance_mm": round(stats.print_distance_mm, 1),
+        "travel_distance_mm": round(stats.travel_distance_mm, 1),
+        "bounding_box_mm": {
+            "min": [round(v, 3) for v in stats.bbox_min.tolist()],
+            "max": [round(v, 3) for v in stats.bbox_max.tolist()],
+        } if has_bbox else None,
+        "print_feedrate_histogram": _histogram_rows(stats.print_feed_counts, stats.print_feed_distance),
+        "travel_feedrate_histogram": _histogram_rows(stats.travel_feed_counts, stats.travel_feed_distance),
+        "slicer_estimated_time": comments.get("estimated_time"),
+        "slicer_estimated_seconds": parse_duration(comments.get("estimated_time")),
+        "analysis_seconds": round(elapsed, 3),
+    }
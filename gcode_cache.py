@@ -0,0 +1,303 @@
+# gcode_cache.py
+"""
+Cache persistente su disco per il G-code prodotto da PrusaSlicer.
+
+Le voci sono indirizzate per contenuto: la chiave è un hash SHA-256 dei byte del
+modello, dell'eseguibile di PrusaSlicer (percorso, dimensione e data di modifica,
+che cambiano ad ogni aggiornamento), degli argomenti CLI e delle preferenze di
+slicing rilevanti. Una richiesta ripetuta restituisce il G-code già calcolato
+senza rilanciare PrusaSlicer: il file di destinazione diventa un hard link
+alla voce della cache (una copia solo tra filesystem diversi), quindi i file
+G-code non vanno modificati sul posto.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+
+DEFAULT_CACHE_DIR = ".gcode_cache"
+DEFAULT_MAX_SIZE_MB = 2048
+DEFAULT_MAX_AGE_DAYS = 30
+
+INDEX_FILE_NAME = "index.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+INDEX_SAVE_SECONDS = 60   # hit, miss e ultimo accesso dei lookup vengono salvati al più una volta ogni tot secondi
+
+# Preferenze (preferences.json) che influenzano il G-code prodotto
+SLICING_PREFERENCE_KEYS = (
+    "default_layer_height",
+    "default_infill_density",
+    "default_filament_type",
+)
+
+
+class GCodeCache:
+    """
+    Content-addressed G-code cache with size/age based eviction.
+
+    The index (``index.json`` inside the cache directory) stores one entry per
+    key plus hit/miss counters and a memo of model digests keyed by
+    (path, size, mtime), so repeated lookups do not re-hash large models.
+    Lookups only update the index in memory; it is written by store, eviction
+    and hints, or by a lookup at most every INDEX_SAVE_SECONDS.
+    """
+
+    def __init__(self, cache_dir, max_size_bytes, max_age_seconds):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.max_age_seconds = max_age_seconds
+        self._index_path = os.path.join(cache_dir, INDEX_FILE_NAME)
+        self._lock = threading.RLock()
+        self._index = None
+        self._dirty = False
+        self._last_save = 0.0
+
+    # --- Indice ---
+    def _load_index(self):
+        if self._index is not None:
+            return self._index
+        index = {"entries": {}, "digests": {}, "hints": {}, "stats": {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}}
+        if os.path.exists(self._index_path):
+            try:
+                with open(self._index_path, 'r') as f:
+                    loaded = json.load(f)
+                for section in index:
+                    index[section].update(loaded.get(section, {}))
+            except Exception as e:
+                logging.warning(f"Indice della cache G-code illeggibile, lo ricreo: {e}")
+        self._index = index
+        return index
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._index_path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._index, f)
+            os.replace(tmp_path, self._index_path)
+            self._dirty = False
+            self._last_save = time.time()
+        except Exception as e:
+            logging.error(f"Errore nel salvare l'indice della cache G-code: {e}")
+
+    def _touch_index(self):
+        """Marks the index as changed and saves it only if the last save is old enough."""
+        self._dirty = True
+        if time.time() - self._last_save >= INDEX_SAVE_SECONDS:
+            self._save_index()
+
+    def flush(self):
+        """Writes pending lookup statistics and access times to disk."""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    # --- Chiavi ---
+    def file_digest(self, path):
+        """Returns the SHA-256 of a file, memoized on (path, size, mtime)."""
+        st = os.stat(path)
+        memo_key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+        with self._lock:
+            digest = self._load_index()["digests"].get(memo_key)
+        if digest:
+            return digest
+
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            digests = self._load_index()["digests"]
+            # Le vecchie versioni dello stesso file non servono più
+            stale_prefix = f"{os.path.abspath(path)}|"
+            for k in [k for k in digests if k.startswith(stale_prefix)]:
+                del digests[k]
+            digests[memo_key] = digest
+            self._dirty = True
+        return digest
+
+    @staticmethod
+    def executable_fingerprint(executable_path):
+        """Identifies the slicer build without launching it."""
+        try:
+            st = os.stat(executable_path)
+            return f"{os.path.realpath(executable_path)}|{st.st_size}|{st.st_mtime_ns}"
+        except OSError:
+            return executable_path
+
+    def make_key(self, model_path, executable_path, cli_args, prefs=None):
+        """
+        Builds the cache key for a slicing request.
+
+        Args:
+            model_path (str): Path of the input model.
+            executable_path (str): Path of the PrusaSlicer executable.
+            cli_args (list): CLI arguments, excluding input and output paths.
+            prefs (dict, optional): User preferences; only SLICING_PREFERENCE_KEYS are used.
+        """
+        relevant_prefs = {k: (prefs or {}).get(k) for k in SLICING_PREFERENCE_KEYS}
+        material = json.dumps({
+            "model": self.file_digest(model_path),
+            "executable": self.executable_fingerprint(executable_path),
+            "args": list(cli_args),
+            "prefs": relevant_prefs,
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    # --- Lookup / Store ---
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.gcode")
+
+    def lookup(self, key):
+        """Returns the cached G-code path for ``key``, or None on a miss."""
+        with self._lock:
+            index = self._load_index()
+            entry = index["entries"].get(key)
+            path = self._entry_path(key)
+            if entry and os.path.exists(path) and not self._is_expired(entry, time.time()):
+                entry["last_access"] = time.time()
+                index["stats"]["hits"] += 1
+                self._touch_index()
+                return path
+            if entry:
+                self._remove_entry(key)
+            index["stats"]["misses"] += 1
+            self._touch_index()
+            return None
+
+    def fetch(self, key, destination):
+        """Hard-links (or copies, across filesystems) the cached G-code to ``destination``. Returns True on a hit."""
+        cached_path = self.lookup(key)
+        if not cached_path:
+            return False
+        if os.path.abspath(cached_path) == os.path.abspath(destination):
+            return True
+        try:
+            os.remove(destination)
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(cached_path, destination)
+        except OSError:
+            shutil.copyfile(cached_path, destination)
+        return True
+
+    def store(self, key, gcode_path, source=None, **metadata):
+        """Copies a freshly produced G-code file into the cache."""
+        with self._lock:
+            index = self._load_index()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._entry_path(key)
+            tmp_path = path + ".tmp"
+            try:
+                # Un file nuovo, non riscritto sul posto: il vecchio potrebbe essere collegato a un G-code di output
+                shutil.copyfile(gcode_path, tmp_path)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logging.error(f"Impossibile salvare {gcode_path} nella cache G-code: {e}")
+                return None
+            now = time.time()
+            entry = {"size": os.path.getsize(path), "created": now, "last_access": now, "source": source}
+            entry.update(metadata)
+            index["entries"][key] = entry
+            index["stats"]["stores"] += 1
+            self._evict(now)
+            self._save_index()
+            return path
+
+    def get_metadata(self, key):
+        with self._lock:
+            return dict(self._load_index()["entries"].get(key, {}))
+
+    # --- Suggerimenti per modello ---
+    def get_hint(self, name):
+        with self._lock:
+            return self._load_index()["hints"].get(name)
+
+    def set_hint(self, name, value):
+        """Stores a small per-model fact (e.g. "needs --center") that survives eviction."""
+        with self._lock:
+            self._load_index()["hints"][name] = value
+            self._save_index()
+
+    # --- Eviction ---
+    def _is_expired(self, entry, now):
+        return self.max_age_seconds > 0 and now - entry.get("created", 0) > self.max_age_seconds
+
+    def _remove_entry(self, key):
+        index = self._load_index()
+        index["entries"].pop(key, None)
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"Impossibile rimuovere la voce {key} dalla cache G-code: {e}")
+        index["stats"]["evictions"] += 1
+
+    def _evict(self, now):
+        index = self._load_index()
+        # Digest memorizzati per modelli che non esistono più
+        digests = index["digests"]
+        for memo_key in [k for k in digests if not os.path.exists(k.rsplit("|", 2)[0])]:
+            del digests[memo_key]
+
+        entries = index["entries"]
+        for key in [k for k, e in entries.items() if self._is_expired(e, now)]:
+            self._remove_entry(key)
+
+        total = sum(e.get("size", 0) for e in entries.values())
+        if total <= self.max_size_bytes:
+            return
+        # Rimuove le voci usate meno di recente finché non si rientra nel limite
+        for key, entry in sorted(entries.items(), key=lambda kv: kv[1].get("last_access", 0)):
+            if total <= self.max_size_bytes:
+                break
+            total -= entry.get("size", 0)
+            self._remove_entry(key)
+
+    def evict(self):
+        with self._lock:
+            self._evict(time.time())
+            self._save_index()
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._load_index()["entries"]):
+                self._remove_entry(key)
+            self._save_index()
+
+    # --- Statistiche ---
+    def stats(self):
+        with self._lock:
+            index = self._load_index()
+            stats = dict(index["stats"])
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+            stats["entries"] = len(index["entries"])
+            stats["size_mb"] = round(sum(e.get("size", 0) for e in index["entries"].values()) / (1024 * 1024), 2)
+            stats["max_size_mb"] = round(self.max_size_bytes / (1024 * 1024), 2)
+            return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache():
+    """Returns the process-wide cache configured from the .env variables."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            cache_dir = os.getenv("GCODE_CACHE_DIR", DEFAULT_CACHE_DIR)
+            max_size_mb = float(os.getenv("GCODE_CACHE_MAX_MB", DEFAULT_MAX_SIZE_MB))
+            max_age_days = float(os.getenv("GCODE_CACHE_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS))
+            _default_cache = GCodeCache(
+                cache_dir,
+                max_size_bytes=int(max_size_mb * 1024 * 1024),
+                max_age_seconds=max_age_days * 86400,
+            )
+        return _default_cache
@@ -0,0 +1,167 @@
+# hotwords.py
+"""
+Riconoscimento delle hotword ("Arturo", ...) nelle trascrizioni.
+
+Le hotword vengono compilate una sola volta in un'unica espressione
+regolare con i confini di parola, al posto di una ricerca di sottostringa
+per ogni parola a ogni frase (che trovava anche "vez" dentro "avvezzo").
+Testo e hotword passano prima da una normalizzazione fonetica pensata per
+gli errori tipici del riconoscimento in italiano (accenti, doppie, "h"
+muta, c/ch/k/q), così "Arturò", "Arturro" e "Arthuro" valgono come
+"arturo" senza doverli elencare. Se la regex non trova niente, per i nomi
+(``fuzzy_hotwords``, default "arturo" e "artur") si accetta anche una
+distanza di modifica limitata (``max_distance``, default 1) parola per
+parola. Le altre hotword, insulti e frasi di più parole, valgono solo
+esatte: con un errore ammesso "misurabile" passerebbe per "miserabile".
+
+Lista, distanza e normalizzazione si configurano da preferences.json:
+``hotwords`` (lista), ``hotword_fuzzy`` (le hotword ammesse con errori),
+``hotword_max_distance`` (0 per le sole corrispondenze esatte) e
+``hotword_phonetic``. Benchmark e precision/recall su un corpus
+di trascrizioni in benchmarks/bench_hotwords.py.
+"""
+import re
+import logging
+import unicodedata
+from functools import lru_cache
+
+DEFAULT_HOTWORDS = ("arturo", "artur", "vez", "coglione", "testa di cazzo", "miserabile", "scemo di merda", "porco dio")
+DEFAULT_FUZZY_HOTWORDS = ("arturo", "artur")   # i nomi: sono le parole che il riconoscimento storpia di più
+DEFAULT_MAX_DISTANCE = 1
+WORD_CACHE_SIZE = 4096
+MIN_FUZZY_LENGTH = 5   # le hotword più corte (es. "vez") solo esatte: con un errore ammesso troverebbero troppe parole
+
+_WORD = re.compile(r"\w+")
+# Regole applicate in ordine a ogni parola già senza accenti e minuscola
+_DOUBLE = (re.compile(r"(\w)\1+"), r"\1")
+_PHONETIC_RULES = [
+    _DOUBLE,                                   # doppie, prima e dopo le sostituzioni ("cc" -> "c" -> "k")
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"ch|ck|q|c(?![ei])"), "k"),   # c dura, ch, q -> k; la c dolce (ce, ci) resta
+    (re.compile(r"gh"), "g"),
+    (re.compile(r"h"), ""),
+    (re.compile(r"[yj]"), "i"),
+    (re.compile(r"w"), "v"),
+    (re.compile(r"x"), "s"),
+    _DOUBLE,
+]
+
+
+def strip_accents(text):
+    """Lowercases the text and removes diacritics ("Arturò" -> "arturo")."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+@lru_cache(maxsize=4096)   # il lessico parlato è ristretto: quasi tutte le parole si ripetono
+def phonetic_key(word):
+    """Phonetic key of a single word, so that common transcription variants compare equal."""
+    key = strip_accents(word)
+    for pattern, replacement in _PHONETIC_RULES:
+        key = pattern.sub(replacement, key)
+    return key
+
+
+def bounded_distance(a, b, limit):
+    """Levenshtein distance between a and b, or limit + 1 as soon as it is known to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+class HotwordMatcher:
+    """Hotword list compiled into one regex, with optional phonetic normalization and fuzzy matching."""
+
+    def __init__(self, hotwords=DEFAULT_HOTWORDS, max_distance=DEFAULT_MAX_DISTANCE, phonetic=True,
+                 fuzzy_hotwords=DEFAULT_FUZZY_HOTWORDS):
+        self.phonetic = phonetic
+        self.max_distance = max(0, int(max_distance))
+        self.hotwords = tuple(dict.fromkeys(" ".join(_WORD.findall(h.lower())) for h in hotwords if _WORD.search(h)))
+        self._by_key = {}   # forma normalizzata -> hotword
+        for hotword in self.hotwords:
+            self._by_key.setdefault(self._normalize(hotword), hotword)
+        if self._by_key:
+            # Le alternative più lunghe prima, così "artur" non vince su "arturo" nel gruppo
+            alternatives = sorted(self._by_key, key=len, reverse=True)
+            self._pattern = re.compile(r"\b(?:" + "|".join(re.escape(key) for key in alternatives) + r")\b")
+        else:
+            self._pattern = None
+        # (numero di parole, forma normalizzata, hotword) delle hotword ammesse alla ricerca fuzzy
+        fuzzy = {self._normalize(h) for h in fuzzy_hotwords if _WORD.search(h)}
+        self._fuzzy = [(key.count(" ") + 1, key, hotword) for key, hotword in self._by_key.items()
+                       if key in fuzzy and len(key.replace(" ", "")) >= MIN_FUZZY_LENGTH] if self.max_distance else []
+        self._word_cache = {}   # parola normalizzata -> hotword a distanza limitata (o None)
+
+    @classmethod
+    def from_preferences(cls, preferences=None):
+        """Builds the matcher from the hotwords, hotword_fuzzy, hotword_max_distance and hotword_phonetic preferences."""
+        preferences = preferences or {}
+        hotwords = preferences.get("hotwords") or DEFAULT_HOTWORDS
+        if isinstance(hotwords, str):
+            hotwords = [hotwords]
+        fuzzy_hotwords = preferences.get("hotword_fuzzy", DEFAULT_FUZZY_HOTWORDS) or ()
+        if isinstance(fuzzy_hotwords, str):
+            fuzzy_hotwords = [fuzzy_hotwords]
+        try:
+            max_distance = int(preferences.get("hotword_max_distance", DEFAULT_MAX_DISTANCE))
+        except (TypeError, ValueError):
+            logging.warning("hotword_max_distance non valido nelle preferenze, uso il valore predefinito.")
+            max_distance = DEFAULT_MAX_DISTANCE
+        return cls(hotwords, max_distance=max_distance, phonetic=bool(preferences.get("hotword_phonetic", True)),
+                   fuzzy_hotwords=fuzzy_hotwords)
+
+    def _normalize(self, text):
+        words = _WORD.findall(strip_accents(text))
+        if self.phonetic:
+            words = [phonetic_key(word) for word in words]
+        return " ".join(words)
+
+    def match(self, text):
+        """
+        Finds a hotword in a transcription.
+
+        Args:
+            text (str): The transcribed utterance.
+
+        Returns:
+            str: The hotword that matched (as configured), or None.
+        """
+        if self._pattern is None or not text:
+            return None
+        normalized = self._normalize(text)
+        found = self._pattern.search(normalized)
+        if found:
+            return self._by_key[found.group(0)]
+        if not self._fuzzy:
+            return None
+        words = normalized.split(" ")
+        for word in words:
+            hotword = self._word_cache.get(word, False)
+            if hotword is False:
+                hotword = self._closest(word, 1)
+                if len(self._word_cache) >= WORD_CACHE_SIZE:
+                    self._word_cache.clear()
+                self._word_cache[word] = hotword
+            if hotword is not None:
+                return hotword
+        for size in {size for size, _, _ in self._fuzzy if size > 1}:
+            for start in range(len(words) - size + 1):
+                hotword = self._closest(" ".join(words[start:start + size]), size)
+                if hotword is not None:
+                    return hotword
+        return None
+
+    def _closest(self, candidate, size):
+        limit = self.max_distance
+        for key_size, key, hotword in self._fuzzy:
+            if key_size == size and abs(len(candidate) - len(key)) <= limit and bounded_distance(candidate, key, limit) <= limit:
+                return hotword
+        return None
@@ -0,0 +1,112 @@
+# latency_stats.py
+"""
+Statistiche di latenza dell'assistente.
+
+Ogni metrica (tempo al primo token della risposta, alla prima frase, durata
+completa del turno, tempo passato nei tool...) tiene gli ultimi
+LATENCY_SAMPLES campioni; il report riporta per ciascuna numero di
+campioni, ultimo valore, media, p50, p95 e massimo. Le misure sono in
+secondi, il report in millisecondi. Qui c'è anche ``format_duration``, usata
+per le durate di stampa da moduli che non devono caricare NumPy.
+"""
+import threading
+from collections import deque
+
+from rich.table import Table
+from rich import print as rprint
+
+LATENCY_SAMPLES = 500
+
+# Descrizioni mostrate nel report, nell'ordine in cui compaiono
+METRIC_LABELS = {
+    "stt_transcription": "Trascrizione (fine del parlato → testo)",
+    "speech_to_llm": "Fine del parlato → richiesta all'LLM",
+    "llm_ttft": "Primo token della risposta",
+    "llm_first_sentence": "Prima frase completa",
+    "llm_turn": "Risposta completa",
+    "llm_tools": "Esecuzione dei tool",
+}
+
+
+def format_duration(seconds):
+    """Formats seconds the way PrusaSlicer does, e.g. '1h 2m 3s'."""
+    seconds = int(round(seconds))
+    parts = []
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size or parts:
+            parts.append(f"{seconds // size}{unit}")
+            seconds %= size
+    parts.append(f"{seconds}s")
+    return " ".join(parts)
+
+
+class LatencyStats:
+    """Thread-safe latency samples grouped by metric name."""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self._samples = {}
+        self._max_samples = samples
+        self._lock = threading.Lock()
+
+    def record(self, metric, seconds):
+        with self._lock:
+            if metric not in self._samples:
+                self._samples[metric] = deque(maxlen=self._max_samples)
+            self._samples[metric].append(seconds)
+
+    def last(self, metric):
+        """Most recent sample of a metric in seconds, or None."""
+        with self._lock:
+            samples = self._samples.get(metric)
+            return samples[-1] if samples else None
+
+    def report(self):
+        """Returns {metric: {count, last_ms, mean_ms, p50_ms, p95_ms, max_ms}}."""
+        with self._lock:
+            snapshot = {metric: list(samples) for metric, samples in self._samples.items()}
+        order = list(METRIC_LABELS) + sorted(m for m in snapshot if m not in METRIC_LABELS)
+        report = {}
+        for metric in order:
+            values = snapshot.get(metric)
+            if not values:
+                continue
+            ordered = sorted(values)
+
+            def percentile(p):
+                return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1)
+
+            report[metric] = {
+                "count": len(values),
+                "last_ms": round(values[-1] * 1000, 1),
+                "mean_ms": round(sum(values) / len(values) * 1000, 1),
+                "p50_ms": percentile(0.50),
+                "p95_ms": percentile(0.95),
+                "max_ms": round(ordered[-1] * 1000, 1),
+            }
+        return report
+
+    def print_report(self, title="Latenza dell'assistente"):
+        """Prints the report as a rich table and returns it."""
+        report = self.report()
+        table = Table(title=title, style="cyan", title_style="bold magenta")
+        table.add_column("Misura", style="green")
+        for column in ("Campioni", "Ultima ms", "Media ms", "p50 ms", "p95 ms", "Max ms"):
+            table.add_column(column, justify="right")
+        for metric, stats in report.items():
+            table.add_row(METRIC_LABELS.get(metric, metric), str(stats["count"]), str(stats["last_ms"]),
+                          str(stats["mean_ms"]), str(stats["p50_ms"]), str(stats["p95_ms"]), str(stats["max_ms"]))
+        rprint(table)
+        return report
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_latency_stats():
+    """Returns the process-wide LatencyStats instance."""
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = LatencyStats()
+        return _stats
@@ -0,0 +1,432 @@
+# mesh_analysis.py
+"""
+Caricamento vettoriale delle mesh (STL binario/ASCII, 3MF) e analisi di stampabilità.
+
+Le mesh sono rappresentate come array NumPy (n, 3, 3) di triangoli in mm. L'STL
+binario viene letto direttamente dal file mappato in memoria con np.frombuffer,
+senza cicli Python per triangolo. Sulla mesh vengono calcolati ingombro, volume,
+superficie, area in sbalzo (rispetto a una soglia d'angolo), area di contatto
+con il piatto, spigoli aperti o non-manifold e candidati a pareti sottili.
+"""
+import os
+import re
+import mmap
+import time
+import logging
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+SUPPORTED_EXTENSIONS = (".stl", ".3mf")
+
+DEFAULT_OVERHANG_ANGLE = 45.0   # gradi dalla verticale oltre i quali serve supporto
+DEFAULT_MIN_WALL = 0.8          # mm, circa due larghezze di estrusione con ugello da 0.4
+DEFAULT_RAY_RESOLUTION = 256    # raggi per lato della griglia usata per lo spessore delle pareti
+# Due facce delimitano una parete se le normali formano un angolo di almeno 120°
+WALL_FACES_MAX_DOT = -0.5
+BED_TOLERANCE = 0.01            # mm sopra il punto più basso considerati appoggiati al piatto
+
+_STL_RECORD = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attributes", "<u2")])
+_ASCII_VERTEX = re.compile(rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)")
+_3MF_NAMESPACE = "{http://schemas.microsoft.com/3dmanufacturing/core/2015/02}"
+
+
+class MeshError(Exception):
+    """Raised when a model file cannot be read as a mesh."""
+
+
+# --- Caricamento ---
+def _is_binary_stl(mm):
+    if len(mm) < 84:
+        return False
+    count = int(np.frombuffer(mm, dtype="<u4", count=1, offset=80)[0])
+    return len(mm) == 84 + count * _STL_RECORD.itemsize
+
+
+def _load_stl(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise MeshError(f"File vuoto: {path}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if _is_binary_stl(mm):
+                count = (len(mm) - 84) // _STL_RECORD.itemsize
+                records = np.frombuffer(mm, dtype=_STL_RECORD, count=count, offset=84)
+                triangles = records["vertices"].copy()  # la copia libera il mmap
+                del records
+                return triangles
+            coords = _ASCII_VERTEX.findall(mm)
+    if not coords or len(coords) % 3:
+        raise MeshError(f"STL non valido: {path}")
+    return np.array(coords).astype(np.float32).reshape(-1, 3, 3)
+
+
+def _parse_transform(text):
+    """3MF transforms are 3x4 row-major matrices applied to row vectors: p' = p·M + t."""
+    if not text:
+        return None
+    values = np.array(text.split(), dtype=np.float64)
+    return values[:9].reshape(3, 3), values[9:12]
+
+
+def _apply_transform(triangles, transform):
+    if transform is None:
+        return triangles
+    matrix, translation = transform
+    return (triangles.reshape(-1, 3) @ matrix + translation).astype(np.float32).reshape(-1, 3, 3)
+
+
+def _load_3mf(path):
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as e:
+        raise MeshError(f"3MF non valido: {path}") from e
+    with archive:
+        model_names = [n for n in archive.namelist() if n.lower().endswith(".model")]
+        if not model_names:
+            raise MeshError(f"Nessun modello nel 3MF: {path}")
+        name = "3D/3dmodel.model" if "3D/3dmodel.model" in model_names else model_names[0]
+        root = ET.fromstring(archive.read(name))
+
+    ns = _3MF_NAMESPACE
+    meshes, components = {}, {}
+    for obj in root.iter(f"{ns}object"):
+        object_id = obj.get("id")
+        mesh = obj.find(f"{ns}mesh")
+        if mesh is not None:
+            vertices = np.array([(v.get("x"), v.get("y"), v.get("z")) for v in mesh.iter(f"{ns}vertex")],
+                                dtype=np.float64).reshape(-1, 3)
+            faces = np.array([(t.get("v1"), t.get("v2"), t.get("v3")) for t in mesh.iter(f"{ns}triangle")],
+                             dtype=np.int64).reshape(-1, 3)
+            meshes[object_id] = vertices[faces].astype(np.float32)
+        else:
+            components[object_id] = [(c.get("objectid"), _parse_transform(c.get("transform")))
+                                     for c in obj.iter(f"{ns}component")]
+
+    def resolve(object_id, depth=0):
+        if object_id in meshes:
+            return meshes[object_id]
+        if depth > 16 or object_id not in components:
+            return np.zeros((0, 3, 3), dtype=np.float32)
+        parts = [_apply_transform(resolve(child, depth + 1), transform) for child, transform in components[object_id]]
+        return np.concatenate(parts) if parts else np.zeros((0, 3, 3), dtype=np.float32)
+
+    items = [(item.get("objectid"), _parse_transform(item.get("transform"))) for item in root.iter(f"{ns}item")]
+    if not items:
+        items = [(object_id, None) for object_id in meshes]
+    parts = [_apply_transform(resolve(object_id), transform) for object_id, transform in items]
+    if not parts:
+        raise MeshError(f"Nessuna mesh nel 3MF: {path}")
+    return np.concatenate(parts)
+
+
+def load_mesh(path):
+    """
+    Loads a model as an (n, 3, 3) float32 array of triangles.
+
+    Args:
+        path (str): Path of a .stl (binary or ASCII) or .3mf file.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".stl":
+        triangles = _load_stl(path)
+    elif extension == ".3mf":
+        triangles = _load_3mf(path)
+    else:
+        raise MeshError(f"Formato non supportato: {extension} (supportati: {', '.join(SUPPORTED_EXTENSIONS)})")
+    if len(triangles) == 0:
+        raise MeshError(f"La mesh non contiene triangoli: {path}")
+    return triangles
+
+
+# --- Analisi ---
+def vertex_arrays(triangles):
+    """
+    Converts (n, 3, 3) triangles to a contiguous (vertex, axis, n) array.
+
+    Reductions over the interleaved STL layout are strided and several times
+    slower; with this layout every V[k, axis] is a contiguous float32 array.
+    """
+    return np.ascontiguousarray(np.asarray(triangles, dtype=np.float32).transpose(1, 2, 0))
+
+
+def bounding_box(V):
+    """Returns (min, max) corners of the mesh as float64 arrays."""
+    lo = np.array([min(V[0, a].min(), V[1, a].min(), V[2, a].min()) for a in range(3)], dtype=np.float64)
+    hi = np.array([max(V[0, a].max(), V[1, a].max(), V[2, a].max()) for a in range(3)], dtype=np.float64)
+    return lo, hi
+
+
+def face_normals(V):
+    """Returns the unnormalized normals (3, n) and the areas (n,) of the triangles."""
+    a, b = V[1] - V[0], V[2] - V[0]
+    normals = np.empty_like(a)
+    normals[0] = a[1] * b[2] - a[2] * b[1]
+    normals[1] = a[2] * b[0] - a[0] * b[2]
+    normals[2] = a[0] * b[1] - a[1] * b[0]
+    areas = 0.5 * np.sqrt(normals[0] * normals[0] + normals[1] * normals[1] + normals[2] * normals[2])
+    return normals, areas
+
+
+def _vertex_keys(V):
+    """Hashes each vertex's exact float32 coordinates into a uint64, shape (3, n)."""
+    bits = (V + np.float32(0.0)).view(np.uint32)  # +0.0 unifica -0.0 e 0.0
+    keys = bits[:, 0].astype(np.uint64) << np.uint64(32)
+    keys |= bits[:, 1]
+    keys *= np.uint64(0x9E3779B97F4A7C15)
+    keys ^= bits[:, 2].astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F) + (keys >> np.uint64(31))
+    return keys
+
+
+def unique_vertices(V):
+    """Returns the distinct vertices of the mesh as an (m, 3) float32 array."""
+    keys = _vertex_keys(V).ravel()
+    _, first = np.unique(keys, return_index=True)
+    return V.transpose(0, 2, 1).reshape(-1, 3)[first]
+
+
+def edge_counts(V):
+    """
+    Counts how many triangles share each edge.
+
+    Returns (open_edges, non_manifold_edges): edges used by one triangle only, and
+    edges used by more than two. A closed manifold mesh has neither.
+    """
+    keys = _vertex_keys(V)
+    a, b = keys.ravel(), keys[[1, 2, 0]].ravel()
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    edges = lo * np.uint64(0x9E3779B97F4A7C15) ^ (hi + (lo >> np.uint64(17)))
+    edges.sort()
+    run_starts = np.flatnonzero(np.concatenate(([True], edges[1:] != edges[:-1])))
+    counts = np.diff(np.append(run_starts, len(edges)))
+    return int(np.count_nonzero(counts == 1)), int(np.count_nonzero(counts > 2))
+
+
+def _ray_hits(V, normals, axis, spacing, origin, shape):
+    """
+    Rasterizes the triangles onto a grid of rays parallel to ``axis``.
+
+    Returns (ray index, depth along the axis, unit normal) for every ray/triangle hit.
+    """
+    u_axis, v_axis = [a for a in range(3) if a != axis]
+    u_all, v_all = V[:, u_axis], V[:, v_axis]
+    scale = np.float32(1.0 / spacing)
+
+    def grid_range(values, start):
+        # Primo e ultimo indice di raggio coperti dal triangolo (calcolati in float32: è il passo più costoso)
+        lo = np.ceil((np.minimum(np.minimum(values[0], values[1]), values[2]) - np.float32(start)) * scale)
+        hi = np.floor((np.maximum(np.maximum(values[0], values[1]), values[2]) - np.float32(start)) * scale)
+        return lo, hi - lo + 1
+
+    lo_u, count_u = grid_range(u_all, origin[0])
+    lo_v, count_v = grid_range(v_all, origin[1])
+
+    # Sulle mesh fini la maggior parte dei triangoli non contiene alcun raggio
+    candidates = np.flatnonzero((count_u > 0) & (count_v > 0) & (normals[axis] != 0))
+    if len(candidates) == 0:
+        return np.zeros(0, np.int64), np.zeros(0), np.zeros((0, 3))
+    lo_u, lo_v = lo_u[candidates].astype(np.int64), lo_v[candidates].astype(np.int64)
+    count_v = count_v[candidates].astype(np.int64)
+    per_tri = count_u[candidates].astype(np.int64) * count_v
+    total = int(per_tri.sum())
+
+    # Una coppia (triangolo, raggio) per ogni raggio nel rettangolo che contiene il triangolo
+    tri = np.repeat(np.arange(len(candidates)), per_tri)
+    offset = np.arange(total) - np.repeat(np.cumsum(per_tri) - per_tri, per_tri)
+    iu = lo_u[tri] + offset // count_v[tri]
+    iv = lo_v[tri] + offset % count_v[tri]
+    pu = origin[0] + iu * spacing
+    pv = origin[1] + iv * spacing
+
+    # Test punto-nel-triangolo con le funzioni di lato (entrambi i versi di avvolgimento)
+    tri = candidates[tri]
+    tu = u_all[:, tri].astype(np.float64)
+    tv = v_all[:, tri].astype(np.float64)
+    sides = [(tu[(k + 1) % 3] - tu[k]) * (pv - tv[k]) - (tv[(k + 1) % 3] - tv[k]) * (pu - tu[k]) for k in range(3)]
+    inside = ((sides[0] >= 0) & (sides[1] >= 0) & (sides[2] >= 0)) | ((sides[0] <= 0) & (sides[1] <= 0) & (sides[2] <= 0))
+    tri, iu, iv, pu, pv = tri[inside], iu[inside], iv[inside], pu[inside], pv[inside]
+
+    # Profondità lungo l'asse dal piano del triangolo
+    n = normals[:, tri].T.astype(np.float64)
+    p0 = V[0][:, tri].T.astype(np.float64)
+    depth = p0[:, axis] - (n[:, u_axis] * (pu - p0[:, u_axis]) + n[:, v_axis] * (pv - p0[:, v_axis])) / n[:, axis]
+    unit = n / np.linalg.norm(n, axis=1)[:, None]
+    return iu * shape[1] + iv, depth, unit
+
+
+def thin_walls(V, normals, min_wall=DEFAULT_MIN_WALL, resolution=DEFAULT_RAY_RESOLUTION):
+    """
+    Finds thin-wall candidates by casting a grid of rays along X, Y and Z.
+
+    Each ray's hits are sorted by depth; an entering hit followed by an exiting
+    one spans solid material, whose length is the wall thickness along that axis
+    (an upper bound of the true thickness for slanted walls). Only spans between
+    roughly opposite faces count, so rays grazing a curved silhouette are ignored.
+
+    Returns:
+        dict: number of thin samples, their approximate area, the minimum
+        thickness measured and the region (bounding box) that contains them.
+    """
+    bbox_min, bbox_max = bounding_box(V)
+    spacing = max(float((bbox_max - bbox_min).max()) / resolution, 1e-3)
+    # Lo scostamento irrazionale evita raggi che passano esattamente su vertici e spigoli
+    jitter = spacing * 0.5 + spacing * 1e-3 * np.sqrt(2)
+
+    samples, min_thickness = 0, np.inf
+    region_min, region_max = np.full(3, np.inf), np.full(3, -np.inf)
+    for axis in range(3):
+        u_axis, v_axis = [a for a in range(3) if a != axis]
+        origin = (bbox_min[u_axis] - jitter, bbox_min[v_axis] - jitter)
+        shape = (int((bbox_max[u_axis] - origin[0]) / spacing) + 2, int((bbox_max[v_axis] - origin[1]) / spacing) + 2)
+        ray, depth, unit = _ray_hits(V, normals, axis, spacing, origin, shape)
+        if len(ray) < 2:
+            continue
+        order = np.lexsort((depth, ray))
+        ray, depth, unit = ray[order], depth[order], unit[order]
+        entering = unit[:, axis] < 0
+        opposite = np.einsum("ij,ij->i", unit[:-1], unit[1:]) < WALL_FACES_MAX_DOT
+        solid = (ray[:-1] == ray[1:]) & entering[:-1] & ~entering[1:] & opposite
+        thickness = (depth[1:] - depth[:-1])[solid]
+        thin = thickness < min_wall
+        if not thin.any():
+            continue
+        samples += int(thin.sum())
+        min_thickness = min(min_thickness, float(thickness[thin].min()))
+
+        thin_rays = ray[:-1][solid][thin]
+        points = np.empty((len(thin_rays), 3))
+        points[:, u_axis] = origin[0] + (thin_rays // shape[1]) * spacing
+        points[:, v_axis] = origin[1] + (thin_rays % shape[1]) * spacing
+        points[:, axis] = depth[:-1][solid][thin]
+        region_min = np.minimum(region_min, points.min(axis=0))
+        region_max = np.maximum(region_max, points.max(axis=0))
+
+    return {
+        "min_wall_mm": min_wall,
+        "samples": samples,
+        "area_mm2": round(samples * spacing * spacing, 1),
+        "min_thickness_mm": round(min_thickness, 3) if samples else None,
+        "region_mm": {
+            "min": [round(c, 2) for c in region_min.tolist()],
+            "max": [round(c, 2) for c in region_max.tolist()],
+        } if samples else None,
+        "ray_spacing_mm": round(spacing, 3),
+    }
+
+
+def overhang_areas(V, normals, areas, overhang_angle=DEFAULT_OVERHANG_ANGLE):
+    """
+    Splits the downward-facing area into overhangs and bed contact.
+
+    A face needs support when it is tilted more than ``overhang_angle`` degrees
+    from vertical, i.e. its unit normal has z < -sin(angle), and it is not lying
+    on the bed.
+
+    Returns:
+        tuple: (overhang area, bed contact area) in mm².
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        nz = normals[2] / (2.0 * areas)
+    downward = nz < -np.sin(np.radians(overhang_angle))
+    z = V[:, 2]
+    top = np.maximum(np.maximum(z[0], z[1]), z[2])
+    on_bed = top <= min(z[0].min(), z[1].min(), z[2].min()) + BED_TOLERANCE
+    overhang = float(areas[downward & ~on_bed].sum(dtype=np.float64))
+    bed_contact = float(areas[on_bed & (nz < -0.999)].sum(dtype=np.float64))
+    return overhang, bed_contact
+
+
+def signed_volume(V, normals, center):
+    """Mesh volume in mm³ (divergence theorem); negative if the faces are inside out."""
+    # Centrare la mesh limita l'errore di arrotondamento dei float32
+    per_triangle = sum((V[0, a] - np.float32(center[a])) * normals[a] for a in range(3))
+    return float(per_triangle.sum(dtype=np.float64)) / 6.0
+
+
+def summarize(triangles):
+    """Cheap statistics (no edge or wall analysis) for indexing large model collections."""
+    V = vertex_arrays(triangles)
+    normals, areas = face_normals(V)
+    bbox_min, bbox_max = bounding_box(V)
+    volume = signed_volume(V, normals, (bbox_min + bbox_max) / 2)
+    return {
+        "triangles": int(len(triangles)),
+        "size_mm": [round(c, 3) for c in (bbox_max - bbox_min).tolist()],
+        "volume_cm3": round(abs(volume) / 1000.0, 3),
+        "surface_area_mm2": round(float(areas.sum(dtype=np.float64)), 1),
+    }
+
+
+def analyze_triangles(triangles, overhang_angle=DEFAULT_OVERHANG_ANGLE, min_wall=DEFAULT_MIN_WALL,
+                      resolution=DEFAULT_RAY_RESOLUTION):
+    """Printability statistics for an (n, 3, 3) triangle array; see analyze()."""
+    V = vertex_arrays(triangles)
+    normals, areas = face_normals(V)
+    bbox_min, bbox_max = bounding_box(V)
+    volume = signed_volume(V, normals, (bbox_min + bbox_max) / 2)
+    surface = float(areas.sum(dtype=np.float64))
+    overhang, bed_contact = overhang_areas(V, normals, areas, overhang_angle)
+    open_edges, non_manifold_edges = edge_counts(V)
+    walls = thin_walls(V, normals, min_wall, resolution)
+
+    warnings = []
+    if open_edges or non_manifold_edges:
+        warnings.append(f"Mesh non chiusa: {open_edges} spigoli aperti, {non_manifold_edges} spigoli non-manifold.")
+    if volume < 0:
+        warnings.append("Normali invertite: il volume risulta negativo.")
+    if walls["samples"]:
+        warnings.append(f"Possibili pareti più sottili di {min_wall} mm (minimo {walls['min_thickness_mm']} mm).")
+    if overhang > 0.05 * surface:
+        warnings.append(f"Il {100 * overhang / surface:.0f}% della superficie è in sbalzo oltre {overhang_angle:g}°: servono supporti o un'altra orientazione.")
+    if bed_contact < 0.001 * surface:
+        warnings.append("Superficie di appoggio sul piatto minima: rischio di distacco.")
+
+    return {
+        "triangles": int(len(triangles)),
+        "bounding_box_mm": {
+            "min": [round(c, 3) for c in bbox_min.tolist()],
+            "max": [round(c, 3) for c in bbox_max.tolist()],
+            "size": [round(c, 3) for c in (bbox_max - bbox_min).tolist()],
+        },
+        "volume_cm3": round(abs(volume) / 1000.0, 3),
+        "surface_area_mm2": round(surface, 1),
+        "overhang_angle_deg": overhang_angle,
+        "overhang_area_mm2": round(overhang, 1),
+        "overhang_fraction": round(overhang / surface, 4) if surface else 0.0,
+        "bed_contact_area_mm2": round(bed_contact, 1),
+        "open_edges": open_edges,
+        "non_manifold_edges": non_manifold_edges,
+        "is_watertight": open_edges == 0 and non_manifold_edges == 0,
+        "thin_walls": walls,
+        "warnings": warnings,
+    }
+
+
+def analyze(path, overhang_angle=DEFAULT_OVERHANG_ANGLE, min_wall=DEFAULT_MIN_WALL,
+            resolution=DEFAULT_RAY_RESOLUTION):
+    """
+    Loads a model and reports its printability.
+
+    Args:
+        path (str): Path of a .stl or .3mf file.
+        overhang_angle (float): Degrees from vertical beyond which a downward face needs support.
+        min_wall (float): Walls thinner than this (mm) are reported as candidates.
+        resolution (int): Rays per side of the grid used to measure wall thickness.
+
+    Returns:
+        dict: bounding box, volume, surface, overhang and bed contact area, open and
+        non-manifold edge counts, thin-wall candidates and human-readable warnings.
+    """
+    t0 = time.perf_counter()
+    triangles = load_mesh(path)
+    load_seconds = time.perf_counter() - t0
+    result = analyze_triangles(triangles, overhang_angle, min_wall, resolution)
+    elapsed = time.perf_counter() - t0
+    logging.info(f"Mesh analizzata: {path} ({len(triangles)} triangoli) in {elapsed:.2f}s") # This will be INFO level
+    result.update({
+        "file": path,
+        "format": os.path.splitext(path)[1].lower().lstrip("."),
+        "load_seconds": round(load_seconds, 3),
+        "analysis_seconds": round(elapsed, 3),
+    })
+    return result
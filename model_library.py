@@ -0,0 +1,449 @@
+# model_library.py
+"""
+Indice persistente (SQLite) dei modelli 3D della cartella predefinita e delle
+sue sottocartelle.
+
+Per ogni modello l'indice conserva percorso, dimensione, data di modifica,
+hash SHA-256 e statistiche della mesh (triangoli, ingombro, volume). Gli id
+sono stabili: un file mantiene il proprio id anche se viene spostato o
+rinominato (riconosciuto dall'hash), e gli id dei file rimossi non vengono
+riassegnati. Le ricerche per nome usano un indice di trigrammi, quindi
+rispondono in millisecondi anche con decine di migliaia di file.
+
+L'aggiornamento è incrementale: una scansione confronta dimensione e mtime
+dei file con l'indice, mentre hash e statistiche vengono calcolati in
+background solo per i file nuovi o modificati. Se il pacchetto opzionale
+``watchdog`` è installato, le modifiche alla cartella avviano subito una
+nuova scansione; altrimenti la cartella viene riletta periodicamente.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import difflib
+import threading
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # watchdog è opzionale: senza, si usa la scansione periodica
+    Observer = None
+    FileSystemEventHandler = object
+
+MODEL_EXTENSIONS = (".stl", ".3mf", ".obj")
+DEFAULT_DB_PATH = ".model_library.db"
+DEFAULT_RESCAN_SECONDS = 60
+MIN_RESCAN_INTERVAL_SECONDS = 10   # scansioni su richiesta (modello non trovato) al massimo una ogni tot secondi
+HASH_CHUNK_SIZE = 1024 * 1024
+SEARCH_CANDIDATES = 200     # modelli preselezionati dai trigrammi in comune
+RERANK_CANDIDATES = 25      # di questi, quanti vengono confrontati con difflib
+WATCH_DEBOUNCE_SECONDS = 2.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT,
+    stats TEXT,
+    missing INTEGER NOT NULL DEFAULT 0,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS models_name ON models(name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS models_sha256 ON models(sha256);
+CREATE TABLE IF NOT EXISTS name_trigrams (
+    trigram TEXT NOT NULL,
+    model_id INTEGER NOT NULL,
+    PRIMARY KEY (trigram, model_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS name_trigrams_model ON name_trigrams(model_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def normalize_name(name):
+    """Lowercases a file name, drops the extension and turns separators into spaces."""
+    base = os.path.splitext(os.path.basename(name))[0].lower()
+    return " ".join(re.split(r"[^0-9a-zà-ù]+", base)).strip()
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _match_score(query, name):
+    """Similarity in [0, 1] between a normalized query and a normalized model name."""
+    score = difflib.SequenceMatcher(None, query, name).ratio()
+    if query and query in name:
+        score = max(score, 0.9)
+    tokens = query.split()
+    if tokens:
+        name_tokens = name.split()
+        # Ogni parola della richiesta vale quanto la parola più simile del nome
+        coverage = sum(max((difflib.SequenceMatcher(None, t, n).ratio() for n in name_tokens), default=0.0)
+                       for t in tokens) / len(tokens)
+        score = max(score, 0.7 * coverage + 0.3 * score)
+    return score
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    """Wakes the background scanner when something changes under the root."""
+
+    def __init__(self, wake_event):
+        self._wake_event = wake_event
+
+    def on_any_event(self, event):
+        self._wake_event.set()
+
+
+class ModelLibrary:
+    """
+    SQLite index of the models under ``root``.
+
+    Lookups (get, find_by_name, search, list) only query the database; scan()
+    brings it up to date with the filesystem and enrich() fills in hashes and
+    mesh statistics. start() runs both in a daemon thread.
+    """
+
+    def __init__(self, root, db_path, rescan_seconds=DEFAULT_RESCAN_SECONDS):
+        self.root = os.path.abspath(root)
+        self.db_path = db_path
+        self.rescan_seconds = rescan_seconds
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._observer = None
+
+    def _under_root(self, path):
+        # Con il separatore finale, così la radice /models non comprende anche /models_old
+        return path.startswith(os.path.join(self.root, ""))
+
+    # --- Metadati ---
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    # --- Scansione ---
+    def _walk(self):
+        """Yields (path, size, mtime_ns) for every model file under the root."""
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.name.startswith("."):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(MODEL_EXTENSIONS):
+                            st = entry.stat()
+                            yield entry.path, st.st_size, st.st_mtime_ns
+            except OSError as e:
+                logging.warning(f"Impossibile leggere la cartella {directory}: {e}")
+
+    def _index_name(self, model_id, path):
+        self._conn.execute("DELETE FROM name_trigrams WHERE model_id = ?", (model_id,))
+        self._conn.executemany("INSERT INTO name_trigrams (trigram, model_id) VALUES (?, ?)",
+                               [(t, model_id) for t in _trigrams(normalize_name(path))])
+
+    def scan(self):
+        """
+        Synchronizes the index with the filesystem using size and mtime.
+
+        Returns:
+            dict: counts of added, updated, moved and removed models and the scan time.
+        """
+        t0 = time.perf_counter()
+        found = {path: (size, mtime) for path, size, mtime in self._walk()}
+        now = time.time()
+        counts = {"added": 0, "updated": 0, "moved": 0, "removed": 0}
+        removed = set()   # id segnati come mancanti da questa scansione (tolti se risultano spostati)
+
+        with self._lock, self._conn:
+            known = {row["path"]: row for row in self._conn.execute(
+                "SELECT id, path, name, size, mtime_ns, sha256, missing FROM models")}
+
+            for path, row in known.items():
+                if path not in found and not row["missing"] and self._under_root(path):
+                    self._conn.execute("UPDATE models SET missing = 1 WHERE id = ?", (row["id"],))
+                    self._conn.execute("DELETE FROM name_trigrams WHERE model_id = ?", (row["id"],))
+                    removed.add(row["id"])
+
+            new_paths = []
+            for path, (size, mtime) in found.items():
+                row = known.get(path)
+                if row is None:
+                    new_paths.append(path)
+                elif row["size"] != size or row["mtime_ns"] != mtime:
+                    self._conn.execute(
+                        "UPDATE models SET size = ?, mtime_ns = ?, sha256 = NULL, stats = NULL, missing = 0, last_seen = ? WHERE id = ?",
+                        (size, mtime, now, row["id"]))
+                    counts["updated"] += 1
+                elif row["missing"]:
+                    self._conn.execute("UPDATE models SET missing = 0, last_seen = ? WHERE id = ?", (now, row["id"]))
+                if row is not None and row["missing"]:
+                    self._index_name(row["id"], path)
+
+            # Un file nuovo con stessa dimensione e hash di uno scomparso è uno spostamento e mantiene l'id
+            # (se l'hash non è ancora stato calcolato, basta lo stesso nome)
+            vanished = {}
+            if new_paths:
+                for row in self._conn.execute("SELECT id, name, size, sha256 FROM models WHERE missing = 1"):
+                    vanished.setdefault(row["size"], []).append(row)
+            for path in new_paths:
+                size, mtime = found[path]
+                candidates = vanished.get(size, [])
+                moved_from = next((c for c in candidates if c["sha256"] is None and c["name"] == os.path.basename(path)), None)
+                if moved_from is None and any(c["sha256"] for c in candidates):
+                    try:
+                        digest = file_sha256(path)
+                        moved_from = next((c for c in candidates if c["sha256"] == digest), None)
+                    except OSError:
+                        pass
+                if moved_from is not None:
+                    candidates.remove(moved_from)
+                    self._conn.execute(
+                        "UPDATE models SET path = ?, name = ?, mtime_ns = ?, missing = 0, last_seen = ? WHERE id = ?",
+                        (path, os.path.basename(path), mtime, now, moved_from["id"]))
+                    self._index_name(moved_from["id"], path)
+                    counts["moved"] += 1
+                    removed.discard(moved_from["id"])
+                else:
+                    cursor = self._conn.execute(
+                        "INSERT INTO models (path, name, size, mtime_ns, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?)",
+                        (path, os.path.basename(path), size, mtime, now, now))
+                    self._index_name(cursor.lastrowid, path)
+                    counts["added"] += 1
+
+            self._set_meta("root", self.root)
+            self._set_meta("last_scan", now)
+
+        counts["removed"] = len(removed)
+        counts["models"] = len(found)
+        counts["seconds"] = round(time.perf_counter() - t0, 3)
+        if any(counts[k] for k in ("added", "updated", "moved", "removed")):
+            logging.info(f"Libreria modelli aggiornata: {counts}") # This will be INFO level
+        return counts
+
+    def ensure_scanned(self):
+        """Runs a first scan if this root has never been indexed."""
+        with self._lock:
+            indexed = self._get_meta("last_scan") and self._get_meta("root") == self.root
+        if not indexed:
+            self.scan()
+
+    def rescan_if_stale(self, min_interval=MIN_RESCAN_INTERVAL_SECONDS):
+        """
+        Scans now unless the last scan is more recent than min_interval seconds, so that repeated
+        lookups of a missing model do not walk the whole folder every time.
+
+        Returns:
+            dict: The scan counts, or None if the index was fresh enough.
+        """
+        with self._lock:
+            last_scan = self._get_meta("last_scan")
+        if last_scan and time.time() - float(last_scan) < min_interval:
+            return None
+        return self.scan()
+
+    def enrich(self, limit=None):
+        """Computes hash and mesh statistics for new or modified models. Returns how many were processed."""
+        with self._lock:
+            query = "SELECT id, path, size, mtime_ns FROM models WHERE missing = 0 AND (sha256 IS NULL OR stats IS NULL) ORDER BY id"
+            rows = self._conn.execute(query + (f" LIMIT {int(limit)}" if limit else "")).fetchall()
+
+        processed = 0
+        for row in rows:
+            if self._stop_event.is_set():
+                break
+            path = row["path"]
+            try:
+                digest = file_sha256(path)
+            except OSError:
+                continue
+            try:
+                import mesh_analysis # NumPy: importato solo quando c'è un modello da indicizzare
+                stats = mesh_analysis.summarize(mesh_analysis.load_mesh(path))
+            except Exception as e:
+                stats = {"error": str(e)}
+            with self._lock, self._conn:
+                # Il file potrebbe essere cambiato nel frattempo: in quel caso se ne occuperà la prossima scansione
+                self._conn.execute(
+                    "UPDATE models SET sha256 = ?, stats = ? WHERE id = ? AND size = ? AND mtime_ns = ?",
+                    (digest, json.dumps(stats), row["id"], row["size"], row["mtime_ns"]))
+            processed += 1
+        return processed
+
+    # --- Aggiornamento in background ---
+    def start(self):
+        """Starts the background scan/enrich loop (and the watchdog observer if available)."""
+        if self._thread is not None:
+            return
+        if Observer is not None:
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_ChangeHandler(self._wake_event), self.root, recursive=True)
+                self._observer.daemon = True
+                self._observer.start()
+            except Exception as e:
+                logging.warning(f"Watcher della libreria modelli non disponibile, uso la scansione periodica: {e}")
+                self._observer = None
+        self._thread = threading.Thread(target=self._background_loop, name="model-library", daemon=True)
+        self._thread.start()
+
+    def _background_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self.scan()
+                self.enrich()
+            except Exception as e:
+                logging.error(f"Errore nell'aggiornamento della libreria modelli: {e}")
+            self._wake_event.wait(self.rescan_seconds)
+            if self._wake_event.is_set():
+                # Raggruppa le raffiche di eventi (copia di molti file, salvataggi)
+                time.sleep(WATCH_DEBOUNCE_SECONDS)
+                self._wake_event.clear()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._observer is not None:
+            self._observer.stop()
+
+    # --- Interrogazioni ---
+    def _to_dict(self, row):
+        model = dict(row)
+        model["relative_path"] = os.path.relpath(model["path"], self.root) if self._under_root(model["path"]) else model["path"]
+        model["stats"] = json.loads(model["stats"]) if model.get("stats") else None
+        model["missing"] = bool(model["missing"])
+        return model
+
+    def get(self, model_id):
+        """Returns the model with this id, or None if unknown or no longer on disk."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM models WHERE id = ? AND missing = 0", (int(model_id),)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def find_by_name(self, name):
+        """Exact (case-insensitive) match on the file name or on the path relative to the root."""
+        relative = os.path.normpath(name)
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM models WHERE path = ? AND missing = 0",
+                                     (os.path.join(self.root, relative),)).fetchone()
+            if row is None:
+                row = self._conn.execute(
+                    "SELECT * FROM models WHERE name = ? COLLATE NOCASE AND missing = 0 ORDER BY id LIMIT 1",
+                    (os.path.basename(relative),)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def search(self, query, limit=10):
+        """
+        Fuzzy search on model names, tolerant to typos and transcription errors.
+
+        Returns:
+            list: models sorted by decreasing similarity, each with a ``score`` in [0, 1].
+        """
+        normalized = normalize_name(query)
+        trigrams = list(_trigrams(normalized))
+        if not trigrams:
+            return []
+        placeholders = ",".join("?" * len(trigrams))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT m.*, t.hits FROM (
+                        SELECT model_id, COUNT(*) AS hits FROM name_trigrams WHERE trigram IN ({placeholders})
+                        GROUP BY model_id ORDER BY hits DESC LIMIT {SEARCH_CANDIDATES}
+                    ) t JOIN models m ON m.id = t.model_id WHERE m.missing = 0""",
+                trigrams).fetchall()
+        # Preordino con i trigrammi (economico) e confronto con difflib solo i migliori
+        def overlap(row):
+            name_trigrams = _trigrams(normalize_name(row["name"]))
+            return row["hits"] / len(trigrams) + 0.1 * 2 * row["hits"] / (len(trigrams) + len(name_trigrams))
+        results = []
+        for row in sorted(rows, key=overlap, reverse=True)[:max(limit, RERANK_CANDIDATES)]:
+            model = self._to_dict(row)
+            model.pop("hits", None)
+            model["score"] = round(_match_score(normalized, normalize_name(model["name"])), 3)
+            results.append(model)
+        results.sort(key=lambda m: (-m["score"], m["id"]))
+        return results[:limit]
+
+    def list(self, limit=None, offset=0):
+        """Models currently on disk, ordered by relative path."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM models WHERE missing = 0 ORDER BY path LIMIT ? OFFSET ?",
+                (limit if limit is not None else -1, offset)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM models WHERE missing = 0").fetchone()[0]
+
+    def status(self):
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT COUNT(*) FROM models WHERE missing = 0 AND (sha256 IS NULL OR stats IS NULL)").fetchone()[0]
+            last_scan = self._get_meta("last_scan")
+        return {
+            "root": self.root,
+            "models": self.count(),
+            "pending_enrichment": pending,
+            "last_scan": float(last_scan) if last_scan else None,
+            "watching": self._observer is not None,
+        }
+
+
+_default_library = None
+_default_library_lock = threading.Lock()
+
+def get_default_library():
+    """
+    Returns the process-wide library for STL_DEFAULT_FOLDER (None if not configured),
+    scanning it on first use and starting the background updater.
+    """
+    global _default_library
+    root = os.getenv("STL_DEFAULT_FOLDER")
+    if not root or not os.path.isdir(root):
+        return None
+    with _default_library_lock:
+        if _default_library is None or _default_library.root != os.path.abspath(root):
+            if _default_library is not None:
+                _default_library.stop()
+            library = ModelLibrary(
+                root,
+                os.getenv("MODEL_LIBRARY_DB", DEFAULT_DB_PATH),
+                rescan_seconds=float(os.getenv("MODEL_LIBRARY_RESCAN_SECONDS", DEFAULT_RESCAN_SECONDS)),
+            )
+            library.ensure_scanned()
+            library.start()
+            _default_library = library
+        return _default_library
@@ -0,0 +1,440 @@
+# octoprint_client.py
+"""
+Client HTTP condiviso per l'API REST di OctoPrint.
+
+Tutte le chiamate passano da una ``requests.Session`` con connessioni
+keep-alive in pool, timeout di connessione e lettura (una stampante spenta non
+blocca più l'assistente) e tentativi ripetuti con backoff esponenziale. Gli
+errori di connessione vengono ritentati per ogni metodo; gli errori di lettura
+e le risposte 502/503/504 solo per le richieste idempotenti, così un comando
+di stampa non può essere inviato due volte.
+
+I file G-code vengono caricati in streaming (multipart costruito a blocchi,
+memoria costante) con avanzamento, e il caricamento viene saltato se sulla
+stampante c'è già un file identico (stesso hash SHA-1).
+
+Per ogni endpoint il client tiene statistiche di latenza (numero di chiamate,
+errori, tentativi ripetuti, media, p50/p95 e massimo).
+
+Più stampanti (una farm) si descrivono in printers.json: il registro crea un
+client per stampante e interroga lo stato di tutte in parallelo.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import deque
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5    # attese di 0.5s, 1s, 2s... tra i tentativi
+DEFAULT_POOL_SIZE = 10
+RETRY_STATUS_CODES = (502, 503, 504)
+LATENCY_SAMPLES = 500           # campioni conservati per endpoint per i percentili
+DEFAULT_PRINTERS_FILE = "printers.json"
+DEFAULT_PRINTER_NAME = "default"
+STATUS_TIMEOUT = (2.0, 3.0)     # timeout (connessione, lettura) per lo stato della farm
+UPLOAD_TIMEOUT = (5.0, 120.0)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class MultipartFileStream:
+    """
+    File-like multipart/form-data body that reads the file in chunks while it is sent.
+
+    ``requests`` streams objects with ``read()`` and ``__len__`` using a
+    Content-Length header, so memory use stays at one chunk regardless of the
+    file size. ``progress(sent_bytes, total_bytes)`` is called after every chunk.
+    """
+
+    def __init__(self, path, fields, file_field="file", filename=None, progress=None, chunk_size=UPLOAD_CHUNK_SIZE):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        filename = filename or os.path.basename(path)
+        head = b"".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            for name, value in fields.items()
+        )
+        head += (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                 f"Content-Type: application/octet-stream\r\n\r\n").encode()
+        self._parts = [head, None, f"\r\n--{self.boundary}--\r\n".encode()]
+        self._file = open(path, "rb")
+        self._length = len(head) + os.fstat(self._file.fileno()).st_size + len(self._parts[2])
+        self._index = 0
+        self._offset = 0
+        self._sent = 0
+        self._progress = progress
+        self._chunk_size = chunk_size
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._chunk_size
+        data = b""
+        while not data and self._index < len(self._parts):
+            part = self._parts[self._index]
+            if part is None:
+                data = self._file.read(min(size, self._chunk_size))
+                if not data:
+                    self._index += 1
+            else:
+                data = part[self._offset:self._offset + size]
+                self._offset += len(data)
+                if self._offset >= len(part):
+                    self._index, self._offset = self._index + 1, 0
+        self._sent += len(data)
+        if data and self._progress:
+            self._progress(self._sent, self._length)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def file_sha1(path):
+    """SHA-1 of a file, the hash OctoPrint reports for stored files."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class _EndpointStats:
+    """Latency counters for one endpoint, with a bounded window of samples for percentiles."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, seconds, ok, retries):
+        self.calls += 1
+        self.errors += 0 if ok else 1
+        self.retries += retries
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.samples.append(seconds)
+
+    def to_dict(self):
+        ordered = sorted(self.samples)
+
+        def percentile(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1) if ordered else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "mean_ms": round(self.total_seconds / self.calls * 1000, 1) if self.calls else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(self.max_seconds * 1000, 1),
+        }
+
+
+class OctoPrintClient:
+    """
+    Pooled, keep-alive client for one OctoPrint instance.
+
+    Requests raise ``requests.exceptions.RequestException`` subclasses on
+    network errors and HTTP error statuses, like plain ``requests`` with
+    ``raise_for_status()``, so callers keep their existing error handling.
+    """
+
+    def __init__(self, base_url, api_key, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR, pool_size=DEFAULT_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.name = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers.update({"X-Api-Key": api_key})
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            raise_on_status=False,  # l'ultima risposta arriva al chiamante, che chiama raise_for_status
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Sessione senza tentativi ripetuti per le interrogazioni periodiche (stato della farm),
+        # dove rispondere subito "offline" è meglio che aspettare il backoff
+        self._single_try_session = requests.Session()
+        self._single_try_session.headers.update({"X-Api-Key": api_key})
+        single_try = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self._single_try_session.mount("http://", single_try)
+        self._single_try_session.mount("https://", single_try)
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def request(self, method, path, endpoint=None, timeout=None, retry=True, **kwargs):
+        """
+        Sends a request to ``base_url + path`` and returns the response.
+
+        Args:
+            method (str): HTTP method.
+            path (str): API path, e.g. "/api/job".
+            endpoint (str, optional): Label for the latency metrics, e.g.
+                "/api/slicing/profiles/{slicer}"; defaults to the path.
+            timeout (float or tuple, optional): Overrides the client's (connect, read) timeout.
+            retry (bool): Set to False to fail at the first error instead of retrying.
+            **kwargs: Passed to ``requests.Session.request`` (params, json, files...).
+        """
+        label = f"{method.upper()} {endpoint or path}"
+        start = time.perf_counter()
+        ok, retries = False, 0
+        try:
+            session = self.session if retry else self._single_try_session
+            response = session.request(method, self.base_url + path, timeout=timeout or self.timeout, **kwargs)
+            history = getattr(getattr(response.raw, "retries", None), "history", None)
+            retries = len(history) if history else 0
+            response.raise_for_status()
+            ok = True
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self._stats.setdefault(label, _EndpointStats()).record(elapsed, ok, retries)
+            logging.info(f"OctoPrint {label}: {elapsed * 1000:.0f} ms{'' if ok else ' (errore)'}") # This will be INFO level
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def upload(self, local_path, remote_name=None, location="local", select=False, print_after=False,
+               progress=None, skip_identical=True, timeout=UPLOAD_TIMEOUT):
+        """
+        Streams a file to ``/api/files/{location}`` as multipart/form-data.
+
+        Args:
+            local_path (str): File to upload.
+            remote_name (str, optional): Name on OctoPrint (may include folders). Defaults to the local name.
+            location (str): "local" or "sdcard".
+            select (bool): Select the file after the upload.
+            print_after (bool): Start printing it after the upload.
+            progress (callable, optional): Called as progress(sent_bytes, total_bytes).
+            skip_identical (bool): Skip the transfer if OctoPrint already has a file with this
+                                   name and the same SHA-1 (selection/printing still happen).
+            timeout (tuple): (connect, read) timeout; the read timeout applies between chunks.
+
+        Returns:
+            dict: remote name, bytes sent, whether the transfer was skipped, and seconds.
+        """
+        remote_name = remote_name or os.path.basename(local_path)
+        start = time.perf_counter()
+        size = os.path.getsize(local_path)
+        if skip_identical and self._has_identical_file(local_path, remote_name, location):
+            if select or print_after:
+                self.post(f"/api/files/{location}/{quote(remote_name)}", endpoint="/api/files/{location}/{path}",
+                          json={"command": "select", "print": bool(print_after)})
+            if progress:
+                progress(size, size)
+            return {"remote_name": remote_name, "bytes": 0, "skipped": True, "seconds": round(time.perf_counter() - start, 3)}
+
+        folder, filename = os.path.split(remote_name)
+        fields = {"select": "true" if select or print_after else "false", "print": "true" if print_after else "false"}
+        if folder:
+            fields["path"] = folder
+        body = MultipartFileStream(local_path, fields, filename=filename, progress=progress)
+        try:
+            # Senza tentativi ripetuti: il corpo è uno stream e non può essere rispedito
+            self.post(f"/api/files/{location}", endpoint="/api/files/{location}", timeout=timeout, retry=False,
+                      data=body, headers={"Content-Type": body.content_type})
+        finally:
+            body.close()
+        elapsed = time.perf_counter() - start
+        logging.info(f"Caricato {remote_name} su {self.name}: {size / 1e6:.1f} MB in {elapsed:.1f}s") # This will be INFO level
+        return {"remote_name": remote_name, "bytes": size, "skipped": False, "seconds": round(elapsed, 3)}
+
+    def _has_identical_file(self, local_path, remote_name, location):
+        try:
+            info = self.get(f"/api/files/{location}/{quote(remote_name)}", endpoint="/api/files/{location}/{path}", retry=False).json()
+        except (requests.exceptions.RequestException, ValueError):
+            return False  # 404: il file non c'è
+        if info.get("size") is not None and info["size"] != os.path.getsize(local_path):
+            return False
+        return bool(info.get("hash")) and info["hash"] == file_sha1(local_path)
+
+    def metrics(self):
+        """Latency statistics per endpoint ("METHOD path")."""
+        with self._stats_lock:
+            return {label: stats.to_dict() for label, stats in sorted(self._stats.items())}
+
+    def close(self):
+        self.session.close()
+        self._single_try_session.close()
+
+
+class PrinterRegistry:
+    """
+    Named OctoPrint instances, each with its own pooled client.
+
+    The registry is read from a JSON file (PRINTERS_FILE, default printers.json)::
+
+        {
+          "default": "mk3s-1",
+          "printers": [
+            {"name": "mk3s-1", "url": "http://192.168.1.21", "api_key": "..."},
+            {"name": "mk3s-2", "url": "http://192.168.1.22", "api_key_env": "OCTOPRINT_KEY_MK3S_2"}
+          ]
+        }
+
+    ``api_key_env`` names an environment variable holding the key, so keys can
+    stay in .env. Without the file, OCTOPRINT_URL/OCTOPRINT_API_KEY define a
+    single printer called "default".
+    """
+
+    def __init__(self, printers, default=None, **client_options):
+        self._printers = {p["name"]: p for p in printers}
+        self.default = default or (printers[0]["name"] if printers else None)
+        self._client_options = client_options
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path=None, **client_options):
+        path = path or os.getenv("PRINTERS_FILE", DEFAULT_PRINTERS_FILE)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                config = json.load(f)
+            printers = []
+            for entry in config.get("printers", []):
+                api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env", ""), "")
+                if not entry.get("name") or not entry.get("url") or not api_key:
+                    logging.warning(f"Stampante ignorata in {path} (servono name, url e api_key/api_key_env): {entry.get('name')}")
+                    continue
+                printers.append({"name": entry["name"], "url": entry["url"], "api_key": api_key})
+            return cls(printers, config.get("default"), **client_options)
+
+        base_url = os.getenv("OCTOPRINT_URL")
+        api_key = os.getenv("OCTOPRINT_API_KEY")
+        printers = [{"name": DEFAULT_PRINTER_NAME, "url": base_url, "api_key": api_key}] if base_url and api_key else []
+        return cls(printers, **client_options)
+
+    def names(self):
+        return list(self._printers)
+
+    def get_client(self, name=None):
+        """Returns the client for a printer (the default one if name is None), or None if unknown."""
+        name = name or self.default
+        printer = self._printers.get(name)
+        if printer is None:
+            # Tollera differenze di maiuscole nei nomi pronunciati
+            printer = next((p for n, p in self._printers.items() if n.lower() == str(name).lower()), None)
+            if printer is None:
+                return None
+        with self._lock:
+            client = self._clients.get(printer["name"])
+            if client is None:
+                client = OctoPrintClient(printer["url"], printer["api_key"], **self._client_options)
+                client.name = printer["name"]
+                self._clients[printer["name"]] = client
+            return client
+
+    def clients(self):
+        return [self.get_client(name) for name in self._printers]
+
+    def status_all(self, names=None, timeout=STATUS_TIMEOUT):
+        """
+        Queries printer and job state of every printer concurrently.
+
+        All requests (two per printer) run at the same time, so the whole call
+        takes about one round-trip of the slowest printer instead of the sum.
+
+        Returns:
+            list: one summary dict per printer, in registry order.
+        """
+        clients = [self.get_client(name) for name in (names or self.names())]
+        clients = [c for c in clients if c is not None]
+        if not clients:
+            return []
+        with ThreadPoolExecutor(max_workers=2 * len(clients), thread_name_prefix="octoprint-status") as executor:
+            futures = [(client,
+                        executor.submit(_get_json, client, "/api/printer", timeout, allow_status=(409,)),
+                        executor.submit(_get_json, client, "/api/job", timeout))
+                       for client in clients]
+            return [summarize_status(client.name, printer.result(), job.result()) for client, printer, job in futures]
+
+
+def _get_json(client, path, timeout, allow_status=()):
+    """GET returning (json, error); statuses in allow_status are returned as (None, None)."""
+    try:
+        return client.get(path, timeout=timeout, retry=False).json(), None
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code in allow_status:
+            return None, None
+        return None, str(e)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return None, str(e)
+
+
+def fetch_status(client, timeout=STATUS_TIMEOUT):
+    """Status summary of a single printer (sequential version of PrinterRegistry.status_all)."""
+    return summarize_status(client.name, _get_json(client, "/api/printer", timeout, allow_status=(409,)),
+                            _get_json(client, "/api/job", timeout))
+
+
+def summarize_status(name, printer_result, job_result):
+    """Merges /api/printer and /api/job responses into one flat summary."""
+    printer, printer_error = printer_result
+    job, job_error = job_result
+    summary = {"printer": name, "online": printer_error is None or job_error is None}
+    if printer_error and job_error:
+        summary.update({"state": "Offline", "error": printer_error})
+        return summary
+
+    job = job or {}
+    progress = job.get("progress") or {}
+    summary["state"] = (printer or {}).get("state", {}).get("text") or job.get("state") or "Sconosciuto"
+    summary["file"] = ((job.get("job") or {}).get("file") or {}).get("name")
+    completion = progress.get("completion")
+    summary["progress_percent"] = round(completion, 1) if completion is not None else None
+    summary["print_time_left_seconds"] = progress.get("printTimeLeft")
+    temperatures = (printer or {}).get("temperature") or {}
+    for key, label in (("tool0", "nozzle"), ("bed", "bed")):
+        if key in temperatures:
+            summary[f"{label}_temperature"] = temperatures[key].get("actual")
+            summary[f"{label}_target"] = temperatures[key].get("target")
+    return summary
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """Returns the process-wide printer registry configured from printers.json or the .env variables."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PrinterRegistry.from_config(
+                connect_timeout=float(os.getenv("OCTOPRINT_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+                read_timeout=float(os.getenv("OCTOPRINT_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)),
+                retries=int(os.getenv("OCTOPRINT_RETRIES", DEFAULT_RETRIES)),
+            )
+        return _registry
+
+def get_default_client():
+    """Returns the client of the default printer, or None if OctoPrint is not configured."""
+    return get_registry().get_client()
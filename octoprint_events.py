@@ -0,0 +1,283 @@
+# octoprint_events.py
+"""
+Sottoscrizione agli eventi push di OctoPrint e cache dello stato delle stampanti.
+
+Per ogni stampante del registro un thread apre il WebSocket di OctoPrint
+(``/sockjs/websocket``, autenticato con una sessione passiva ottenuta da
+``/api/login``) e riceve i messaggi ``current`` (stato, job, avanzamento e
+temperature, ogni mezzo secondo moltiplicato per il throttle) ed ``event``
+(PrintDone, PrintFailed, PrintPaused, Error...). Lo stato viene tenuto in una
+cache in memoria che i tool leggono all'istante, senza chiamate HTTP, e gli
+eventi importanti generano avvisi immediati in console senza passare dall'LLM.
+
+Se il WebSocket non è raggiungibile (proxy, versioni vecchie) la stampante
+viene interrogata periodicamente via REST e gli avvisi sono ricavati dai
+cambi di stato. Il client WebSocket implementa il minimo di RFC 6455 che
+serve qui, senza dipendenze esterne.
+"""
+import os
+import ssl
+import json
+import time
+import base64
+import socket
+import struct
+import hashlib
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import octoprint_client
+
+THROTTLE = 2                    # un messaggio "current" ogni 2 x 500 ms
+RECEIVE_TIMEOUT = 30.0          # senza messaggi per questo tempo la connessione è considerata morta
+RECONNECT_MIN_SECONDS = 2.0
+RECONNECT_MAX_SECONDS = 60.0
+PUSH_FAILURES_BEFORE_POLLING = 3
+POLL_SECONDS = 10.0
+STALE_SECONDS = 15.0            # oltre questa età lo stato in cache non è più considerato attuale
+
+# Eventi di OctoPrint che generano un avviso in console
+ALERT_EVENTS = ("PrintDone", "PrintFailed", "PrintCancelled", "PrintPaused", "Error", "Disconnected")
+# Cambi di stato equivalenti, usati quando la stampante è interrogata via REST
+_TRANSITION_EVENTS = {
+    ("Printing", "Operational"): "PrintDone",
+    ("Printing", "Paused"): "PrintPaused",
+    ("Printing", "Error"): "PrintFailed",
+    ("Printing", "Offline"): "Disconnected",
+}
+
+_WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class _WebSocket:
+    """Minimal RFC 6455 client: text frames, ping/pong and close."""
+
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        secure = parts.scheme == "wss"
+        port = parts.port or (443 if secure else 80)
+        sock = socket.create_connection((parts.hostname, port), timeout=timeout)
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+        self._sock = sock
+        self._buffer = b""
+
+        key = base64.b64encode(os.urandom(16))
+        request = (f"GET {parts.path or '/'} HTTP/1.1\r\nHost: {parts.netloc}\r\nUpgrade: websocket\r\n"
+                   f"Connection: Upgrade\r\nSec-WebSocket-Key: {key.decode()}\r\nSec-WebSocket-Version: 13\r\n\r\n")
+        sock.sendall(request.encode())
+        while b"\r\n\r\n" not in self._buffer:
+            self._fill()
+        head, self._buffer = self._buffer.split(b"\r\n\r\n", 1)
+        lines = head.decode("latin-1").split("\r\n")
+        headers = {k.strip().lower(): v.strip() for k, v in (line.split(":", 1) for line in lines[1:] if ":" in line)}
+        expected = base64.b64encode(hashlib.sha1(key + _WEBSOCKET_GUID).digest()).decode()
+        if " 101 " not in lines[0] + " " or headers.get("sec-websocket-accept") != expected:
+            sock.close()
+            raise ConnectionError(f"Handshake WebSocket rifiutato: {lines[0]}")
+
+    def _fill(self):
+        data = self._sock.recv(65536)
+        if not data:
+            raise ConnectionError("Connessione WebSocket chiusa")
+        self._buffer += data
+
+    def _read(self, n):
+        while len(self._buffer) < n:
+            self._fill()
+        data, self._buffer = self._buffer[:n], self._buffer[n:]
+        return data
+
+    def _send_frame(self, opcode, payload):
+        header = bytes([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header += bytes([0x80 | length])
+        elif length < 65536:
+            header += bytes([0x80 | 126]) + struct.pack("!H", length)
+        else:
+            header += bytes([0x80 | 127]) + struct.pack("!Q", length)
+        mask = os.urandom(4)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        self._sock.sendall(header + mask + masked)
+
+    def send_json(self, value):
+        self._send_frame(0x1, json.dumps(value).encode())
+
+    def recv(self):
+        """Returns the next text message, answering pings along the way."""
+        message = b""
+        while True:
+            first, second = self._read(2)
+            opcode, length = first & 0x0F, second & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self._read(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self._read(8))[0]
+            mask = self._read(4) if second & 0x80 else None
+            payload = self._read(length)
+            if mask:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            if opcode == 0x8:
+                raise ConnectionError("Il server ha chiuso il WebSocket")
+            if opcode == 0x9:
+                self._send_frame(0xA, payload)
+                continue
+            if opcode in (0x0, 0x1, 0x2):
+                message += payload
+                if first & 0x80:
+                    return message.decode("utf-8", errors="replace")
+
+    def close(self):
+        try:
+            self._send_frame(0x8, b"")
+        except OSError:
+            pass
+        self._sock.close()
+
+
+class PrinterStateCache:
+    """Latest known state of every printer, as octoprint_client.summarize_status dicts."""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def update(self, name, summary, source):
+        """Stores a new summary and returns the previous one."""
+        summary = dict(summary, source=source, updated=time.time())
+        with self._lock:
+            previous = self._states.get(name)
+            self._states[name] = summary
+        return previous
+
+    def get(self, name):
+        with self._lock:
+            return self._states.get(name)
+
+    def snapshot(self, names, max_age=STALE_SECONDS):
+        """Cached summaries for all names, or None if any of them is missing or older than max_age."""
+        now = time.time()
+        with self._lock:
+            states = [self._states.get(name) for name in names]
+        if any(s is None or now - s["updated"] > max_age for s in states):
+            return None
+        return states
+
+
+def summary_from_current(name, current):
+    """Converts the payload of a push "current" message to a status summary."""
+    temps = current.get("temps") or []
+    printer = {"state": current.get("state") or {}, "temperature": temps[-1] if temps else {}}
+    job = {"job": current.get("job"), "progress": current.get("progress"), "state": (current.get("state") or {}).get("text")}
+    return octoprint_client.summarize_status(name, (printer, None), (job, None))
+
+
+class EventMonitor:
+    """
+    Keeps a PrinterStateCache up to date for every printer of a registry.
+
+    ``on_alert(printer, event, payload, summary)`` is called from the
+    subscriber threads for the events in ALERT_EVENTS.
+    """
+
+    def __init__(self, registry, on_alert=None):
+        self.registry = registry
+        self.cache = PrinterStateCache()
+        self._on_alert = on_alert
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._modes = {}
+
+    def start(self):
+        for name in self.registry.names():
+            thread = threading.Thread(target=self._run, args=(name,), name=f"octoprint-events-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def modes(self):
+        """Printer name -> "push" or "poll"."""
+        return dict(self._modes)
+
+    def _alert(self, name, event, payload=None):
+        if self._on_alert is None:
+            return
+        try:
+            self._on_alert(name, event, payload or {}, self.cache.get(name))
+        except Exception as e:
+            logging.error(f"Errore nella notifica dell'evento {event} di {name}: {e}")
+
+    def _run(self, name):
+        client = self.registry.get_client(name)
+        failures, delay = 0, RECONNECT_MIN_SECONDS
+
+        def connected():
+            # Handshake e autenticazione riusciti: contano solo i tentativi di connessione falliti,
+            # non le cadute di una connessione rimasta in piedi
+            nonlocal failures, delay
+            failures, delay = 0, RECONNECT_MIN_SECONDS
+
+        while not self._stop_event.is_set():
+            if failures < PUSH_FAILURES_BEFORE_POLLING:
+                self._modes[name] = "push"
+                try:
+                    self._subscribe(name, client, on_connected=connected)
+                    failures, delay = 0, RECONNECT_MIN_SECONDS
+                except Exception as e:
+                    failures += 1
+                    logging.warning(f"Eventi push di {name} non disponibili ({e}), nuovo tentativo tra {delay:.0f}s")
+                    self._mark_offline(name)
+                    self._stop_event.wait(delay)
+                    delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+            else:
+                self._modes[name] = "poll"
+                self._poll(name, client)
+                # Dopo un giro di polling si riprova una volta il WebSocket
+                failures, delay = PUSH_FAILURES_BEFORE_POLLING - 1, RECONNECT_MAX_SECONDS
+
+    def _subscribe(self, name, client, on_connected=None):
+        session = client.post("/api/login", json={"passive": True}, retry=False).json()
+        scheme = "wss" if client.base_url.startswith("https") else "ws"
+        url = f"{scheme}://{client.base_url.split('://', 1)[1]}/sockjs/websocket"
+        ws = _WebSocket(url, timeout=RECEIVE_TIMEOUT)
+        try:
+            ws.send_json({"auth": f"{session['name']}:{session['session']}"})
+            ws.send_json({"throttle": THROTTLE})
+            authenticated = False
+            while not self._stop_event.is_set():
+                message = json.loads(ws.recv())
+                if "current" in message or "history" in message:
+                    if not authenticated:
+                        # OctoPrint invia lo stato solo dopo un'autenticazione riuscita
+                        authenticated = True
+                        logging.info(f"Eventi push di {name} attivi") # This will be INFO level
+                        if on_connected is not None:
+                            on_connected()
+                    self.cache.update(name, summary_from_current(name, message.get("current") or message["history"]), "push")
+                elif "event" in message:
+                    event = message["event"] or {}
+                    if event.get("type") in ALERT_EVENTS:
+                        self._alert(name, event["type"], event.get("payload"))
+        finally:
+            ws.close()
+
+    def _mark_offline(self, name):
+        previous = self.cache.get(name)
+        if previous is None or previous.get("online"):
+            self.cache.update(name, {"printer": name, "online": False, "state": "Offline"}, "push")
+
+    def _poll(self, name, client):
+        """REST fallback: refreshes the cache until the next WebSocket attempt, alerting on state changes."""
+        deadline = time.time() + RECONNECT_MAX_SECONDS
+        while not self._stop_event.is_set() and time.time() < deadline:
+            summary = octoprint_client.fetch_status(client)
+            previous = self.cache.update(name, summary, "poll")
+            if previous is not None:
+                event = _TRANSITION_EVENTS.get((previous.get("state"), summary.get("state")))
+                if event:
+                    self._alert(name, event, {"name": previous.get("file")})
+            self._stop_event.wait(POLL_SECONDS)
@@ -0,0 +1,245 @@
+# orientation_optimizer.py
+"""
+Ricerca dell'orientamento di stampa migliore per un modello.
+
+Un orientamento è identificato dalla direzione del modello che punta verso
+l'alto (la rotazione attorno a Z non cambia supporti, contatto né altezza).
+Le direzioni candidate sono una griglia uniforme sulla sfera più le normali
+delle facce piane più estese (per appoggiarle sul piatto), e vengono valutate
+tutte insieme:
+
+* area da supportare: le normali delle facce sono aggregate in bin (cube map),
+  quindi l'area in sbalzo per tutti i candidati è un unico prodotto matriciale;
+* altezza: proiezione dei vertici distinti su tutte le direzioni, a blocchi;
+* contatto col piatto: verificato faccia per faccia solo per le direzioni che
+  hanno facce rivolte verso il piatto.
+
+Il risultato è espresso come argomenti --rotate-x/--rotate-y di PrusaSlicer.
+"""
+import time
+import logging
+
+import numpy as np
+
+import mesh_analysis
+
+DEFAULT_CANDIDATES = 1000
+FLAT_FACE_CANDIDATES = 32       # normali delle facce piane più estese aggiunte ai candidati
+NORMAL_BINS_PER_SIDE = 48       # risoluzione della cube map delle normali (6 x 48 x 48 bin)
+CONTACT_MAX_ANGLE = 1.0         # gradi: facce quasi parallele al piatto
+CONTACT_TOLERANCE = 0.05        # mm sopra il piatto
+PROJECTION_CHUNK = 16384        # vertici proiettati per blocco
+# Sotto questo guadagno di punteggio si mantiene l'orientamento originale
+MIN_IMPROVEMENT = 0.01
+
+# Pesi dei termini del punteggio (più basso è meglio); ogni termine è normalizzato:
+# area da supportare / superficie, altezza / diagonale, contatto / superficie
+DEFAULT_WEIGHTS = {"support": 1.0, "height": 0.25, "contact": 0.5}
+
+
+def fibonacci_directions(count):
+    """Nearly uniform unit vectors on the sphere (Fibonacci lattice), shape (count, 3)."""
+    i = np.arange(count) + 0.5
+    z = 1.0 - 2.0 * i / count
+    r = np.sqrt(1.0 - z * z)
+    phi = np.pi * (1.0 + np.sqrt(5.0)) * i
+    return np.stack((r * np.cos(phi), r * np.sin(phi), z), axis=1)
+
+
+def rotation_for_up(up):
+    """
+    Angles (degrees) of a rotation about X, then about Y, that bring ``up`` to +Z.
+
+    PrusaSlicer applies transformation options in command-line order, so the
+    result maps to ``--rotate-x A --rotate-y B``.
+    """
+    ux, uy, uz = (float(c) for c in up)
+    angle_x = float(np.degrees(np.arctan2(uy, uz)))
+    angle_y = float(np.degrees(np.arctan2(-ux, np.hypot(uy, uz))))
+    return round(angle_x, 2) + 0.0, round(angle_y, 2) + 0.0  # + 0.0 evita "-0"
+
+
+def slicer_args(angle_x, angle_y):
+    """PrusaSlicer CLI arguments for a rotation from rotation_for_up(); empty for no rotation."""
+    args = []
+    if abs(angle_x) >= 0.01:
+        args += ["--rotate-x", f"{angle_x:g}"]
+    if abs(angle_y) >= 0.01:
+        args += ["--rotate-y", f"{angle_y:g}"]
+    return args
+
+
+def _normal_bins(unit_normals):
+    """Cube-map bin index of each unit normal (columns of a (3, n) array)."""
+    side = NORMAL_BINS_PER_SIDE
+    major = np.argmax(np.abs(unit_normals), axis=0)
+    idx = np.arange(unit_normals.shape[1])
+    major_value = unit_normals[major, idx]
+    face = major * 2 + (major_value < 0)
+    # Le due coordinate restanti, divise per la maggiore, stanno in [-1, 1]
+    other_a = unit_normals[(major + 1) % 3, idx] / np.abs(major_value)
+    other_b = unit_normals[(major + 2) % 3, idx] / np.abs(major_value)
+    cell_a = np.clip(((other_a + 1) * 0.5 * side).astype(np.int64), 0, side - 1)
+    cell_b = np.clip(((other_b + 1) * 0.5 * side).astype(np.int64), 0, side - 1)
+    return (face * side + cell_a) * side + cell_b
+
+
+def _projection_extents(points, directions):
+    """Minimum and maximum of points·d for every direction, computed in blocks."""
+    d = np.ascontiguousarray(directions.T, dtype=np.float32)
+    lo = np.full(len(directions), np.inf, dtype=np.float32)
+    hi = np.full(len(directions), -np.inf, dtype=np.float32)
+    out = np.empty((min(PROJECTION_CHUNK, len(points)), len(directions)), dtype=np.float32)
+    for start in range(0, len(points), PROJECTION_CHUNK):
+        chunk = points[start:start + PROJECTION_CHUNK]
+        block = out[:len(chunk)]
+        np.dot(chunk, d, out=block)
+        np.minimum(lo, block.min(axis=0), out=lo)
+        np.maximum(hi, block.max(axis=0), out=hi)
+    return lo.astype(np.float64), hi.astype(np.float64)
+
+
+class _MeshSummary:
+    """Per-mesh data shared by every candidate orientation."""
+
+    def __init__(self, triangles):
+        V = mesh_analysis.vertex_arrays(triangles)
+        bbox_min, bbox_max = mesh_analysis.bounding_box(V)
+        self.center = ((bbox_min + bbox_max) / 2).astype(np.float32)
+        self.diagonal = float(np.linalg.norm(bbox_max - bbox_min)) or 1.0
+        V = V - self.center[None, :, None]  # coordinate centrate: proiezioni float32 più precise
+
+        normals, areas = mesh_analysis.face_normals(V)
+        valid = areas > 0
+        self.V, self.areas = V[:, :, valid], areas[valid].astype(np.float64)
+        self.unit_normals = normals[:, valid] / (2.0 * areas[valid])
+        self.surface = float(self.areas.sum()) or 1.0
+        self.points = mesh_analysis.unique_vertices(self.V)
+
+        # Aggregazione delle normali per area: somma delle aree e normale media per bin
+        bins = _normal_bins(self.unit_normals)
+        n_bins = 6 * NORMAL_BINS_PER_SIDE ** 2
+        self.bin_area = np.bincount(bins, weights=self.areas, minlength=n_bins)
+        mean = np.stack([np.bincount(bins, weights=self.areas * self.unit_normals[a], minlength=n_bins) for a in range(3)], axis=1)
+        length = np.linalg.norm(mean, axis=1)
+        used = length > 0
+        self.bin_normal = np.zeros_like(mean)
+        self.bin_normal[used] = mean[used] / length[used, None]
+
+        order = np.argsort(bins, kind="stable")
+        self.face_order = order
+        self.bin_starts = np.searchsorted(bins[order], np.arange(n_bins + 1))
+
+    def flat_face_directions(self, count):
+        """Up directions that put the largest (nearly) flat regions on the bed."""
+        largest = np.argsort(self.bin_area)[::-1][:count]
+        largest = largest[self.bin_area[largest] > 0]
+        return -self.bin_normal[largest]
+
+    def contact_area(self, up, bed_height):
+        """Exact area of the faces lying on the bed for one up direction."""
+        cos_limit = np.cos(np.radians(CONTACT_MAX_ANGLE))
+        near = np.flatnonzero((self.bin_normal @ up < -0.99) & (self.bin_area > 0))
+        if len(near) == 0:
+            return 0.0
+        faces = np.concatenate([self.face_order[self.bin_starts[b]:self.bin_starts[b + 1]] for b in near])
+        facing = faces[np.einsum("ij,i->j", self.unit_normals[:, faces], up) < -cos_limit]
+        if len(facing) == 0:
+            return 0.0
+        heights = np.einsum("kij,i->kj", self.V[:, :, facing], up)
+        on_bed = heights.max(axis=0) <= bed_height + CONTACT_TOLERANCE
+        return float(self.areas[facing[on_bed]].sum())
+
+
+def evaluate(summary, ups, overhang_angle=mesh_analysis.DEFAULT_OVERHANG_ANGLE, weights=None):
+    """
+    Scores every up direction at once.
+
+    Returns:
+        dict of arrays: support_area, contact_area, height and score per direction.
+    """
+    weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+    ups = np.asarray(ups, dtype=np.float64)
+
+    # Area rivolta verso il basso oltre la soglia, per tutti i candidati in un colpo
+    bin_dots = summary.bin_normal @ ups.T
+    downward = summary.bin_area @ (bin_dots < -np.sin(np.radians(overhang_angle)))
+
+    lo, hi = _projection_extents(summary.points, ups)
+    height = hi - lo
+
+    # Le facce appoggiate al piatto non richiedono supporti
+    contact = np.zeros(len(ups))
+    candidates = np.flatnonzero((bin_dots < -0.99).any(axis=0))
+    for i in candidates:
+        contact[i] = summary.contact_area(ups[i], lo[i])
+    support = np.maximum(downward - contact, 0.0)
+
+    score = (weights["support"] * support / summary.surface
+             + weights["height"] * height / summary.diagonal
+             - weights["contact"] * contact / summary.surface)
+    return {"support_area": support, "contact_area": contact, "height": height, "score": score}
+
+
+def _describe(ups, results, i):
+    angle_x, angle_y = rotation_for_up(ups[i])
+    return {
+        "up_direction": [round(c, 4) for c in ups[i].tolist()],
+        "rotate_x": angle_x,
+        "rotate_y": angle_y,
+        "support_area_mm2": round(float(results["support_area"][i]), 1),
+        "bed_contact_area_mm2": round(float(results["contact_area"][i]), 1),
+        "height_mm": round(float(results["height"][i]), 2),
+        "score": round(float(results["score"][i]), 4),
+    }
+
+
+def optimize(triangles, candidates=DEFAULT_CANDIDATES, overhang_angle=mesh_analysis.DEFAULT_OVERHANG_ANGLE,
+             weights=None, top=5):
+    """
+    Finds the orientation with the best trade-off of supports, bed contact and height.
+
+    Args:
+        triangles (np.ndarray): (n, 3, 3) triangles, e.g. from mesh_analysis.load_mesh.
+        candidates (int): Number of uniformly spread directions to try (flat-face
+                          directions and the current orientation are always added).
+        overhang_angle (float): Degrees from vertical beyond which a face needs support.
+        weights (dict, optional): Overrides for DEFAULT_WEIGHTS.
+        top (int): How many of the best orientations to list.
+
+    Returns:
+        dict: the best and the current orientation with their metrics, the
+        PrusaSlicer arguments for the best one and the runners-up.
+    """
+    t0 = time.perf_counter()
+    summary = _MeshSummary(triangles)
+    ups = np.concatenate((
+        [[0.0, 0.0, 1.0]],  # orientamento attuale
+        summary.flat_face_directions(FLAT_FACE_CANDIDATES),
+        fibonacci_directions(candidates),
+    ))
+    results = evaluate(summary, ups, overhang_angle, weights)
+
+    ranking = np.argsort(results["score"], kind="stable")
+    best = int(ranking[0])
+    if results["score"][0] - results["score"][best] < MIN_IMPROVEMENT:
+        best = 0
+    best_info = _describe(ups, results, best)
+    elapsed = time.perf_counter() - t0
+    logging.info(f"Orientamento ottimizzato su {len(ups)} candidati ({len(triangles)} triangoli) in {elapsed:.2f}s") # This will be INFO level
+    return {
+        "triangles": int(len(triangles)),
+        "candidates": int(len(ups)),
+        "best": best_info,
+        "current": _describe(ups, results, 0),
+        "slicer_args": slicer_args(best_info["rotate_x"], best_info["rotate_y"]) if best else [],
+        "alternatives": [_describe(ups, results, int(i)) for i in ranking[:top]],
+        "optimization_seconds": round(elapsed, 3),
+    }
+
+
+def optimize_file(path, **kwargs):
+    """Loads a model with mesh_analysis.load_mesh and runs optimize() on it."""
+    result = optimize(mesh_analysis.load_mesh(path), **kwargs)
+    result["file"] = path
+    return result
@@ -0,0 +1,413 @@
+# print_scheduler.py
+"""
+Scheduler dei lavori di stampa per una farm di stampanti OctoPrint.
+
+La coda contiene modelli da slicare o file G-code già pronti ed è salvata su
+disco (PRINT_QUEUE_FILE), quindi sopravvive ai riavvii. A ogni giro lo
+scheduler:
+
+1. prepara i lavori nuovi (slicing dei modelli e stima del tempo di stampa);
+2. legge lo stato di tutte le stampanti in parallelo (PrinterRegistry.status_all);
+3. aggiorna i lavori in stampa (completati, annullati o interrotti: solo
+   quelli interrotti da un guasto della stampante tornano in coda finché
+   restano tentativi, mai quelli annullati dal pannello di OctoPrint);
+4. ripianifica la coda: in ordine di arrivo, ogni lavoro va alla stampante che
+   si libera per prima, considerando il tempo rimanente della stampa in corso
+   e i lavori già pianificati su di essa;
+5. carica e avvia i lavori assegnati a stampanti libere.
+
+Un giro parte periodicamente e subito dopo ogni modifica della coda.
+"""
+import os
+import json
+import time
+import heapq
+import logging
+import threading
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+QUEUED = "queued"
+PREPARING = "preparing"
+UPLOADING = "uploading"
+PRINTING = "printing"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+DEFAULT_QUEUE_FILE = "print_queue.json"
+DEFAULT_POLL_SECONDS = 15
+DEFAULT_JOB_SECONDS = 3600      # durata ipotizzata se la stima non è disponibile
+MAX_ATTEMPTS = 2                # avvii per lavoro prima di considerarlo fallito
+KEEP_FINISHED = 200
+START_GRACE_SECONDS = 30
+
+# Stati di OctoPrint in cui la stampante può ricevere un nuovo lavoro
+IDLE_PRINTER_STATES = ("Operational",)
+# Stati in cui la stampa corrente è ancora in corso
+ACTIVE_PRINTER_STATES = ("Printing", "Paused", "Pausing", "Resuming", "Finishing", "Starting", "Printing from SD")
+# Stati (prefissi) di guasto: solo dopo questi una stampa interrotta viene ripetuta
+FAULT_PRINTER_STATES = ("Error", "Offline", "Closed")
+
+
+@dataclass
+class PrintJob:
+    """One entry of the print queue."""
+    id: str
+    source: str
+    kind: str                       # "model" oppure "gcode"
+    status: str = QUEUED
+    printer: str = None             # stampante richiesta dall'utente (None: qualsiasi)
+    assigned_printer: str = None
+    gcode_path: str = None
+    remote_path: str = None
+    estimated_seconds: float = None
+    planned_start_seconds: float = None
+    prepared: bool = False
+    attempts: int = 0
+    cancelled: bool = False         # annullata dal pannello di OctoPrint (evento PrintCancelled)
+    print_failed: bool = False      # fallita sulla stampante (evento PrintFailed)
+    error: str = None
+    created: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+
+    @property
+    def name(self):
+        return os.path.basename(self.gcode_path or self.source)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def plan(jobs, availability, default_seconds=DEFAULT_JOB_SECONDS):
+    """
+    Assigns queued jobs to printers, earliest-available printer first.
+
+    Args:
+        jobs (list): PrintJob objects in queue order.
+        availability (dict): printer name -> seconds until it is free (0 if idle).
+                             Printers that cannot take work must be left out.
+        default_seconds (float): Duration used for jobs without an estimate.
+
+    Returns:
+        list: (job, printer, start_seconds) for every job that can be placed.
+    """
+    heap = [(seconds, name) for name, seconds in availability.items()]
+    heapq.heapify(heap)
+    free_at = dict(availability)
+    assignments = []
+    for job in jobs:
+        if job.printer:
+            if job.printer not in free_at:
+                continue
+            printer, start = job.printer, free_at[job.printer]
+        else:
+            # Scarta le voci superate (la stampante ha ricevuto un lavoro vincolato)
+            while heap and heap[0][0] != free_at[heap[0][1]]:
+                heapq.heappop(heap)
+            if not heap:
+                break
+            start, printer = heapq.heappop(heap)
+        assignments.append((job, printer, start))
+        free_at[printer] = start + (job.estimated_seconds or default_seconds)
+        heapq.heappush(heap, (free_at[printer], printer))
+    return assignments
+
+
+def printer_availability(statuses, running_jobs):
+    """
+    Seconds until each reachable printer can take a new job.
+
+    Args:
+        statuses (list): Summaries from PrinterRegistry.status_all().
+        running_jobs (dict): printer name -> PrintJob currently printing there.
+    """
+    availability = {}
+    for status in statuses:
+        if not status.get("online"):
+            continue
+        state = status.get("state")
+        job = running_jobs.get(status["printer"])
+        if state in IDLE_PRINTER_STATES and job is None:
+            availability[status["printer"]] = 0.0
+        elif state in ACTIVE_PRINTER_STATES or job is not None:
+            # Una stampante con un nostro lavoro appena avviato è occupata anche se risulta ancora libera
+            left = status.get("print_time_left_seconds") if state in ACTIVE_PRINTER_STATES else None
+            if left is None:
+                left = job.estimated_seconds if job and job.estimated_seconds else DEFAULT_JOB_SECONDS
+            availability[status["printer"]] = float(left)
+    return availability
+
+
+class PrintScheduler:
+    """
+    Persistent print queue dispatched over a PrinterRegistry.
+
+    ``prepare(job)`` is called on a worker thread for every new job: it must
+    set ``job.gcode_path`` (slicing models if needed) and, if possible,
+    ``job.estimated_seconds``; exceptions mark the job as failed.
+    """
+
+    def __init__(self, registry, queue_path, prepare, poll_seconds=DEFAULT_POLL_SECONDS):
+        self.registry = registry
+        self.queue_path = queue_path
+        self.poll_seconds = poll_seconds
+        self._prepare = prepare
+        self._lock = threading.RLock()
+        self._jobs = {}
+        self._next_id = 1
+        self._prepare_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="print-prepare")
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._load()
+
+    # --- Persistenza ---
+    def _load(self):
+        if not os.path.exists(self.queue_path):
+            return
+        try:
+            with open(self.queue_path, "r") as f:
+                data = json.load(f)
+        except Exception as e:
+            logging.error(f"Coda di stampa illeggibile ({self.queue_path}), riparto da una coda vuota: {e}")
+            return
+        for entry in data.get("jobs", []):
+            job = PrintJob(**entry)
+            # Le operazioni interrotte dal riavvio vanno ripetute
+            if job.status in (PREPARING, UPLOADING):
+                job.status = QUEUED
+            self._jobs[job.id] = job
+        self._next_id = data.get("next_id", len(self._jobs) + 1)
+
+    def _save(self):
+        tmp_path = self.queue_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"next_id": self._next_id, "jobs": [job.to_dict() for job in self._jobs.values()]}, f, indent=2)
+            os.replace(tmp_path, self.queue_path)
+        except Exception as e:
+            logging.error(f"Errore nel salvare la coda di stampa: {e}")
+
+    def _set_status(self, job, status, error=None, expected=None):
+        """
+        Changes the status of a job; with expected, only if the job is still in one of those states
+        (e.g. not cancelled meanwhile from another thread). Returns whether the status changed.
+        """
+        with self._lock:
+            if expected is not None and job.status not in expected:
+                return False
+            job.status = status
+            job.error = error
+            if status in FINAL_STATES:
+                job.finished = time.time()
+            self._prune()
+            self._save()
+        return True
+
+    def _prune(self):
+        finished = sorted((j for j in self._jobs.values() if j.status in FINAL_STATES), key=lambda j: j.finished or 0)
+        for job in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self._jobs[job.id]
+
+    # --- API ---
+    def submit(self, source, kind, printer=None):
+        """Adds a model or G-code file to the queue and returns the new PrintJob."""
+        with self._lock:
+            job = PrintJob(id=str(self._next_id), source=source, kind=kind, printer=printer)
+            if kind == "gcode":
+                job.gcode_path = source
+            self._next_id += 1
+            self._jobs[job.id] = job
+            self._save()
+        logging.info(f"Lavoro di stampa {job.id} accodato: {source}") # This will be INFO level
+        self.wake()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(str(job_id).strip())
+
+    def list(self):
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: int(j.id))
+
+    def cancel(self, job_id):
+        """Cancels a job; a job already printing is cancelled on its printer too."""
+        job = self.get(job_id)
+        if job is None:
+            return job
+        with self._lock:
+            # Controllo e cambio di stato insieme: preparazione e invio girano su altri thread
+            if job.status in FINAL_STATES:
+                return job
+            printing = job.status == PRINTING
+            self._set_status(job, CANCELLED)
+        if printing:
+            self._cancel_on_printer(job)
+        self.wake()
+        return job
+
+    def printer_event(self, printer, event):
+        """
+        Records a PrintCancelled / PrintFailed push event on the job printing on that printer,
+        so that reconciliation can tell a cancellation from a failure.
+        """
+        if event not in ("PrintCancelled", "PrintFailed"):
+            return
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status == PRINTING and job.assigned_printer == printer:
+                    if event == "PrintCancelled":
+                        job.cancelled = True
+                    else:
+                        job.print_failed = True
+                    self._save()
+        self.wake()
+
+    def _cancel_on_printer(self, job):
+        client = self.registry.get_client(job.assigned_printer) if job.assigned_printer else None
+        if client is not None:
+            client.post("/api/job", json={"command": "cancel"})
+
+    # --- Ciclo di pianificazione ---
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="print-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def wake(self):
+        self._wake_event.set()
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error(f"Errore nello scheduler di stampa: {e}")
+            self._wake_event.wait(self.poll_seconds)
+
+    def tick(self):
+        """Runs one prepare / reconcile / plan / dispatch round and returns the current plan."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status == QUEUED and not job.prepared:
+                    job.status = PREPARING
+                    self._prepare_executor.submit(self._run_prepare, job)
+            jobs = list(self._jobs.values())
+
+        running = {j.assigned_printer: j for j in jobs if j.status == PRINTING}
+        statuses = self.registry.status_all()
+        by_name = {s["printer"]: s for s in statuses}
+        for printer, job in running.items():
+            self._reconcile(job, by_name.get(printer))
+
+        with self._lock:
+            running = {j.assigned_printer: j for j in self._jobs.values() if j.status == PRINTING}
+            availability = printer_availability(statuses, running)
+            waiting = sorted((j for j in self._jobs.values() if j.status == QUEUED and j.gcode_path),
+                             key=lambda j: int(j.id))
+            assignments = plan(waiting, availability)
+            for job, printer, start in assignments:
+                job.planned_start_seconds = round(start)
+                job.assigned_printer = printer
+            self._save()
+
+        for job, printer, start in assignments:
+            if job.status != QUEUED:   # annullato mentre si pianificava (_dispatch lo ricontrolla sotto lock)
+                continue
+            if start == 0 and availability.get(printer) == 0:
+                self._dispatch(job, printer)
+        return assignments
+
+    def _run_prepare(self, job):
+        try:
+            self._prepare(job)
+            if not job.gcode_path or not os.path.exists(job.gcode_path):
+                raise RuntimeError("G-code non disponibile dopo la preparazione")
+            job.prepared = True
+            self._set_status(job, QUEUED, expected=(PREPARING,))
+        except Exception as e:
+            logging.error(f"Preparazione del lavoro di stampa {job.id} fallita: {e}")
+            self._set_status(job, FAILED, str(e), expected=(PREPARING,))
+        self.wake()
+
+    def _reconcile(self, job, status):
+        """Updates a printing job from the live state of its printer."""
+        if status is None or not status.get("online"):
+            # Stampante irraggiungibile: il lavoro resta in stampa finché non torna visibile
+            return
+        state = status.get("state")
+        ours = status.get("file") == os.path.basename(job.remote_path or "")
+        if ours and state in ACTIVE_PRINTER_STATES:
+            return
+        if ours and (status.get("progress_percent") or 0) >= 99.9:
+            logging.info(f"Lavoro di stampa {job.id} completato su {job.assigned_printer}") # This will be INFO level
+            self._set_status(job, DONE, expected=(PRINTING,))
+            return
+        if state in IDLE_PRINTER_STATES and job.started and time.time() - job.started < START_GRACE_SECONDS and not job.cancelled:
+            # OctoPrint può restare "Operational" per qualche istante dopo l'avvio
+            return
+        fault = job.print_failed or (state or "").startswith(FAULT_PRINTER_STATES)
+        if job.cancelled or not fault:
+            # Annullata dal pannello, o stampante di nuovo libera senza errori: non va ristampata
+            error = f"Stampa annullata su {job.assigned_printer} (stato: {state})"
+            logging.warning(f"Lavoro di stampa {job.id}: {error}")
+            self._set_status(job, CANCELLED, error, expected=(PRINTING,))
+            return
+        error = f"Stampa interrotta su {job.assigned_printer} (stato: {state})"
+        logging.warning(f"Lavoro di stampa {job.id}: {error}")
+        with self._lock:
+            if job.status != PRINTING:
+                return
+            if job.attempts < MAX_ATTEMPTS:
+                job.assigned_printer = None
+                self._set_status(job, QUEUED, error)
+            else:
+                self._set_status(job, FAILED, error)
+
+    def _dispatch(self, job, printer):
+        """Streams the G-code to the printer and starts it in the same request."""
+        client = self.registry.get_client(printer)
+        if client is None:
+            return
+        # Solo se è ancora in coda: potrebbe essere stato annullato dopo la pianificazione
+        if not self._set_status(job, UPLOADING, expected=(QUEUED,)):
+            return
+        remote_name = f"{os.path.splitext(os.path.basename(job.gcode_path))[0]}_job{job.id}.gcode"
+        try:
+            client.upload(job.gcode_path, remote_name, print_after=True)
+        except (OSError, requests.exceptions.RequestException) as e:
+            logging.error(f"Invio del lavoro {job.id} a {printer} fallito: {e}")
+            with self._lock:
+                job.attempts += 1
+                if job.status == UPLOADING:
+                    job.assigned_printer = None
+                    self._set_status(job, QUEUED if job.attempts < MAX_ATTEMPTS else FAILED, str(e))
+            return
+        with self._lock:
+            job.attempts += 1
+            job.assigned_printer = printer
+            job.remote_path = remote_name
+            cancelled = job.status != UPLOADING
+            if not cancelled:
+                job.started = time.time()
+                job.cancelled = job.print_failed = False
+                job.planned_start_seconds = 0
+                self._set_status(job, PRINTING)
+        if cancelled:
+            # Annullato durante il caricamento: la stampa è già partita con print_after, va fermata
+            logging.info(f"Lavoro di stampa {job.id} annullato durante l'invio: fermo la stampa su {printer}") # This will be INFO level
+            self._cancel_on_printer(job)
+            return
+        logging.info(f"Lavoro di stampa {job.id} avviato su {printer}") # This will be INFO level
@@ -0,0 +1,286 @@
+# print_time_estimator.py
+"""
+Stima del tempo di stampa di un G-code con un modello cinematico.
+
+Per ogni movimento letto da gcode_analyzer.iter_moves vengono calcolati la
+velocità nominale (F limitata dalle velocità massime per asse), l'accelerazione
+(stampa, travel o retrazione, limitata per asse) e la velocità massima di
+giunzione con il movimento precedente (junction deviation, ricavata dal jerk
+se la stampante non la specifica). Il planner con lookahead completo è risolto
+in forma chiusa sui quadrati delle velocità, senza cicli Python per movimento,
+e ogni movimento viene infine cronometrato con un profilo trapezoidale.
+
+I limiti della macchina sono letti dalla config che PrusaSlicer scrive in coda
+al G-code (machine_max_*); in mancanza si usano quelli della Prusa MK3S.
+"""
+import time
+import logging
+from dataclasses import dataclass, fields
+
+import numpy as np
+
+import gcode_analyzer
+
+# Config di PrusaSlicer -> campo di MachineLimits
+LIMIT_CONFIG_KEYS = {
+    "acceleration_extruding": b"; machine_max_acceleration_extruding = ",
+    "acceleration_retracting": b"; machine_max_acceleration_retracting = ",
+    "acceleration_travel": b"; machine_max_acceleration_travel = ",
+    "acceleration_x": b"; machine_max_acceleration_x = ",
+    "acceleration_y": b"; machine_max_acceleration_y = ",
+    "acceleration_z": b"; machine_max_acceleration_z = ",
+    "acceleration_e": b"; machine_max_acceleration_e = ",
+    "feedrate_x": b"; machine_max_feedrate_x = ",
+    "feedrate_y": b"; machine_max_feedrate_y = ",
+    "feedrate_z": b"; machine_max_feedrate_z = ",
+    "feedrate_e": b"; machine_max_feedrate_e = ",
+    "jerk_x": b"; machine_max_jerk_x = ",
+    "jerk_y": b"; machine_max_jerk_y = ",
+    "jerk_z": b"; machine_max_jerk_z = ",
+    "jerk_e": b"; machine_max_jerk_e = ",
+    "junction_deviation": b"; machine_max_junction_deviation = ",
+}
+
+
+@dataclass
+class MachineLimits:
+    """Printer kinematic limits: accelerations in mm/s², feed rates and jerk in mm/s."""
+    acceleration_extruding: float = 1250.0
+    acceleration_retracting: float = 1250.0
+    acceleration_travel: float = 1250.0
+    acceleration_x: float = 1000.0
+    acceleration_y: float = 1000.0
+    acceleration_z: float = 200.0
+    acceleration_e: float = 5000.0
+    feedrate_x: float = 200.0
+    feedrate_y: float = 200.0
+    feedrate_z: float = 12.0
+    feedrate_e: float = 120.0
+    jerk_x: float = 8.0
+    jerk_y: float = 8.0
+    jerk_z: float = 0.4
+    jerk_e: float = 4.5
+    junction_deviation: float = 0.0  # 0 = ricavata dal jerk
+
+    @classmethod
+    def from_comments(cls, comments):
+        """Builds limits from PrusaSlicer config values such as '1250,960' (normal, silent mode)."""
+        values = {}
+        for field in fields(cls):
+            raw = comments.get(field.name)
+            try:
+                value = float(str(raw).split(",")[0])
+            except (TypeError, ValueError):
+                continue
+            if value > 0 or field.name == "junction_deviation":
+                values[field.name] = value
+        return cls(**values)
+
+    def to_dict(self):
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+
+class _PlannerState:
+    """Last move of the previous block, to join blocks at their boundary."""
+
+    def __init__(self):
+        self.unit = None     # direzione XYZ (vettore unitario)
+        self.nominal = 0.0   # velocità nominale, mm/s
+        self.exit_sq = 0.0   # quadrato della velocità di uscita usata
+        self.e_only = True
+
+
+def _axis_limited(base, limits_per_axis, deltas, length):
+    """Scales a per-move limit so that no axis exceeds its own limit."""
+    result = base
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for limit, delta in zip(limits_per_axis, deltas):
+            ratio = np.where(delta != 0, limit * length / np.abs(delta), np.inf)
+            result = np.minimum(result, ratio)
+    return result
+
+
+def _plan_speeds(caps_sq, reach_sq):
+    """
+    Solves the lookahead planner for one block.
+
+    ``caps_sq[i]`` (n+1 values) bounds the squared speed at each junction and
+    ``reach_sq[i]`` = 2·a·L is how much move i can change the squared speed.
+    The backward pass  w[i] = min(cap[i], w[i+1] + reach[i])  and the forward
+    pass  w[i+1] = min(w[i+1], w[i] + reach[i])  are min-plus recurrences, so
+    with T = cumulative reach they reduce to running minima:
+    w = suffix_min(cap + T) - T, then w = prefix_min(w - T) + T.
+    """
+    cumulative = np.concatenate(([0.0], np.cumsum(reach_sq)))
+    w = np.minimum.accumulate((caps_sq + cumulative)[::-1])[::-1] - cumulative
+    w = np.minimum.accumulate(w - cumulative) + cumulative
+    return np.clip(w, 0.0, caps_sq)
+
+
+def _trapezoid_times(length, nominal, accel, entry_sq, exit_sq):
+    """Time of each move for a trapezoidal (or triangular) velocity profile."""
+    nominal_sq = nominal * nominal
+    accel_dist = (nominal_sq - entry_sq) / (2 * accel)
+    decel_dist = (nominal_sq - exit_sq) / (2 * accel)
+    cruise = length - accel_dist - decel_dist
+    entry, exit_ = np.sqrt(entry_sq), np.sqrt(exit_sq)
+
+    # Profilo triangolare: la velocità nominale non viene raggiunta
+    peak = np.sqrt(np.maximum(np.maximum(entry_sq, exit_sq), accel * length + (entry_sq + exit_sq) / 2))
+    peak = np.minimum(peak, nominal)
+    ramps = (2 * peak - entry - exit_) / accel
+    return np.where(cruise > 0, ramps + np.maximum(cruise, 0) / nominal, ramps)
+
+
+class PrintTimeEstimator:
+    """Accumulates estimated time per layer over MoveBlocks."""
+
+    def __init__(self, limits=None):
+        self.limits = limits or MachineLimits()
+        self.total_seconds = 0.0
+        self.moves = 0
+        self.layer_seconds = np.zeros(0)
+        self.z_seconds = {}
+        self._state = _PlannerState()
+
+    def _junction_deviation(self, accel):
+        if self.limits.junction_deviation > 0:
+            return self.limits.junction_deviation
+        # Conversione usata da Marlin per le stampanti configurate con il jerk classico
+        jerk = min(self.limits.jerk_x, self.limits.jerk_y)
+        return 0.4 * jerk * jerk / accel
+
+    def add(self, block, last=False):
+        """
+        Times the moves of a block.
+
+        Args:
+            block (gcode_analyzer.MoveBlock): Moves in file order.
+            last (bool): True for the final block; the machine stops after its last move.
+        """
+        lim = self.limits
+        dx, dy, dz = block.x1 - block.x0, block.y1 - block.y0, block.z1 - block.z0
+        de, feed, layer, z1 = block.de, block.f / 60.0, block.layer, block.z1
+        xyz = np.sqrt(dx * dx + dy * dy + dz * dz)
+        length = np.where(xyz == 0, np.abs(de), xyz)
+        keep = length > 0  # i movimenti che cambiano solo F non richiedono tempo
+        if not keep.all():
+            dx, dy, dz, de, feed, layer, z1, xyz, length = (
+                a[keep] for a in (dx, dy, dz, de, feed, layer, z1, xyz, length))
+        n = len(length)
+        if n == 0:
+            return
+        e_only = xyz == 0
+
+        # Velocità nominale e accelerazione di ogni movimento
+        feed = np.where(feed > 0, feed, max(lim.feedrate_x, lim.feedrate_y))
+        deltas = (dx, dy, dz, de)
+        nominal = _axis_limited(feed, (lim.feedrate_x, lim.feedrate_y, lim.feedrate_z, lim.feedrate_e), deltas, length)
+        extruding = (de > 0) & ~e_only
+        base_accel = np.where(e_only, lim.acceleration_retracting,
+                              np.where(extruding, lim.acceleration_extruding, lim.acceleration_travel))
+        accel = _axis_limited(base_accel, (lim.acceleration_x, lim.acceleration_y, lim.acceleration_z,
+                                           lim.acceleration_e), deltas, length)
+
+        # Velocità massima alle giunzioni (junction deviation sulle direzioni XYZ)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            unit = np.stack((dx, dy, dz)) / xyz
+        prev_unit = np.empty_like(unit)
+        prev_unit[:, 1:] = unit[:, :-1]
+        prev_unit[:, 0] = self._state.unit if self._state.unit is not None else np.nan
+        prev_nominal = np.concatenate(([self._state.nominal], nominal[:-1]))
+        prev_e_only = np.concatenate(([self._state.e_only], e_only[:-1]))
+
+        # Seno di metà dell'angolo fra i due segmenti: 1 in linea retta, 0 in inversione
+        dot = np.einsum("ij,ij->j", unit, prev_unit)
+        sin_half = np.sqrt(np.clip((1.0 + dot) / 2.0, 0.0, 1.0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            junction_sq = accel * self._junction_deviation(accel) * sin_half / (1.0 - sin_half)
+        junction_sq = np.where(np.isnan(junction_sq), 0.0, junction_sq)
+        # Accanto a una retrazione (solo E) la giunzione parte praticamente da fermo
+        instant = min(lim.jerk_x, lim.jerk_y, lim.jerk_e)
+        junction_sq = np.where(e_only | prev_e_only, instant * instant, junction_sq)
+        caps_sq = np.minimum(junction_sq, np.minimum(nominal, prev_nominal) ** 2)
+        caps_sq[0] = min(caps_sq[0], self._state.exit_sq)
+        end_sq = 0.0 if last else nominal[-1] ** 2
+        caps_sq = np.concatenate((caps_sq, [end_sq]))
+
+        speeds_sq = _plan_speeds(caps_sq, 2.0 * accel * length)
+        seconds = _trapezoid_times(length, nominal, accel, speeds_sq[:-1], speeds_sq[1:])
+
+        self._state.unit = unit[:, -1]
+        self._state.nominal = float(nominal[-1])
+        self._state.exit_sq = float(speeds_sq[-1])
+        self._state.e_only = bool(e_only[-1])
+
+        self.moves += n
+        self.total_seconds += float(seconds.sum())
+        size = int(layer.max()) + 1
+        if size > len(self.layer_seconds):
+            self.layer_seconds = np.pad(self.layer_seconds, (0, size - len(self.layer_seconds)))
+        self.layer_seconds += np.bincount(layer, weights=seconds, minlength=len(self.layer_seconds))
+
+        # Per i file senza marcatori di layer si raggruppa per quota Z
+        z = np.round(z1, 3)
+        run_starts = np.concatenate(([0], np.flatnonzero(np.diff(z)) + 1))
+        for key, amount in zip(z[run_starts].tolist(), np.add.reduceat(seconds, run_starts).tolist()):
+            self.z_seconds[key] = self.z_seconds.get(key, 0.0) + amount
+
+    def per_layer(self):
+        """Returns (start_seconds, seconds per layer); start is the time before the first layer marker."""
+        if len(self.layer_seconds) > 1:
+            return float(self.layer_seconds[0]), self.layer_seconds[1:]
+        if self.z_seconds:
+            return 0.0, np.array([self.z_seconds[z] for z in sorted(self.z_seconds)])
+        return 0.0, np.zeros(0)
+
+
+def estimate(gcode_path, limits=None, block_size=gcode_analyzer.DEFAULT_BLOCK_SIZE):
+    """
+    Estimates the printing time of a G-code file.
+
+    Args:
+        gcode_path (str): Path of the G-code file.
+        limits (MachineLimits, optional): Printer limits; defaults to the machine_max_*
+                                          values in the file, then to a Prusa MK3S.
+
+    Returns:
+        dict: total and per-layer seconds, and the error against the slicer's own
+        "estimated printing time" comment when the file has one.
+    """
+    t0 = time.perf_counter()
+    comments = gcode_analyzer.scan_comments(
+        gcode_path, dict(LIMIT_CONFIG_KEYS, estimated_time=gcode_analyzer.ESTIMATED_TIME_KEY))
+    limits = limits or MachineLimits.from_comments(comments)
+    estimator = PrintTimeEstimator(limits)
+
+    # Il blocco corrente viene cronometrato solo quando si sa se è l'ultimo
+    previous = None
+    for block in gcode_analyzer.iter_moves(gcode_path, block_size=block_size):
+        if previous is not None:
+            estimator.add(previous)
+        previous = block
+    if previous is not None:
+        estimator.add(previous, last=True)
+
+    start_seconds, layer_seconds = estimator.per_layer()
+    total = estimator.total_seconds
+    slicer_seconds = gcode_analyzer.parse_duration(comments.get("estimated_time"))
+    elapsed = time.perf_counter() - t0
+    logging.info(f"Tempo di stampa stimato per {gcode_path}: {gcode_analyzer.format_duration(total)} "
+                 f"({estimator.moves} movimenti in {elapsed:.2f}s)") # This will be INFO level
+    return {
+        "file": gcode_path,
+        "moves": estimator.moves,
+        "estimated_seconds": round(total, 1),
+        "estimated_time": gcode_analyzer.format_duration(total),
+        "start_seconds": round(start_seconds, 1),
+        "layer_count": int(len(layer_seconds)),
+        "seconds_per_layer": [round(s, 1) for s in layer_seconds.tolist()],
+        "slicer_estimated_time": comments.get("estimated_time"),
+        "slicer_estimated_seconds": slicer_seconds,
+        "error_seconds": round(total - slicer_seconds, 1) if slicer_seconds else None,
+        "error_percent": round(100.0 * (total - slicer_seconds) / slicer_seconds, 2) if slicer_seconds else None,
+        "machine_limits": limits.to_dict(),
+        "estimation_seconds": round(elapsed, 3),
+    }
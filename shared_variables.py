@@ -1,4 +1,4 @@
-import threading
-latest_text = ""
-latest_text_lock = threading.Lock()
+import queue
+# Trascrizioni del riconoscimento vocale in ordine di arrivo, come (testo, istante di fine del parlato in perf_counter)
+transcripts = queue.Queue()
 last_gcode_path = None 
\ No newline at end of file
@@ -0,0 +1,169 @@
+# slicing_jobs.py
+"""
+Coda di job in background per le operazioni lunghe (slicing con PrusaSlicer).
+
+Un job viene accodato e restituisce subito il suo id; l'assistente può poi
+interrogarne lo stato o annullarlo mentre la conversazione prosegue.
+"""
+import time
+import logging
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINAL_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job target when the job has been cancelled."""
+
+
+class Job:
+    """A unit of background work tracked by JobQueue."""
+
+    def __init__(self, job_id, description):
+        self.id = job_id
+        self.description = description
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel_event = threading.Event()
+        self._process = None
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def attach_process(self, process):
+        """
+        Registers the subprocess doing the work so cancel() can terminate it.
+        If the job was cancelled before the process started, it is terminated at once.
+        """
+        with self._lock:
+            self._process = process
+            if self.cancelled:
+                self._terminate_process()
+
+    def detach_process(self):
+        with self._lock:
+            self._process = None
+
+    def _terminate_process(self):
+        if self._process is not None and self._process.poll() is None:
+            try:
+                self._process.terminate()
+            except Exception as e:
+                logging.warning(f"Impossibile terminare il processo del job {self.id}: {e}")
+
+    def cancel(self):
+        with self._lock:
+            self._cancel_event.set()
+            self._terminate_process()
+
+    def to_dict(self):
+        now = time.time()
+        elapsed = None
+        if self.started:
+            elapsed = round((self.finished or now) - self.started, 1)
+        return {
+            "job_id": self.id,
+            "description": self.description,
+            "status": self.status,
+            "elapsed_seconds": elapsed,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    Runs job targets on a bounded thread pool.
+
+    Targets are called as ``target(*args, job=job, **kwargs)`` and may check
+    ``job.cancelled`` or raise JobCancelled. ``on_finished(job)`` is called from
+    the worker thread once the job reaches a final state.
+    """
+
+    def __init__(self, max_workers, on_finished=None, keep_finished=100):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._on_finished = on_finished
+        self._keep_finished = keep_finished
+
+    def submit(self, description, target, *args, **kwargs):
+        with self._lock:
+            job = Job(str(next(self._ids)), description)
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, target, args, kwargs)
+        logging.info(f"Job {job.id} accodato: {description}") # This will be INFO level
+        return job
+
+    def _run(self, job, target, args, kwargs):
+        if job.cancelled:
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        try:
+            job.result = target(*args, job=job, **kwargs)
+            self._finish(job, CANCELLED if job.cancelled else SUCCEEDED)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            logging.error(f"Job {job.id} fallito: {e}")
+            job.error = str(e)
+            self._finish(job, FAILED)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished = time.time()
+        job.detach_process()
+        if self._on_finished:
+            try:
+                self._on_finished(job)
+            except Exception as e:
+                logging.error(f"Errore nella notifica di fine job {job.id}: {e}")
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.status in FINAL_STATES]
+        for job in sorted(finished, key=lambda j: j.finished)[:max(0, len(finished) - self._keep_finished)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(str(job_id).strip())
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job.status not in FINAL_STATES:
+            job.cancel()
+            if job.status == QUEUED:
+                # Non ancora partito: _run lo chiuderà senza eseguirlo
+                job.status = CANCELLED
+        return job
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self, cancel_pending=True):
+        if cancel_pending:
+            for job in self.list():
+                if job.status not in FINAL_STATES:
+                    job.cancel()
+        self._executor.shutdown(wait=False)
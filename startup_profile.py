@@ -0,0 +1,139 @@
+# startup_profile.py
+"""
+Profilo dell'avvio di AI-Slicer.
+
+Con STARTUP_PROFILE=1 (o ``python ai-slicer.py --profile-startup``) il
+profiler registra le fasi dell'avvio (caricamento dell'assistente, del
+riconoscimento vocale, dell'audio...), i momenti chiave come il prompt
+pronto per l'input e il tempo di ogni import eseguito dal processo, con
+tempo cumulativo (incluse le dipendenze) e proprio, come ``python -X
+importtime``. Il report viene stampato quando tutti i caricamenti in
+background sono finiti. Senza profilo le fasi costano solo una lettura
+dell'orologio e gli import non vengono intercettati.
+"""
+import os
+import sys
+import time
+import builtins
+import threading
+from contextlib import contextmanager
+
+from rich.table import Table
+from rich import print as rprint
+
+PROFILE_TOP_IMPORTS = 20
+MIN_IMPORT_MS = 1.0
+
+
+class StartupProfiler:
+    """Startup phases, milestones and (when enabled) per-module import times."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._origin = time.perf_counter()
+        self._phases = []       # (nome, inizio, durata o None per i momenti chiave, thread)
+        self._imports = []      # (modulo, profondità, cumulativo, proprio, thread)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._original_import = None
+        if enabled:
+            self._install_import_hook()
+
+    @classmethod
+    def from_env(cls):
+        """Enabled by STARTUP_PROFILE=1 or by the --profile-startup command line flag."""
+        return cls(enabled=os.getenv("STARTUP_PROFILE", "0") == "1" or "--profile-startup" in sys.argv)
+
+    def elapsed(self):
+        """Seconds since the profiler was created (the start of the program)."""
+        return time.perf_counter() - self._origin
+
+    @contextmanager
+    def phase(self, name):
+        """Times a startup phase; phases may run concurrently in different threads."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                with self._lock:
+                    self._phases.append((name, start - self._origin, time.perf_counter() - start,
+                                         threading.current_thread().name))
+
+    def mark(self, name):
+        """Records a milestone, e.g. the moment the prompt accepts input."""
+        if self.enabled:
+            with self._lock:
+                self._phases.append((name, self.elapsed(), None, threading.current_thread().name))
+
+    # --- Import ---
+    def _install_import_hook(self):
+        self._original_import = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            # Solo il primo import assoluto di un modulo: gli altri sono una lettura di sys.modules
+            if level or name in sys.modules:
+                return self._original_import(name, globals, locals, fromlist, level)
+            stack = self._local.__dict__.setdefault("stack", [])
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return self._original_import(name, globals, locals, fromlist, level)
+            finally:
+                cumulative = time.perf_counter() - start
+                children = stack.pop()
+                if stack:
+                    stack[-1] += cumulative
+                with self._lock:
+                    self._imports.append((name, len(stack), cumulative, cumulative - children,
+                                          threading.current_thread().name))
+
+        builtins.__import__ = timed_import
+
+    def stop(self):
+        """Removes the import hook."""
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    # --- Report ---
+    def report(self):
+        """Returns {"phases": [...], "imports": [...]} with times in milliseconds."""
+        with self._lock:
+            phases = sorted(self._phases, key=lambda phase: phase[1])
+            imports = list(self._imports)
+        return {
+            "phases": [{"name": name, "start_ms": round(start * 1000, 1),
+                        "duration_ms": round(duration * 1000, 1) if duration is not None else None, "thread": thread}
+                       for name, start, duration, thread in phases],
+            "imports": [{"module": module, "depth": depth, "cumulative_ms": round(cumulative * 1000, 1),
+                         "self_ms": round(own * 1000, 1), "thread": thread}
+                        for module, depth, cumulative, own, thread in imports],
+        }
+
+    def print_report(self):
+        """Prints the phases and the slowest imports as rich tables, then removes the import hook."""
+        self.stop()
+        report = self.report()
+        table = Table(title="Profilo dell'avvio", style="cyan", title_style="bold magenta")
+        table.add_column("Fase", style="green")
+        table.add_column("Inizio ms", justify="right")
+        table.add_column("Durata ms", justify="right")
+        table.add_column("Thread")
+        for phase in report["phases"]:
+            duration = str(phase["duration_ms"]) if phase["duration_ms"] is not None else "-"
+            table.add_row(phase["name"], str(phase["start_ms"]), duration, phase["thread"])
+        rprint(table)
+
+        slowest = sorted((i for i in report["imports"] if i["cumulative_ms"] >= MIN_IMPORT_MS),
+                         key=lambda i: i["cumulative_ms"], reverse=True)[:PROFILE_TOP_IMPORTS]
+        if slowest:
+            table = Table(title="Import più lenti", style="cyan", title_style="bold magenta")
+            table.add_column("Modulo", style="green")
+            table.add_column("Cumulativo ms", justify="right")
+            table.add_column("Proprio ms", justify="right")
+            table.add_column("Thread")
+            for i in slowest:
+                table.add_row("  " * i["depth"] + i["module"], str(i["cumulative_ms"]), str(i["self_ms"]), i["thread"])
+            rprint(table)
+        return report
@@ -0,0 +1,104 @@
+# stt_config.py
+"""
+Configurazione del riconoscimento vocale (RealtimeSTT su faster-whisper).
+
+Dispositivo, tipo di calcolo e modello si scelgono da .env (STT_DEVICE,
+STT_COMPUTE_TYPE, STT_MODEL, STT_LANGUAGE) o da preferences.json
+(stt_device, stt_compute_type, stt_model, stt_language); il .env ha la
+precedenza. Con "auto" (il default) si usa la GPU CUDA se presente, con
+large-v3-turbo in float16, altrimenti la CPU con un modello più piccolo
+quantizzato int8, così l'assistente funziona anche sulle macchine senza GPU.
+La stessa configurazione è usata da benchmarks/bench_stt.py.
+"""
+import os
+import logging
+from dataclasses import dataclass
+
+DEFAULT_LANGUAGE = "it"
+GPU_DEFAULTS = ("large-v3-turbo", "float16")   # (modello, tipo di calcolo)
+CPU_DEFAULTS = ("small", "int8")
+
+# Tipi di calcolo di CTranslate2; sulla CPU quelli a 16 bit in virgola mobile non sono supportati
+COMPUTE_TYPES = ("int8", "int8_float16", "int8_float32", "int8_bfloat16", "int16", "float16", "bfloat16", "float32")
+CPU_COMPUTE_TYPES = ("int8", "int8_float32", "int16", "float32")
+DEVICES = ("cuda", "cpu")
+
+
+@dataclass(frozen=True)
+class SttConfig:
+    """A resolved speech-to-text configuration."""
+    model: str
+    device: str
+    compute_type: str
+    language: str = DEFAULT_LANGUAGE
+
+    def recorder_kwargs(self):
+        """Keyword arguments for RealtimeSTT.AudioToTextRecorder."""
+        return {"model": self.model, "device": self.device, "compute_type": self.compute_type, "language": self.language}
+
+    def describe(self):
+        return f"{self.model} su {self.device} ({self.compute_type}, lingua {self.language})"
+
+
+def cuda_available():
+    """True if CTranslate2 (the faster-whisper backend) sees at least one CUDA device."""
+    try:
+        import ctranslate2
+        return ctranslate2.get_cuda_device_count() > 0
+    except Exception:
+        return False
+
+
+def resolve(model="auto", device="auto", compute_type="auto", language=DEFAULT_LANGUAGE):
+    """
+    Turns possibly "auto" or invalid settings into a configuration that can run on this machine.
+
+    Args:
+        model (str, optional): faster-whisper model name or path, or "auto".
+        device (str, optional): "cuda", "cpu" or "auto".
+        compute_type (str, optional): One of COMPUTE_TYPES (e.g. int8, int8_float16) or "auto".
+        language (str, optional): Language code of the speech. Defaults to Italian.
+    """
+    device = (device or "auto").lower()
+    compute_type = (compute_type or "auto").lower()
+    if device not in DEVICES + ("auto",):
+        logging.warning(f"Dispositivo STT '{device}' sconosciuto, uso la selezione automatica.")
+        device = "auto"
+    if device == "auto":
+        device = "cuda" if cuda_available() else "cpu"
+    elif device == "cuda" and not cuda_available():
+        logging.warning("STT_DEVICE=cuda ma nessuna GPU CUDA disponibile: uso la CPU.")
+        device = "cpu"
+
+    default_model, default_compute = GPU_DEFAULTS if device == "cuda" else CPU_DEFAULTS
+    if compute_type not in COMPUTE_TYPES + ("auto",):
+        logging.warning(f"Tipo di calcolo STT '{compute_type}' sconosciuto, uso {default_compute}.")
+        compute_type = "auto"
+    if compute_type == "auto":
+        compute_type = default_compute
+    elif device == "cpu" and compute_type not in CPU_COMPUTE_TYPES:
+        logging.warning(f"Il tipo di calcolo {compute_type} non è supportato sulla CPU, uso {CPU_DEFAULTS[1]}.")
+        compute_type = CPU_DEFAULTS[1]
+    if not model or model == "auto":
+        model = default_model
+    return SttConfig(model=model, device=device, compute_type=compute_type, language=language or DEFAULT_LANGUAGE)
+
+
+def load_stt_config(preferences=None):
+    """
+    Builds the configuration from the environment and, for the settings not set there, from the preferences.
+
+    Args:
+        preferences (dict, optional): The user preferences (see tools.load_preferences).
+    """
+    preferences = preferences or {}
+
+    def setting(env_name, preference_key, default="auto"):
+        return os.getenv(env_name) or preferences.get(preference_key) or default
+
+    return resolve(
+        model=setting("STT_MODEL", "stt_model"),
+        device=setting("STT_DEVICE", "stt_device"),
+        compute_type=setting("STT_COMPUTE_TYPE", "stt_compute_type"),
+        language=setting("STT_LANGUAGE", "stt_language", DEFAULT_LANGUAGE),
+    )
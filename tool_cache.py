@@ -0,0 +1,150 @@
+# tool_cache.py
+"""
+Cache in memoria dei risultati dei tool di sola lettura.
+
+La chiave è il nome del tool più gli argomenti normalizzati (già convertiti
+nei tipi dichiarati e completati con i valori di default), così
+``octoprint_list_files()`` e ``octoprint_list_files(location="local")``
+condividono la stessa voce. Ogni tool ha il suo TTL (``cache_seconds`` nel
+decoratore del registro); oltre TOOL_CACHE_MAX_ENTRIES voci viene scartata
+quella usata meno di recente. I tool che modificano qualcosa invalidano le
+voci dei tool interessati, e ogni invalidazione fa scartare anche i
+risultati ancora in calcolo, che potrebbero essere già vecchi.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+class _CacheStats:
+    __slots__ = ("hits", "misses")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def to_dict(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None}
+
+
+class ToolResultCache:
+    """Thread-safe LRU cache of tool results with a TTL per entry."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # (tool, argomenti in JSON) -> (scadenza, risultato)
+        self._generations = {}          # tool -> numero di invalidazioni
+        self._generation = 0            # invalidazioni globali
+        self._stats = {}
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Builds the cache from TOOL_CACHE_MAX_ENTRIES (0 disables it)."""
+        try:
+            max_entries = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        except ValueError:
+            logging.warning("TOOL_CACHE_MAX_ENTRIES non valido, uso il valore predefinito.")
+            max_entries = DEFAULT_MAX_ENTRIES
+        return cls(max_entries=max(0, max_entries))
+
+    @staticmethod
+    def _key(tool, args):
+        return tool, json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)
+
+    def generation(self, tool):
+        """Opaque token to pass to put(): a result computed before an invalidation is not stored."""
+        with self._lock:
+            return self._generation, self._generations.get(tool, 0)
+
+    def get(self, tool, args):
+        """
+        Looks up a result.
+
+        Returns:
+            tuple: (True, result) on a hit, (False, None) on a miss or an expired entry.
+        """
+        key = self._key(tool, args)
+        with self._lock:
+            stats = self._stats.setdefault(tool, _CacheStats())
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                stats.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            stats.hits += 1
+            return True, entry[1]
+
+    def put(self, tool, args, result, ttl, generation=None):
+        """Stores a result for ttl seconds, unless the tool was invalidated since generation was taken."""
+        if not self.max_entries or not ttl or ttl <= 0:
+            return
+        key = self._key(tool, args)
+        with self._lock:
+            if generation is not None and generation != (self._generation, self._generations.get(tool, 0)):
+                return
+            self._entries[key] = (time.monotonic() + ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, tools=None):
+        """
+        Drops cached results.
+
+        Args:
+            tools (iterable, optional): Names of the tools whose results to drop. All of them if None.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        with self._lock:
+            if tools is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._generation += 1
+            else:
+                tools = set(tools)
+                keys = [key for key in self._entries if key[0] in tools]
+                for key in keys:
+                    del self._entries[key]
+                for tool in tools:
+                    self._generations[tool] = self._generations.get(tool, 0) + 1
+                removed = len(keys)
+            self._invalidations += removed
+        if removed:
+            logging.info(f"Cache dei tool: {removed} risultati invalidati ({'tutti' if tools is None else ', '.join(sorted(tools))})") # This will be INFO level
+        return removed
+
+    def stats(self):
+        """Returns overall and per-tool hit/miss counters, hit rate, evictions, expirations and invalidations."""
+        with self._lock:
+            per_tool = {tool: stats.to_dict() for tool, stats in self._stats.items()}
+            hits = sum(stats["hits"] for stats in per_tool.values())
+            misses = sum(stats["misses"] for stats in per_tool.values())
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+                "tools": per_tool,
+            }
@@ -0,0 +1,354 @@
+# tool_registry.py
+"""
+Registro dei tool esposti a Gemini.
+
+I tool si registrano con il decoratore ``@registry.tool(...)`` e le
+dichiarazioni per Gemini (descrizione, parametri con tipo e descrizione,
+parametri obbligatori) vengono generate una sola volta dalla firma e dalla
+docstring in stile Google (testo iniziale e sezione ``Args:``), così non
+esiste più un file di dichiarazioni da tenere allineato a mano.
+
+Il registro esegue anche le chiamate del modello: controlla e converte gli
+argomenti nei tipi dichiarati (Gemini passa i numeri come float e le liste
+come oggetti proto), applica un limite di chiamate contemporanee e la
+cache dei risultati (tool_cache.py) con TTL per tool, invalidata dopo i tool
+che modificano qualcosa, e tiene contatori di chiamate ed errori con un
+istogramma delle latenze.
+"""
+import re
+import time
+import typing
+import inspect
+import logging
+import threading
+from collections import deque
+
+from tool_cache import ToolResultCache
+
+LATENCY_SAMPLES = 500
+LATENCY_BUCKETS_MS = (10, 100, 1000, 10000)   # limiti superiori dell'istogramma, l'ultimo intervallo è aperto
+INTERNAL_PARAMETERS = ("job",)                  # parametri di uso interno, mai esposti al modello
+
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", list: "array", dict: "object"}
+_DOCSTRING_TYPES = {"str": str, "int": int, "float": float, "bool": bool, "list": list, "dict": dict}
+_SECTION = re.compile(r"^(Args|Arguments|Returns|Raises|Yields|Examples?|Notes?):\s*$")
+_ARGUMENT = re.compile(r"^(\w+)\s*(?:\(([^)]*)\))?\s*:\s*(.*)$")
+_TRUE_STRINGS = ("true", "1", "yes", "si", "sì", "on")
+_FALSE_STRINGS = ("false", "0", "no", "off", "")
+_ERROR_PREFIXES = ("Error", "An unexpected error")     # tool che segnalano gli errori nel testo restituito
+
+
+class ToolArgumentError(ValueError):
+    """The model called a tool with missing or invalid arguments."""
+
+
+def parse_docstring(doc):
+    """
+    Splits a Google-style docstring.
+
+    Returns:
+        tuple: (description, {parameter: (type name or None, description)}), where the
+        description is the text before the first section, on one line.
+    """
+    lines = inspect.cleandoc(doc or "").splitlines()
+    description, arguments = [], {}
+    section, current, indent = None, None, None
+    for line in lines:
+        match = _SECTION.match(line.strip()) if not line.startswith(" ") else None
+        if match:
+            section, current, indent = match.group(1), None, None
+            continue
+        if section is None:
+            description.append(line.strip())
+        elif section in ("Args", "Arguments") and line.strip():
+            line_indent = len(line) - len(line.lstrip())
+            argument = _ARGUMENT.match(line.strip())
+            if argument and (indent is None or line_indent <= indent):
+                indent = line_indent
+                name, type_spec, text = argument.groups()
+                type_name = type_spec.split(",")[0].strip() if type_spec else None
+                current = name
+                arguments[name] = [type_name, text.strip()]
+            elif current:
+                arguments[current][1] = f"{arguments[current][1]} {line.strip()}".strip()
+    text = " ".join(part for part in description if part)
+    return text, {name: tuple(value) for name, value in arguments.items()}
+
+
+def _python_type(annotation, type_name=None):
+    # Tipo Python di un parametro: annotazione (anche Optional[X] o list[str]) o, in mancanza, tipo nella docstring
+    if annotation is not inspect.Parameter.empty:
+        origin = typing.get_origin(annotation)
+        if origin is typing.Union:
+            annotation = next((a for a in typing.get_args(annotation) if a is not type(None)), str)
+            origin = typing.get_origin(annotation)
+        annotation = origin or annotation
+        if annotation in _JSON_TYPES:
+            return annotation
+    return _DOCSTRING_TYPES.get((type_name or "").lower(), str)
+
+
+class _ToolStats:
+    """Call counters and latency histogram of one tool."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, seconds, ok):
+        self.calls += 1
+        self.errors += 0 if ok else 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.samples.append(seconds)
+        ms = seconds * 1000
+        self.histogram[next((i for i, limit in enumerate(LATENCY_BUCKETS_MS) if ms < limit), len(LATENCY_BUCKETS_MS))] += 1
+
+    def to_dict(self):
+        ordered = sorted(self.samples)
+
+        def percentile(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1) if ordered else None
+
+        labels = [f"<{limit}ms" for limit in LATENCY_BUCKETS_MS] + [f">={LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "cache_hits": self.cache_hits,
+            "mean_ms": round(self.total_seconds / self.calls * 1000, 1) if self.calls else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(self.max_seconds * 1000, 1),
+            "histogram": dict(zip(labels, self.histogram)),
+        }
+
+
+class ToolSpec:
+    """A registered tool: the function, its generated declaration and its execution options."""
+
+    def __init__(self, func, read_only=False, cache_seconds=None, max_concurrency=None, invalidates=None):
+        self.func = func
+        self.name = func.__name__
+        self.read_only = read_only
+        self.cache_seconds = cache_seconds if read_only else None
+        self.invalidates = None if invalidates is None else tuple(invalidates)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self.stats = _ToolStats()
+
+        description, documented = parse_docstring(func.__doc__)
+        self.description = description
+        self.parameters = {}   # nome -> (tipo Python, obbligatorio)
+        self.defaults = {}
+        properties, required = {}, []
+        for name, parameter in inspect.signature(func).parameters.items():
+            if name.startswith("_") or name in INTERNAL_PARAMETERS or \
+                    parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+                continue
+            type_name, text = documented.get(name, (None, ""))
+            python_type = _python_type(parameter.annotation, type_name)
+            is_required = parameter.default is inspect.Parameter.empty
+            self.parameters[name] = (python_type, is_required)
+            if not is_required:
+                self.defaults[name] = parameter.default
+            schema = {"type": _JSON_TYPES[python_type]}
+            if python_type is list:
+                schema["items"] = {"type": "string"}
+            if text:
+                schema["description"] = text
+            properties[name] = schema
+            if is_required:
+                required.append(name)
+        if not description:
+            logging.warning(f"Il tool {self.name} non ha una docstring: il modello non saprà a cosa serve.")
+        self.declaration = {
+            "name": self.name,
+            "description": description,
+            "parameters": {"type": "object", "properties": properties, "required": required},
+        }
+
+    def coerce_arguments(self, args):
+        """Returns the arguments converted to the declared types; raises ToolArgumentError if they do not fit."""
+        coerced = {}
+        for name, value in (args or {}).items():
+            if name not in self.parameters:
+                logging.warning(f"Argomento sconosciuto '{name}' per il tool {self.name}, ignorato.")
+                continue
+            if value is None:
+                continue
+            try:
+                coerced[name] = _coerce(value, self.parameters[name][0])
+            except (TypeError, ValueError):
+                raise ToolArgumentError(f"argument '{name}' must be of type {_JSON_TYPES[self.parameters[name][0]]}, got {value!r}")
+        missing = [name for name, (_, is_required) in self.parameters.items() if is_required and name not in coerced]
+        if missing:
+            raise ToolArgumentError(f"missing required argument(s): {', '.join(missing)}")
+        return coerced
+
+    def cache_key_arguments(self, kwargs):
+        """The coerced arguments completed with the defaults, so equivalent calls share a cache entry."""
+        return {**self.defaults, **kwargs}
+
+
+def _is_error(result):
+    # Esiti da non mettere in cache né contare come successi
+    if isinstance(result, dict):
+        return result.get("status") == "error"
+    return isinstance(result, str) and result.startswith(_ERROR_PREFIXES)
+
+
+def _plain(value):
+    # Converte i contenitori proto dell'SDK (MapComposite, RepeatedComposite) in dict e liste Python
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, "keys"):
+        return {str(k): _plain(value[k]) for k in value.keys()}
+    if hasattr(value, "__iter__"):
+        return [_plain(v) for v in value]
+    return value
+
+
+def _coerce(value, python_type):
+    value = _plain(value)
+    if python_type is str:
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))   # gli id numerici arrivano come 3.0
+        if isinstance(value, (dict, list)):
+            raise TypeError(value)
+        return str(value)
+    if python_type is bool:
+        if isinstance(value, str):
+            if value.strip().lower() in _TRUE_STRINGS:
+                return True
+            if value.strip().lower() in _FALSE_STRINGS:
+                return False
+            raise ValueError(value)
+        if isinstance(value, (int, float)):
+            return bool(value)
+        raise TypeError(value)
+    if python_type is int:
+        if isinstance(value, bool):
+            raise TypeError(value)
+        if isinstance(value, float):
+            if not value.is_integer():
+                raise ValueError(value)
+            return int(value)
+        return int(value)
+    if python_type is float:
+        if isinstance(value, bool):
+            raise TypeError(value)
+        return float(value)
+    if python_type is list:
+        if isinstance(value, list):
+            return [str(int(v)) if isinstance(v, float) and v.is_integer() else v for v in value]
+        if isinstance(value, dict):
+            raise TypeError(value)
+        return [value]
+    if python_type is dict:
+        if not isinstance(value, dict):
+            raise TypeError(value)
+        return value
+    return value
+
+
+class ToolRegistry:
+    """Tools available to the model, registered with the ``tool`` decorator."""
+
+    def __init__(self, cache=None):
+        self._tools = {}
+        self._declarations = None
+        self.cache = cache if cache is not None else ToolResultCache.from_env()
+
+    def tool(self, read_only=False, cache_seconds=None, max_concurrency=None, invalidates=None):
+        """
+        Decorator that registers a function as a tool; the function itself is returned unchanged.
+
+        Args:
+            read_only (bool, optional): The tool changes nothing (files, printers, jobs), so calls
+                                        can run in parallel with other read-only tools.
+            cache_seconds (float, optional): Reuse the result of an identical call for this long.
+                                             Only honoured for read-only tools, and a cache hit skips the
+                                             function, so not for tools with side effects like console output.
+            max_concurrency (int, optional): Maximum number of simultaneous calls of this tool.
+            invalidates (iterable, optional): For tools that change something, the tools whose cached
+                                              results become stale. Defaults to all of them; pass an
+                                              empty tuple if the tool affects no cached result.
+        """
+        def register(func):
+            spec = ToolSpec(func, read_only=read_only, cache_seconds=cache_seconds,
+                            max_concurrency=max_concurrency, invalidates=invalidates)
+            self._tools[spec.name] = spec
+            self._declarations = None
+            return func
+        return register
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def names(self):
+        return list(self._tools)
+
+    def get(self, name):
+        return self._tools.get(name)
+
+    def is_read_only(self, name):
+        spec = self._tools.get(name)
+        return bool(spec and spec.read_only)
+
+    def declarations(self):
+        """Gemini function declarations of all the tools, generated once."""
+        if self._declarations is None:
+            self._declarations = [spec.declaration for spec in self._tools.values()]
+        return self._declarations
+
+    def invalidate(self, *names):
+        """Drops the cached results of the given tools, or of every tool if no name is given."""
+        return self.cache.invalidate(names or None)
+
+    def call(self, name, args=None):
+        """
+        Validates the arguments and runs a tool, honouring its cache and concurrency limit.
+        Once a tool that changes something has run, the results it may have made stale are dropped.
+
+        Raises:
+            KeyError: If no tool has this name.
+            ToolArgumentError: If the arguments are missing or of the wrong type.
+        """
+        spec = self._tools[name]
+        kwargs = spec.coerce_arguments(args)
+        cache_args = generation = None
+        if spec.cache_seconds and self.cache.max_entries:
+            cache_args = spec.cache_key_arguments(kwargs)
+            hit, cached = self.cache.get(name, cache_args)
+            if hit:
+                spec.stats.cache_hits += 1
+                logging.info(f"Risultato di {name} dalla cache") # This will be INFO level
+                return cached
+            generation = self.cache.generation(name)
+
+        start = time.perf_counter()
+        ok = False
+        try:
+            if spec._semaphore is not None:
+                with spec._semaphore:
+                    result = spec.func(**kwargs)
+            else:
+                result = spec.func(**kwargs)
+            ok = not _is_error(result)
+        finally:
+            spec.stats.record(time.perf_counter() - start, ok)
+            # Anche un'azione fallita può aver cambiato qualcosa (es. un upload interrotto)
+            if not spec.read_only and spec.invalidates != ():
+                self.cache.invalidate(spec.invalidates)
+
+        if cache_args is not None and ok:
+            self.cache.put(name, cache_args, result, spec.cache_seconds, generation=generation)
+        return result
+
+    def stats(self):
+        """Per-tool counters and latency statistics, for the tools called at least once."""
+        return {name: spec.stats.to_dict() for name, spec in self._tools.items() if spec.stats.calls or spec.stats.cache_hits}
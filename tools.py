@@ -1,11 +1,26 @@
 import os
+import time
+import threading
 import subprocess
 import logging
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
-import markdownify # Or from bs4 import BeautifulSoup
+
+import gcode_cache
+import latency_stats
+import model_library
+import octoprint_client
+import octoprint_events
+import print_scheduler
+import slicing_jobs
+import tool_registry
+import shared_variables
+# gcode_analyzer, mesh_analysis, orientation_optimizer, print_time_estimator (NumPy) e markdownify
+# vengono importati nei tool che li usano, così l'avvio non ne paga il costo
 
 from rich.table import Table
+from rich.progress import Progress, TextColumn, BarColumn, DownloadColumn, TransferSpeedColumn, TimeRemainingColumn
 from rich.text import Text
 from rich import print as rprint
 from rich.logging import RichHandler
@@ -23,9 +38,14 @@ logging.basicConfig(
 # logging.getLogger("faster_whisper").setLevel(logging.WARNING)
 PREFERENCES_FILE = "preferences.json"
 
+# Registro dei tool esposti a Gemini: le dichiarazioni sono generate da firme e docstring
+TOOLS = tool_registry.ToolRegistry()
+tool = TOOLS.tool
+
 # --- Funzioni per le Preferenze (come definite prima) ---
+@tool(read_only=True, cache_seconds=300)
 def load_preferences():
-    """Loads user preferences from preferences.json."""
+    """Loads user preferences from preferences.json. Returns an empty dictionary if not found or on error."""
     if not os.path.exists(PREFERENCES_FILE):
         logging.info(f"{PREFERENCES_FILE} non trovato, ritorno dizionario vuoto.") # This will be INFO level
         return {} 
@@ -38,8 +58,15 @@ def load_preferences():
         logging.error(f"Errore nel caricare le preferenze: {e}")
         return {}
 
-def save_preferences(prefs):
-    """Saves user preferences to preferences.json."""
+@tool(invalidates=("load_preferences",))
+def save_preferences(prefs: dict):
+    """
+    Saves user preferences to preferences.json.
+
+    Args:
+        prefs (dict): The user preferences to save, e.g. {'printer_profile': 'MyPrusa', 'default_material': 'PLA'}.
+                      Keys and values are free-form.
+    """
     try:
         with open(PREFERENCES_FILE, 'w') as f:
             json.dump(prefs, f, indent=4)
@@ -51,6 +78,7 @@ def save_preferences(prefs):
 
 
 _silent_mode = False # Stato interno per la modalità silenziosa
+@tool(invalidates=())
 def toggle_silent_mode(state: bool):
     """
     Enables or disables silent mode.
@@ -72,34 +100,44 @@ def is_silent_mode(): # Funzione helper
     global _silent_mode
     return _silent_mode
 
-# Helper function to get OctoPrint base URL and headers
-def _get_octoprint_config():
-    octoprint_url = os.getenv("OCTOPRINT_URL")
-    octoprint_api_key = os.getenv("OCTOPRINT_API_KEY")
-    if not octoprint_url or not octoprint_api_key:
+# Centro del piatto usato per la correzione "no extrusions in the first layer"
+BED_CENTER_X = "125"
+BED_CENTER_Y = "105"
+
+def _get_octoprint_client(printer=None):
+    """Returns (client, error) for a printer of the registry (see octoprint_client.py); the default one if printer is None."""
+    registry = octoprint_client.get_registry()
+    if not registry.names():
         logging.error("OctoPrint URL or API Key not found in .env file.")
-        return None, None
-    headers = {"X-Api-Key": octoprint_api_key}
-    return octoprint_url, headers
+        return None, "OctoPrint configuration missing."
+    client = registry.get_client(printer)
+    if client is None:
+        return None, f"Sir, non conosco la stampante {printer}. Stampanti configurate: {', '.join(registry.names())}."
+    return client, None
 
 # --- OctoPrint Integration Functions ---
-def octoprint_list_files(location: str = "local", recursive: bool = True):
+@tool(read_only=True, cache_seconds=30)
+def octoprint_list_files(location: str = "local", recursive: bool = True, printer: str = None):
     """
     Lists files present on OctoPrint.
+
+    Args:
+        location (str, optional): Where to list files from on OctoPrint ('local' or 'sdcard'). Defaults to 'local'.
+        recursive (bool, optional): Whether to list files in subfolders too. Defaults to True.
+        printer (str, optional): Name of the printer in printers.json. Defaults to the default printer.
     """
-    octoprint_url, headers = _get_octoprint_config()
-    if not octoprint_url:
-        return {"status": "error", "message": "OctoPrint configuration missing."}
+    client, error = _get_octoprint_client(printer)
+    if error:
+        return {"status": "error", "message": error}
 
-    endpoint = f"{octoprint_url}/api/files"
+    endpoint, label = "/api/files", None
     if location and location != "all": # OctoPrint API uses /api/files for all, or /api/files/{location}
-        endpoint = f"{octoprint_url}/api/files/{location}"
+        endpoint, label = f"/api/files/{location}", "/api/files/{location}"
 
     params = {"recursive": "true" if recursive else "false"}
 
     try:
-        response = requests.get(endpoint, headers=headers, params=params)
-        response.raise_for_status()
+        response = client.get(endpoint, endpoint=label, params=params)
         data = response.json()
         
         # OctoPrint returns a dictionary with 'files' key
@@ -116,19 +154,21 @@ def octoprint_list_files(location: str = "local", recursive: bool = True):
         logging.error(f"Failed to decode JSON from OctoPrint file list response: {response.text}")
         return {"status": "error", "message": "Invalid JSON response from OctoPrint."}
 
-def octoprint_list_slicing_profiles(slicer_name: str):
+@tool(read_only=True, cache_seconds=600)
+def octoprint_list_slicing_profiles(slicer_name: str, printer: str = None):
     """
     Lists slicing profiles available for a given slicer in OctoPrint.
-    """
-    octoprint_url, headers = _get_octoprint_config()
-    if not octoprint_url:
-        return {"status": "error", "message": "OctoPrint configuration missing."}
 
-    endpoint = f"{octoprint_url}/api/slicing/profiles/{slicer_name}"
+    Args:
+        slicer_name (str): The slicer whose profiles to list (e.g. 'cura', 'prusa').
+        printer (str, optional): Name of the printer in printers.json. Defaults to the default printer.
+    """
+    client, error = _get_octoprint_client(printer)
+    if error:
+        return {"status": "error", "message": error}
 
     try:
-        response = requests.get(endpoint, headers=headers)
-        response.raise_for_status()
+        response = client.get(f"/api/slicing/profiles/{slicer_name}", endpoint="/api/slicing/profiles/{slicer}")
         data = response.json()
         
         # OctoPrint returns a dictionary with 'profiles' key
@@ -145,15 +185,20 @@ def octoprint_list_slicing_profiles(slicer_name: str):
         logging.error(f"Failed to decode JSON from OctoPrint slicing profiles response: {response.text}")
         return {"status": "error", "message": "Invalid JSON response from OctoPrint."}
 
-def octoprint_start_print(file_path_on_octoprint: str):
+@tool()
+def octoprint_start_print(file_path_on_octoprint: str, printer: str = None):
     """
     Starts printing an existing G-code file on OctoPrint.
+
+    Args:
+        file_path_on_octoprint (str): Path of the G-code file on OctoPrint
+                                      (e.g. 'folder_name/my_model.gcode', or 'my_model.gcode' if in the root).
+        printer (str, optional): Name of the printer in printers.json. Defaults to the default printer.
     """
-    octoprint_url, headers = _get_octoprint_config()
-    if not octoprint_url:
-        return {"status": "error", "message": "OctoPrint configuration missing."}
+    client, error = _get_octoprint_client(printer)
+    if error:
+        return {"status": "error", "message": error}
 
-    print_endpoint = f"{octoprint_url}/api/job"
     print_payload = {
         "command": "select",
         "file": file_path_on_octoprint,
@@ -161,24 +206,30 @@ def octoprint_start_print(file_path_on_octoprint: str):
     }
     logging.info(f"Attempting to print: {print_payload}")
     try:
-        response = requests.post(print_endpoint, headers=headers, json=print_payload)
-        response.raise_for_status()
+        client.post("/api/job", json=print_payload)
         logging.info(f"Print command sent successfully for {file_path_on_octoprint}.")
         return {"status": "success", "message": f"Print initiated for {file_path_on_octoprint}."}
     except requests.exceptions.RequestException as e:
         logging.error(f"Error during OctoPrint print: {e}")
         return {"status": "error", "message": f"Error connecting to OctoPrint or API issue during print: {e}"}
-    except json.JSONDecodeError:
-        logging.error(f"Failed to decode JSON from OctoPrint print response: {response.text}")
-        return {"status": "error", "message": "Invalid JSON response from OctoPrint during print."}
 
-def octoprint_slice_model(file_path_on_octoprint: str, slicer_name: str, slicing_profile_key: str, printer_profile_key: str = "_default", output_gcode_name: str = None, print_after_slice: bool = False):
+@tool()
+def octoprint_slice_model(file_path_on_octoprint: str, slicer_name: str, slicing_profile_key: str, printer_profile_key: str = "_default", output_gcode_name: str = None, print_after_slice: bool = False, printer: str = None):
     """
-    Slices an STL/3MF model on OctoPrint using a specified slicer and profile.
+    Slices an STL/3MF model on OctoPrint using a specified slicer and profile, optionally printing it afterwards.
+
+    Args:
+        file_path_on_octoprint (str): Path of the model on OctoPrint (e.g. 'models/my_object.stl').
+        slicer_name (str): The slicer to use (e.g. 'cura', 'prusa').
+        slicing_profile_key (str): Key of the slicing profile to use for that slicer.
+        printer_profile_key (str, optional): Key of the printer profile to use. Defaults to '_default'.
+        output_gcode_name (str, optional): Name of the G-code file to create. Defaults to the model name with .gcode.
+        print_after_slice (bool, optional): Start printing once slicing is complete. Defaults to False.
+        printer (str, optional): Name of the printer in printers.json. Defaults to the default printer.
     """
-    octoprint_url, headers = _get_octoprint_config()
-    if not octoprint_url:
-        return {"status": "error", "message": "OctoPrint configuration missing."}
+    client, error = _get_octoprint_client(printer)
+    if error:
+        return {"status": "error", "message": error}
 
     if not slicer_name or not slicing_profile_key:
         return {"status": "error", "message": "Slicer name and slicing profile key are required for slicing."}
@@ -189,7 +240,7 @@ def octoprint_slice_model(file_path_on_octoprint: str, slicer_name: str, slicing
     filename = path_parts[-1]
     path = '/'.join(path_parts[:-1]) if len(path_parts) > 1 else ""
 
-    slicing_endpoint = f"{octoprint_url}/api/slicing/{slicer_name}/{slicing_profile_key}"
+    slicing_endpoint = f"/api/slicing/{slicer_name}/{slicing_profile_key}"
     slicing_payload = {
         "command": "slice",
         "path": path,
@@ -204,75 +255,304 @@ def octoprint_slice_model(file_path_on_octoprint: str, slicer_name: str, slicing
 
     logging.info(f"Attempting to slice model: {slicing_payload}")
     try:
-        response = requests.post(slicing_endpoint, headers=headers, json=slicing_payload)
-        response.raise_for_status()
+        client.post(slicing_endpoint, endpoint="/api/slicing/{slicer}/{profile}", json=slicing_payload)
         logging.info(f"Slicing command sent successfully for {file_path_on_octoprint}.")
         return {"status": "success", "message": f"Slicing initiated for {file_path_on_octoprint} using {slicer_name} with profile {slicing_profile_key}. Print after slice: {print_after_slice}."}
     except requests.exceptions.RequestException as e:
         logging.error(f"Error during OctoPrint slicing: {e}")
         return {"status": "error", "message": f"Error connecting to OctoPrint or API issue during slicing: {e}"}
-    except json.JSONDecodeError:
-        logging.error(f"Failed to decode JSON from OctoPrint slicing response: {response.text}")
-        return {"status": "error", "message": "Invalid JSON response from OctoPrint during slicing."}
+
+@tool(max_concurrency=2)
+def octoprint_upload_file(gcode_file_path: str = None, printer: str = None, remote_name: str = None, print_after_upload: bool = False):
+    """
+    Uploads a G-code file to OctoPrint, streaming it in chunks with a progress bar.
+
+    The upload is skipped if OctoPrint already has an identical file (same name and SHA-1).
+
+    Args:
+        gcode_file_path (str, optional): G-code to upload (name in the default folder or full path).
+                                         Defaults to the last G-code produced by slice_model.
+        printer (str, optional): Name of the printer in printers.json. Defaults to the default printer.
+        remote_name (str, optional): Name (and folder) on OctoPrint. Defaults to the local file name.
+        print_after_upload (bool, optional): Start printing the file once uploaded. Defaults to False.
+    """
+    client, error = _get_octoprint_client(printer)
+    if error:
+        return {"status": "error", "message": error}
+    gcode_path, error = _resolve_gcode_path(gcode_file_path)
+    if error:
+        return {"status": "error", "message": error}
+
+    size = os.path.getsize(gcode_path)
+    with Progress(TextColumn("[bold magenta]{task.description}"), BarColumn(), DownloadColumn(),
+                  TransferSpeedColumn(), TimeRemainingColumn(), transient=True) as progress:
+        task = progress.add_task(f"Upload {os.path.basename(gcode_path)}", total=size)
+        try:
+            result = client.upload(gcode_path, remote_name, print_after=print_after_upload,
+                                   progress=lambda sent, total: progress.update(task, completed=sent, total=total))
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error uploading to OctoPrint: {e}")
+            return {"status": "error", "message": f"Error connecting to OctoPrint or API issue during upload: {e}"}
+        except OSError as e:
+            logging.error(f"Error reading G-code for upload: {e}")
+            return {"status": "error", "message": f"Errore nel leggere il file {os.path.basename(gcode_path)}: {e}"}
+
+    started = " e avviato la stampa" if print_after_upload else ""
+    if result["skipped"]:
+        message = f"Ok, Glitch, {result['remote_name']} era già su {client.name}: niente da caricare{started}."
+    else:
+        speed = size / 1e6 / result["seconds"] if result["seconds"] else 0
+        message = f"Ok, Glitch, ho caricato {result['remote_name']} su {client.name} ({size / 1e6:.1f} MB in {result['seconds']:.1f}s, {speed:.1f} MB/s){started}."
+    return {"status": "success", "message": message, **result}
+
+@tool(read_only=True)
+def get_octoprint_metrics(printer: str = None):
+    """
+    Returns latency statistics (calls, errors, retries, mean/p50/p95/max ms) for each OctoPrint API endpoint used so far.
+
+    Args:
+        printer (str, optional): Name of the printer in printers.json. Defaults to the default printer.
+    """
+    client, error = _get_octoprint_client(printer)
+    if error:
+        return {"status": "error", "message": error}
+    metrics = client.metrics()
+    if not metrics:
+        return {"status": "success", "message": "Sir, non ho ancora fatto chiamate a OctoPrint.", "metrics": {}}
+
+    table = Table(title=f"Latenza API OctoPrint ({client.name})", style="cyan", title_style="bold magenta")
+    table.add_column("Endpoint", style="green")
+    for column in ("Chiamate", "Errori", "Ripetute", "Media ms", "p95 ms", "Max ms"):
+        table.add_column(column, justify="right")
+    for label, stats in metrics.items():
+        table.add_row(label, str(stats["calls"]), str(stats["errors"]), str(stats["retries"]),
+                      str(stats["mean_ms"]), str(stats["p95_ms"]), str(stats["max_ms"]))
+    rprint(table)
+    return {"status": "success", "metrics": metrics}
+
+# --- Eventi push delle stampanti ---
+_printer_monitor = None
+_printer_monitor_lock = threading.Lock()
+_ALERT_STYLES = {
+    "PrintDone": ("bold green", "Stampa completata"),
+    "PrintFailed": ("bold red", "Stampa fallita"),
+    "Error": ("bold red", "Errore della stampante"),
+    "Disconnected": ("bold red", "Stampante disconnessa"),
+    "PrintPaused": ("bold yellow", "Stampa in pausa"),
+    "PrintCancelled": ("bold yellow", "Stampa annullata"),
+}
+
+def _on_printer_event(printer, event, payload, summary):
+    # Avviso immediato in console, senza passare dall'LLM
+    style, label = _ALERT_STYLES.get(event, ("bold", event))
+    file_name = payload.get("name") or (summary or {}).get("file")
+    rprint(f"[{style}]🔔 {label} su {printer}[/{style}]" + (f" ({file_name})" if file_name else ""))
+    logging.info(f"Evento {event} da {printer}: {payload}") # This will be INFO level
+    # Fine stampa e annullamenti aggiornano la cronologia dei file su OctoPrint
+    if event in ("PrintDone", "PrintFailed", "PrintCancelled"):
+        TOOLS.invalidate("octoprint_list_files")
+    # La coda di stampa distingue un annullamento da un guasto e può assegnare subito il prossimo lavoro
+    if _print_scheduler is not None:
+        _print_scheduler.printer_event(printer, event)
+
+def start_printer_monitor():
+    """
+    Starts the background subscription to the OctoPrint push events of every configured printer.
+    Safe to call more than once; does nothing if no printer is configured.
+    """
+    global _printer_monitor
+    with _printer_monitor_lock:
+        if _printer_monitor is None:
+            registry = octoprint_client.get_registry()
+            if not registry.names():
+                return None
+            _printer_monitor = octoprint_events.EventMonitor(registry, on_alert=_on_printer_event)
+            _printer_monitor.start()
+        return _printer_monitor
+
+@tool(read_only=True)
+def get_printers_status(refresh: bool = False):
+    """
+    Returns the state of every printer in the registry (printers.json): state, current file,
+    progress, time left and temperatures. Served instantly from the push event cache when it is
+    up to date, otherwise the printers are queried concurrently. Use this instead of fetching
+    OctoPrint URLs to know what the printers are doing.
+
+    Args:
+        refresh (bool, optional): Query the printers directly even if the cache is fresh. Defaults to False.
+    """
+    registry = octoprint_client.get_registry()
+    if not registry.names():
+        logging.error("OctoPrint URL or API Key not found in .env file.")
+        return {"status": "error", "message": "OctoPrint configuration missing."}
+
+    start = time.perf_counter()
+    printers = None
+    if _printer_monitor is not None and not refresh:
+        printers = _printer_monitor.cache.snapshot(registry.names())
+    source = "cache" if printers is not None else "api"
+    if printers is None:
+        printers = registry.status_all()
+    elapsed = time.perf_counter() - start
+
+    table = Table(title="Stato Stampanti", style="cyan", title_style="bold magenta")
+    table.add_column("Stampante", style="green")
+    table.add_column("Stato")
+    table.add_column("File", overflow="fold")
+    table.add_column("Progresso", justify="right")
+    table.add_column("Rimanente", justify="right")
+    table.add_column("Ugello °C", justify="right")
+    table.add_column("Piatto °C", justify="right")
+    for p in printers:
+        state_style = "red" if not p["online"] else ("yellow" if p["state"] == "Printing" else "white")
+        progress = f"{p['progress_percent']:.0f}%" if p.get("progress_percent") is not None else "-"
+        left = latency_stats.format_duration(p["print_time_left_seconds"]) if p.get("print_time_left_seconds") else "-"
+        nozzle = f"{p['nozzle_temperature']:.0f}/{p['nozzle_target'] or 0:.0f}" if p.get("nozzle_temperature") is not None else "-"
+        bed = f"{p['bed_temperature']:.0f}/{p['bed_target'] or 0:.0f}" if p.get("bed_temperature") is not None else "-"
+        table.add_row(p["printer"], Text(p["state"], style=state_style), p.get("file") or "-", progress, left, nozzle, bed)
+    rprint(table)
+
+    online = sum(1 for p in printers if p["online"])
+    printing = sum(1 for p in printers if p.get("state") == "Printing")
+    logging.info(f"Stato di {len(printers)} stampanti in {elapsed:.3f}s ({source})") # This will be INFO level
+    return {
+        "status": "success",
+        "message": f"Sir, {online} stampanti su {len(printers)} sono raggiungibili e {printing} stanno stampando.",
+        "printers": printers,
+        "source": source,
+        "seconds": round(elapsed, 3),
+    }
 
 # --- End OctoPrint Integration Functions ---
 
-def get_files_from_default_folder():
-    """Helper function to get a list of files."""
-    default_folder = os.getenv("STL_DEFAULT_FOLDER")
-    if not default_folder or not os.path.exists(default_folder):
-        logging.error(f"Cartella STL predefinita non trovata o non impostata: {default_folder}")
-        return []
-        
-    supported_extensions = ['.stl', '.3mf', '.obj'] # Puoi aggiungere altri formati
-    found_files = []
-    try:
-        for f_name in os.listdir(default_folder):
-            if os.path.isfile(os.path.join(default_folder, f_name)) and                any(f_name.lower().endswith(ext) for ext in supported_extensions):
-                found_files.append(f_name)
-        logging.info(f"File trovati nella cartella di default: {found_files}") # This will be INFO level
-        return sorted(found_files) # Ritorna i file ordinati
-    except Exception as e:
-        logging.error(f"Errore nel leggere la cartella di default: {e}")
-        return []
+MAX_LISTED_MODELS = 100
+FUZZY_MATCH_THRESHOLD = 0.75 # punteggio minimo per accettare un nome simile (errori di trascrizione)
+
+def _get_model_library():
+    """Returns the model library for STL_DEFAULT_FOLDER, or None if the folder is not configured."""
+    library = model_library.get_default_library()
+    if library is None:
+        logging.error(f"Cartella STL predefinita non trovata o non impostata: {os.getenv('STL_DEFAULT_FOLDER')}")
+    return library
 
-def list_stl_files():
+@tool(read_only=True) # niente cache: la tabella va stampata a ogni chiamata, e la query all'indice costa poco
+def list_stl_files(query: str = None):
     """
-    Lists 3D printable files (STL, 3MF, OBJ) in the default folder using a rich Table.
+    Lists 3D printable files (STL, 3MF, OBJ) in the default folder and its subfolders using a rich Table.
+
+    Files come from the model library index (see model_library.py), so each one has a
+    stable id that can be passed to the other tools in place of its name.
+
+    Args:
+        query (str, optional): Part of a model name to search for. Similar names are
+                               matched too, so small typos are tolerated.
     """
-    found_files = get_files_from_default_folder()
+    library = _get_model_library()
+    if library is None:
+        return "Sir, non ho trovato file stampabili nella cartella predefinita."
 
-    if not found_files:
+    total = library.count()
+    models = library.search(query, limit=MAX_LISTED_MODELS) if query else library.list(limit=MAX_LISTED_MODELS)
+    if not models:
+        if query:
+            return f"Sir, non ho trovato modelli simili a '{query}'."
         return "Sir, non ho trovato file stampabili nella cartella predefinita."
 
-    table = Table(title="Modelli 3D Disponibili", style="cyan", title_style="bold magenta", show_lines=True)
+    title = f"Modelli 3D simili a '{query}'" if query else "Modelli 3D Disponibili"
+    table = Table(title=title, style="cyan", title_style="bold magenta", show_lines=True)
 
-    table.add_column("#", style="dim cyan", justify="right", width=3)
+    table.add_column("#", style="dim cyan", justify="right", width=5)
     table.add_column("Nome File", style="green", overflow="fold")
+    table.add_column("MB", justify="right")
+    table.add_column("Triangoli", justify="right")
 
-    for i, f_name in enumerate(found_files, 1):
-        table.add_row(str(i), Text(f_name, style="green"))
+    for model in models:
+        stats = model["stats"] or {}
+        triangles = str(stats["triangles"]) if "triangles" in stats else "-"
+        table.add_row(str(model["id"]), Text(model["relative_path"], style="green"),
+                      f"{model['size'] / 1e6:.1f}", triangles)
     
     rprint(table) 
     
+    if not query and total > len(models):
+        return f"Ok, Glitch. Ho mostrato i primi {len(models)} file su {total}: chiedimi di cercarne uno per nome per vedere gli altri."
     return "Ok, Glitch. Ho mostrato i file disponibili in una tabella."
 
-def slice_model(file_path: str, output_path: str = None):
+def _find_model(library, identifier):
+    """Looks a model up by name, then as a path in the library folder, then by similar name."""
+    model = library.find_by_name(identifier)
+    if model is not None:
+        return model
+    direct_path = os.path.join(library.root, identifier)
+    if os.path.isfile(direct_path):
+        return {"path": direct_path}
+    matches = library.search(identifier, limit=1)
+    if matches and matches[0]["score"] >= FUZZY_MATCH_THRESHOLD:
+        logging.info(f"'{identifier}' non trovato, uso il modello più simile: {matches[0]['relative_path']} ({matches[0]['score']})") # This will be INFO level
+        return matches[0]
+    return None
+
+def _resolve_model_path(file_path):
+    """
+    Resolves a model identifier: an id from list_stl_files, a name or relative path
+    in STL_DEFAULT_FOLDER (also in subfolders, tolerating small typos) or a full path.
+    """
+    identifier = str(file_path).strip()
+    if os.path.isabs(identifier):
+        if not os.path.exists(identifier):
+            logging.error(f"File di input non trovato: {identifier}")
+            return None, f"Errore: Non riesco a trovare il file {os.path.basename(identifier)} da processare."
+        return identifier, None
+
+    library = _get_model_library()
+    if library is None:
+        logging.error("Percorso file non assoluto e STL_DEFAULT_FOLDER non impostato.")
+        return None, "Errore: Hai fornito solo un nome file, ma la cartella predefinita non è configurata."
+
+    if identifier.isdigit():
+        model = library.get(int(identifier))
+        if model is None:
+            return None, f"Sir, il numero {identifier} non corrisponde a nessun modello della libreria."
+        logging.info(f"Utente ha selezionato il numero {identifier}, mappato a: {model['path']}") # This will be INFO level
+        return model["path"], None
+
+    model = _find_model(library, identifier)
+    if model is None and library.rescan_if_stale() is not None:
+        # Un file appena copiato nella cartella entra nell'indice solo alla scansione successiva (senza
+        # watchdog fino a MODEL_LIBRARY_RESCAN_SECONDS): si riscansiona, al massimo ogni pochi secondi, e si riprova
+        model = _find_model(library, identifier)
+    if model is None or not os.path.exists(model["path"]):
+        logging.error(f"File di input non trovato nella libreria: {identifier}")
+        return None, f"Errore: Non riesco a trovare il file {os.path.basename(identifier)} da processare."
+    return model["path"], None
+
+@tool(max_concurrency=2)
+def slice_model(file_path: str, output_path: str = None, auto_orient: bool = False):
     """
     Slices a 3D model using PrusaSlicer and saves the G-code.
 
     This function can take a file name (if in the default STL folder),
-    an index number (from 'list_stl_files'), or an absolute path to an STL/3MF/OBJ model.
+    an id number (from 'list_stl_files'), or an absolute path to an STL/3MF/OBJ model.
     It attempts to automatically fix 'no extrusions in the first layer' errors by centering the model.
+    Results are cached on disk (see gcode_cache.py): repeating a request for the same model,
+    slicer build and preferences returns the cached G-code without running PrusaSlicer.
     Returns a dictionary with status, message, and gcode_path on success.
 
     Args:
         file_path (str): The identifier for the 3D model file to slice.
-                         Can be a name, an index from `list_stl_files`, or a full path.
+                         Can be a name, an id from `list_stl_files`, or a full path.
         output_path (str, optional): The desired path for the output G-code file.
                                      If not provided, G-code is saved next to the input model
                                      with the same base name. Defaults to None.
+        auto_orient (bool, optional): If True, the model is rotated to the orientation found by
+                                      optimize_orientation before slicing. Defaults to False.
     """
+    result = _slice_model(file_path, output_path, auto_orient=auto_orient)
+    if isinstance(result, dict) and result.get("status") == "success" and result.get("gcode_path"):
+        shared_variables.last_gcode_path = result["gcode_path"]
+    return result
+
+def _slice_model(file_path, output_path=None, job=None, auto_orient=False):
     prusa_executable = os.getenv("PRUSA_SLICER_PATH")
     default_folder = os.getenv("STL_DEFAULT_FOLDER")
     
@@ -283,28 +563,9 @@ def slice_model(file_path: str, output_path: str = None):
         logging.error(f"PrusaSlicer executable not found at: {prusa_executable}")
         return {"status": "error", "message": f"Errore: Non trovo PrusaSlicer qui: {prusa_executable}."}
 
-    actual_file_path = ""
-    try:
-        file_index = int(file_path.strip()) - 1
-        available_files = get_files_from_default_folder()
-        if 0 <= file_index < len(available_files):
-            actual_file_path = os.path.join(default_folder, available_files[file_index])
-            logging.info(f"Utente ha selezionato il numero {file_path}, mappato a: {actual_file_path}") # This will be INFO level
-        else:
-            return {"status": "error", "message": f"Sir, il numero {file_path} non è valido per la lista corrente."}
-    except ValueError: # Non era un numero, quindi è un nome file o un percorso
-        if not os.path.isabs(file_path):
-            if not default_folder:
-                logging.error("Percorso file non assoluto e STL_DEFAULT_FOLDER non impostato.")
-                return {"status": "error", "message": "Errore: Hai fornito solo un nome file, ma la cartella predefinita non è configurata."}
-            actual_file_path = os.path.join(default_folder, file_path)
-            logging.info(f"Il percorso è relativo, uso la cartella di default: {actual_file_path}") # This will be INFO level
-        else:
-            actual_file_path = file_path
-
-    if not actual_file_path or not os.path.exists(actual_file_path):
-        logging.error(f"File di input non trovato o non determinato: {actual_file_path}")
-        return {"status": "error", "message": f"Errore: Non riesco a trovare il file {os.path.basename(file_path)} da processare."}
+    actual_file_path, error = _resolve_model_path(file_path)
+    if error:
+        return {"status": "error", "message": error}
 
     # Costruzione nome G-code di output
     if output_path:
@@ -314,53 +575,336 @@ def slice_model(file_path: str, output_path: str = None):
         name_without_ext = os.path.splitext(base_name)[0]
         gcode_file = os.path.join(os.path.dirname(actual_file_path), f"{name_without_ext}.gcode")
     
-    common_args = ["-g", actual_file_path, "-o", gcode_file]
+    rotation_args = []
+    if auto_orient:
+        try:
+            rotation_args = _orientation_args(actual_file_path)
+        except Exception as e:
+            logging.warning(f"Orientamento automatico non riuscito per {actual_file_path}, uso quello originale: {e}")
+
+    common_args = ["-g"] + rotation_args + [actual_file_path, "-o", gcode_file]
     command_try1 = [prusa_executable] + common_args
-    
-    logging.info(f"Primo tentativo di slicing: {' '.join(command_try1)}") # This will be INFO level
-    
-    try:
-        result1 = subprocess.run(command_try1, capture_output=True, text=True, check=False, encoding='utf-8', errors='replace')
 
-        if result1.returncode == 0:
-            logging.info(f"Slicing riuscito al primo tentativo. Output: {gcode_file}") # This will be INFO level
+    # La chiave non include i percorsi di input/output: conta il contenuto del modello
+    cache = gcode_cache.get_default_cache()
+    try:
+        cache_key = cache.make_key(actual_file_path, prusa_executable, ["-g"] + rotation_args, load_preferences())
+        if cache.fetch(cache_key, gcode_file):
+            logging.info(f"G-code trovato in cache per {actual_file_path}. Output: {gcode_file}") # This will be INFO level
             return {
                 "status": "success",
-                "message": f"Fatto, Sir! Ho processato {os.path.basename(actual_file_path)} e salvato il G-code.",
-                "gcode_path": gcode_file
+                "message": f"Fatto, Sir! {os.path.basename(actual_file_path)} era già stato processato con le stesse impostazioni, ho recuperato il G-code dalla cache.",
+                "gcode_path": gcode_file,
+                "cached": True
             }
-        elif "no extrusions in the first layer" in result1.stderr:
-            logging.warning(f"Errore Z=0 rilevato (stderr: {result1.stderr[:200]}). Tento la correzione con --center.")
-            bed_center_x = "125" 
-            bed_center_y = "105"
-            command_try2 = [prusa_executable] + common_args + ["--center", f"{bed_center_x},{bed_center_y}"]
-            logging.info(f"Secondo tentativo di slicing: {' '.join(command_try2)}") # This will be INFO level
-            
-            result2 = subprocess.run(command_try2, capture_output=True, text=True, check=False, encoding='utf-8', errors='replace')
-
-            if result2.returncode == 0:
-                logging.info(f"Slicing riuscito al secondo tentativo (con --center). Output: {gcode_file}") # This will be INFO level
+    except Exception as e:
+        logging.warning(f"Cache G-code non disponibile, procedo con lo slicing: {e}")
+        cache_key = None
+
+    # Se il modello ha già richiesto --center in passato, il primo tentativo fallirebbe di nuovo
+    center_hint = None
+    if cache_key:
+        center_hint = f"center|{cache.file_digest(actual_file_path)}" + (f"|{' '.join(rotation_args)}" if rotation_args else "")
+    needs_center = bool(center_hint and cache.get_hint(center_hint))
+
+    try:
+        if needs_center:
+            logging.info(f"{os.path.basename(actual_file_path)} richiede --center (già visto in precedenza), salto il primo tentativo.") # This will be INFO level
+        else:
+            logging.info(f"Primo tentativo di slicing: {' '.join(command_try1)}") # This will be INFO level
+            result1 = _run_prusa_slicer(command_try1, job)
+
+            if result1.returncode == 0:
+                logging.info(f"Slicing riuscito al primo tentativo. Output: {gcode_file}") # This will be INFO level
+                if cache_key:
+                    cache.store(cache_key, gcode_file, source=actual_file_path)
                 return {
                     "status": "success",
-                    "message": f"Fatto, Sir! Ho dovuto riposizionare l'oggetto, ma ho processato {os.path.basename(actual_file_path)} e salvato il G-code.",
+                    "message": f"Fatto, Sir! Ho processato {os.path.basename(actual_file_path)} e salvato il G-code.",
                     "gcode_path": gcode_file
                 }
-            else:
-                logging.error(f"Anche il secondo tentativo è fallito. Stderr: {result2.stderr[:200]}")
-                return {"status": "error", "message": f"Sir, ho provato a riposizionare l'oggetto, ma lo slicing è fallito di nuovo. Errore: {result2.stderr[:100]}..."}
+            elif "no extrusions in the first layer" not in result1.stderr:
+                logging.error(f"PrusaSlicer ha fallito (Primo tentativo). Stderr: {result1.stderr[:200]}")
+                return {"status": "error", "message": f"Sir, c'è stato un problema durante lo slicing. Errore: {result1.stderr[:100]}..."}
+
+            logging.warning(f"Errore Z=0 rilevato (stderr: {result1.stderr[:200]}). Tento la correzione con --center.")
+            if center_hint:
+                cache.set_hint(center_hint, True)
+
+        command_try2 = [prusa_executable] + common_args + ["--center", f"{BED_CENTER_X},{BED_CENTER_Y}"]
+        logging.info(f"Secondo tentativo di slicing: {' '.join(command_try2)}") # This will be INFO level
+
+        result2 = _run_prusa_slicer(command_try2, job)
+
+        if result2.returncode == 0:
+            logging.info(f"Slicing riuscito al secondo tentativo (con --center). Output: {gcode_file}") # This will be INFO level
+            if cache_key:
+                cache.store(cache_key, gcode_file, source=actual_file_path, centered=True)
+            return {
+                "status": "success",
+                "message": f"Fatto, Sir! Ho dovuto riposizionare l'oggetto, ma ho processato {os.path.basename(actual_file_path)} e salvato il G-code.",
+                "gcode_path": gcode_file
+            }
         else:
-            logging.error(f"PrusaSlicer ha fallito (Primo tentativo). Stderr: {result1.stderr[:200]}")
-            return {"status": "error", "message": f"Sir, c'è stato un problema durante lo slicing. Errore: {result1.stderr[:100]}..."}
+            logging.error(f"Anche il secondo tentativo è fallito. Stderr: {result2.stderr[:200]}")
+            return {"status": "error", "message": f"Sir, ho provato a riposizionare l'oggetto, ma lo slicing è fallito di nuovo. Errore: {result2.stderr[:100]}..."}
 
+    except slicing_jobs.JobCancelled:
+        logging.info(f"Slicing di {actual_file_path} annullato.") # This will be INFO level
+        raise
     except Exception as e:
         logging.error(f"Errore inaspettato durante lo slicing: {e}")
         import traceback
         traceback.print_exc() # This will now be a rich traceback if logging is configured by ai_slicer_rich.py
         return {"status": "error", "message": f"Si è verificato un errore Python inaspettato durante lo slicing: {e}"}
 
-def view_gcode(gcode_file_path):
+def _orientation_args(model_path):
+    """PrusaSlicer rotation arguments for a model, remembered per model content in the G-code cache."""
+    import orientation_optimizer
+    cache = gcode_cache.get_default_cache()
+    hint_name = f"orientation|{cache.file_digest(model_path)}"
+    args = cache.get_hint(hint_name)
+    if args is None:
+        args = orientation_optimizer.optimize_file(model_path)["slicer_args"]
+        cache.set_hint(hint_name, args)
+    if args:
+        logging.info(f"Orientamento automatico di {os.path.basename(model_path)}: {' '.join(args)}") # This will be INFO level
+    return args
+
+def _run_prusa_slicer(command, job=None):
     """
-    Opens the specified .gcode file using prusa-gcodeviewer.exe.
+    Runs PrusaSlicer and waits for it. When called from a background job the
+    process is attached to the job, so cancel_job can terminate it.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+    if job is not None:
+        job.attach_process(process)
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        if job is not None:
+            job.detach_process()
+    if job is not None and job.cancelled:
+        raise slicing_jobs.JobCancelled()
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+def _default_slicing_workers():
+    """Number of concurrent PrusaSlicer processes for batch slicing."""
+    configured = os.getenv("SLICING_MAX_WORKERS")
+    if configured:
+        try:
+            return max(1, int(configured))
+        except ValueError:
+            logging.warning(f"SLICING_MAX_WORKERS non valido: {configured}. Uso il numero di core.")
+    return max(1, os.cpu_count() or 1)
+
+@tool(max_concurrency=1)
+def slice_models_batch(file_paths: list = None):
+    """
+    Slices several 3D models in parallel using PrusaSlicer.
+
+    Each model is handed to slice_model on a bounded worker pool (one PrusaSlicer
+    process per worker, sized to the CPU cores or SLICING_MAX_WORKERS).
+    Progress is printed to the console as each job finishes.
+
+    Args:
+        file_paths (list, optional): Identifiers of the models to slice, with the same
+                                     meaning as slice_model's file_path (names, ids
+                                     from 'list_stl_files' or absolute paths).
+                                     If empty or not provided, every file in the default folder is sliced.
+    """
+    if not file_paths:
+        library = _get_model_library()
+        file_paths = [model["path"] for model in library.list()] if library else []
+
+    # Risolvo gli identificatori una sola volta, così la libreria non cambia durante il batch
+    targets = []
+    for identifier in file_paths:
+        path, error = _resolve_model_path(identifier)
+        if error:
+            return {"status": "error", "message": error}
+        targets.append(path)
+
+    if not targets:
+        return {"status": "error", "message": "Sir, non ho trovato file da processare."}
+
+    workers = min(_default_slicing_workers(), len(targets))
+    logging.info(f"Slicing batch di {len(targets)} modelli con {workers} worker.") # This will be INFO level
+    rprint(f"[bold magenta]Slicing di {len(targets)} modelli ({workers} in parallelo)...[/bold magenta]")
+
+    results = []
+    batch_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="slicer") as executor:
+        futures = {executor.submit(_timed_slice, target): target for target in targets}
+        for done_count, future in enumerate(as_completed(futures), 1):
+            target = futures[future]
+            try:
+                result, elapsed = future.result()
+            except Exception as e:
+                logging.error(f"Errore inaspettato durante lo slicing di {target}: {e}")
+                result, elapsed = {"status": "error", "message": str(e)}, 0.0
+            ok = result.get("status") == "success"
+            mark = "[green]✓[/green]" if ok else "[red]✗[/red]"
+            suffix = " (cache)" if result.get("cached") else ""
+            rprint(f"[dim cyan][{done_count}/{len(targets)}][/dim cyan] {mark} {os.path.basename(target)} in {elapsed:.1f}s{suffix}")
+            results.append({
+                "file": os.path.basename(target),
+                "status": result.get("status"),
+                "gcode_path": result.get("gcode_path"),
+                "cached": bool(result.get("cached")),
+                "seconds": round(elapsed, 2),
+                "message": None if ok else result.get("message"),
+            })
+
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    total_time = time.perf_counter() - batch_start
+    logging.info(f"Batch completato: {succeeded}/{len(targets)} riusciti in {total_time:.1f}s.") # This will be INFO level
+    return {
+        "status": "success" if succeeded == len(targets) else ("partial" if succeeded else "error"),
+        "message": f"Sir, ho processato {succeeded} modelli su {len(targets)} in {total_time:.0f} secondi.",
+        "succeeded": succeeded,
+        "failed": len(targets) - succeeded,
+        "seconds": round(total_time, 2),
+        "results": sorted(results, key=lambda r: r["file"]),
+    }
+
+def _timed_slice(file_path):
+    start = time.perf_counter()
+    result = slice_model(file_path)
+    return result, time.perf_counter() - start
+
+# --- Job di slicing in background ---
+_job_queue = None
+
+def _on_job_finished(job):
+    """Pushes the outcome of a background job to the console as soon as it ends."""
+    result = job.result if isinstance(job.result, dict) else {}
+    if job.status == slicing_jobs.SUCCEEDED and result.get("status") == "success":
+        if result.get("gcode_path"):
+            shared_variables.last_gcode_path = result["gcode_path"]
+        rprint(f"[bold green]Job {job.id} completato:[/bold green] {result.get('message', job.description)}")
+    elif job.status == slicing_jobs.CANCELLED:
+        rprint(f"[bold yellow]Job {job.id} annullato:[/bold yellow] {job.description}")
+    else:
+        rprint(f"[bold red]Job {job.id} fallito:[/bold red] {result.get('message') or job.error}")
+
+def _get_job_queue():
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = slicing_jobs.JobQueue(max_workers=_default_slicing_workers(), on_finished=_on_job_finished)
+    return _job_queue
+
+@tool()
+def submit_slicing_job(file_path: str, output_path: str = None, auto_orient: bool = False):
+    """
+    Starts slicing a 3D model in the background and returns a job id immediately.
+
+    Use get_job_status to follow the job and cancel_job to stop it. The result is
+    also printed to the console when the job finishes.
+
+    Args:
+        file_path (str): The identifier for the 3D model file to slice, as for slice_model.
+        output_path (str, optional): The desired path for the output G-code file.
+        auto_orient (bool, optional): Rotate the model to its best orientation first, as for slice_model.
+    """
+    # Gli identificatori vanno risolti ora: la libreria potrebbe cambiare prima che il job parta
+    identifier, error = _resolve_model_path(file_path)
+    if error:
+        return {"status": "error", "message": error}
+
+    job = _get_job_queue().submit(f"Slicing di {os.path.basename(identifier)}", _slice_model, identifier, output_path, auto_orient=auto_orient)
+    return {"status": "success", "job_id": job.id, "message": f"Ok, Glitch, ho avviato lo slicing di {os.path.basename(identifier)} in background (job {job.id})."}
+
+@tool(read_only=True)
+def get_job_status(job_id: str = None):
+    """
+    Returns the status (queued, running, succeeded, failed, cancelled), elapsed time and result of a
+    background slicing job, or of all known jobs if job_id is omitted.
+
+    Args:
+        job_id (str, optional): The id returned by submit_slicing_job.
+    """
+    queue = _get_job_queue()
+    if not job_id:
+        jobs = [job.to_dict() for job in queue.list()]
+        return {"status": "success", "jobs": jobs}
+    job = queue.get(job_id)
+    if job is None:
+        return {"status": "error", "message": f"Sir, non trovo il job {job_id}."}
+    return {"status": "success", "job": job.to_dict()}
+
+@tool()
+def cancel_job(job_id: str):
+    """
+    Cancels a queued or running background job, terminating PrusaSlicer if needed.
+
+    Args:
+        job_id (str): The id returned by submit_slicing_job.
+    """
+    job = _get_job_queue().cancel(job_id)
+    if job is None:
+        return {"status": "error", "message": f"Sir, non trovo il job {job_id}."}
+    if job.status in (slicing_jobs.SUCCEEDED, slicing_jobs.FAILED):
+        return {"status": "error", "message": f"Il job {job_id} è già terminato ({job.status})."}
+    return {"status": "success", "message": f"Ok, Glitch, ho annullato il job {job_id}."}
+
+@tool(read_only=True)
+def get_latency_report():
+    """
+    Returns the assistant latency statistics (time to first token, first sentence, complete answer, tool time)
+    as count, last, mean, p50, p95 and max in milliseconds, and prints them as a table.
+    Use it when the user asks how fast the assistant is responding.
+    """
+    report = latency_stats.get_latency_stats().print_report()
+    if not report:
+        return {"status": "success", "message": "Sir, non ho ancora misurato nessuna risposta.", "latency": {}}
+    return {"status": "success", "latency": report}
+
+@tool(read_only=True)
+def get_tool_stats():
+    """
+    Shows how often each tool has been called, with errors, cache hits and latency
+    (mean, p50, p95, max and a histogram in milliseconds), plus the hit rate of the tool result cache.
+    """
+    stats = TOOLS.stats()
+    cache_stats = TOOLS.cache.stats()
+    if not stats:
+        return {"status": "success", "message": "Sir, non ho ancora eseguito nessun tool.", "tools": {}, "cache": cache_stats}
+    table = Table(title="Statistiche dei tool", style="cyan", title_style="bold magenta")
+    table.add_column("Tool", style="green")
+    for column in ("Chiamate", "Errori", "Cache", "Media ms", "p95 ms", "Max ms"):
+        table.add_column(column, justify="right")
+    table.add_column("Istogramma")
+    for name, tool_stats in stats.items():
+        histogram = " ".join(f"{label}:{count}" for label, count in tool_stats["histogram"].items() if count)
+        table.add_row(name, str(tool_stats["calls"]), str(tool_stats["errors"]), str(tool_stats["cache_hits"]),
+                      str(tool_stats["mean_ms"]), str(tool_stats["p95_ms"]), str(tool_stats["max_ms"]), histogram)
+    rprint(table)
+    hit_rate = f"{cache_stats['hit_rate']:.0%}" if cache_stats["hit_rate"] is not None else "n/d"
+    rprint(f"[cyan]Cache dei risultati: {cache_stats['entries']}/{cache_stats['max_entries']} voci, "
+           f"hit rate {hit_rate} ({cache_stats['hits']} hit, {cache_stats['misses']} miss), "
+           f"{cache_stats['evictions']} scartate, {cache_stats['invalidations']} invalidate[/cyan]")
+    return {"status": "success", "tools": stats, "cache": cache_stats}
+
+@tool(read_only=True)
+def get_gcode_cache_stats():
+    """
+    Returns hit/miss counters and size of the local G-code cache used by slice_model.
+    """
+    try:
+        stats = gcode_cache.get_default_cache().stats()
+        return {"status": "success", "stats": stats}
+    except Exception as e:
+        logging.error(f"Errore nel leggere le statistiche della cache G-code: {e}")
+        return {"status": "error", "message": f"Errore nel leggere la cache G-code: {e}"}
+
+@tool(invalidates=())
+def view_gcode(gcode_file_path: str):
+    """
+    Opens the specified .gcode file using the locally installed Prusa G-code Viewer (prusa-gcodeviewer.exe).
+
+    Args:
+        gcode_file_path (str): The G-code file: a name in the default folder or a full path.
     """
     gcode_viewer_executable = os.getenv("PRUSA_GCODEVIEWER_PATH")
 
@@ -400,12 +944,360 @@ def view_gcode(gcode_file_path):
         logging.error(f"Errore inaspettato durante l'apertura del G-code viewer: {e}")
         return f"Si è verificato un errore inaspettato: {e}"
 
+@tool(read_only=True, max_concurrency=2)
+def analyze_model(file_path: str):
+    """
+    Analyzes a 3D model (STL or 3MF) for printability before slicing.
+
+    Reports size, volume, overhang area that will need supports, bed contact
+    area, open or non-manifold edges and walls thinner than the nozzle can print.
+    A summary table is printed to the console.
+
+    Args:
+        file_path (str): The model to analyze: a name, an id from `list_stl_files`, or a full path.
+    """
+    import mesh_analysis
+    actual_file_path, error = _resolve_model_path(file_path)
+    if error:
+        return {"status": "error", "message": error}
+
+    try:
+        report = mesh_analysis.analyze(actual_file_path)
+    except mesh_analysis.MeshError as e:
+        return {"status": "error", "message": f"Sir, non riesco a leggere il modello: {e}"}
+    except Exception as e:
+        logging.error(f"Errore durante l'analisi del modello {actual_file_path}: {e}")
+        return {"status": "error", "message": f"Sir, non sono riuscito ad analizzare il modello: {e}"}
+
+    table = Table(title=f"Analisi modello: {os.path.basename(actual_file_path)}", style="cyan", title_style="bold magenta")
+    table.add_column("Statistica", style="dim cyan")
+    table.add_column("Valore", style="green", justify="right")
+    walls = report["thin_walls"]
+    for label, value in (
+        ("Triangoli", report["triangles"]),
+        ("Ingombro (X×Y×Z)", " × ".join(f"{c:.1f}" for c in report["bounding_box_mm"]["size"]) + " mm"),
+        ("Volume", f"{report['volume_cm3']:.2f} cm³"),
+        (f"Sbalzi oltre {report['overhang_angle_deg']:g}°", f"{report['overhang_area_mm2']:.0f} mm² ({100 * report['overhang_fraction']:.1f}%)"),
+        ("Contatto col piatto", f"{report['bed_contact_area_mm2']:.0f} mm²"),
+        ("Mesh chiusa", "sì" if report["is_watertight"] else f"no ({report['open_edges']} aperti, {report['non_manifold_edges']} non-manifold)"),
+        ("Pareti sottili", f"{walls['area_mm2']:.0f} mm² (min {walls['min_thickness_mm']} mm)" if walls["samples"] else "nessuna"),
+    ):
+        table.add_row(label, str(value))
+    rprint(table)
+    for warning in report["warnings"]:
+        rprint(f"[yellow]⚠ {warning}[/yellow]")
+    return {"status": "success", "report": report}
+
+@tool(max_concurrency=2)
+def optimize_orientation(file_path: str):
+    """
+    Finds the best print orientation for a 3D model (STL or 3MF).
+
+    About a thousand orientations are scored together on the area that would need
+    supports, the area resting on the bed and the print height. The best rotation
+    is returned as PrusaSlicer arguments; slice_model(..., auto_orient=True) applies it.
+
+    Args:
+        file_path (str): The model: a name, an id from `list_stl_files`, or a full path.
+    """
+    import mesh_analysis
+    import orientation_optimizer
+    actual_file_path, error = _resolve_model_path(file_path)
+    if error:
+        return {"status": "error", "message": error}
+
+    try:
+        result = orientation_optimizer.optimize_file(actual_file_path)
+    except mesh_analysis.MeshError as e:
+        return {"status": "error", "message": f"Sir, non riesco a leggere il modello: {e}"}
+    except Exception as e:
+        logging.error(f"Errore durante l'ottimizzazione dell'orientamento di {actual_file_path}: {e}")
+        return {"status": "error", "message": f"Sir, non sono riuscito a calcolare l'orientamento: {e}"}
+
+    # slice_model(auto_orient=True) riusa il risultato senza ricalcolarlo
+    try:
+        cache = gcode_cache.get_default_cache()
+        cache.set_hint(f"orientation|{cache.file_digest(actual_file_path)}", result["slicer_args"])
+    except Exception as e:
+        logging.warning(f"Impossibile memorizzare l'orientamento di {actual_file_path}: {e}")
+
+    table = Table(title=f"Orientamento: {os.path.basename(actual_file_path)}", style="cyan", title_style="bold magenta")
+    table.add_column("", style="dim cyan")
+    table.add_column("Rotazione X/Y", justify="right")
+    table.add_column("Supporti", justify="right")
+    table.add_column("Contatto piatto", justify="right")
+    table.add_column("Altezza", justify="right")
+    for label, info, style in (("Attuale", result["current"], "yellow"), ("Migliore", result["best"], "green")):
+        table.add_row(label, f"{info['rotate_x']:g}° / {info['rotate_y']:g}°", f"{info['support_area_mm2']:.0f} mm²",
+                      f"{info['bed_contact_area_mm2']:.0f} mm²", f"{info['height_mm']:.1f} mm", style=style)
+    rprint(table)
+
+    if result["slicer_args"]:
+        message = f"Ok, Glitch, ruotando {os.path.basename(actual_file_path)} di {' '.join(result['slicer_args'])} i supporti passano da {result['current']['support_area_mm2']:.0f} a {result['best']['support_area_mm2']:.0f} mm²."
+    else:
+        message = f"Ok, Glitch, l'orientamento attuale di {os.path.basename(actual_file_path)} è già il migliore."
+    return {"status": "success", "message": message, "orientation": result}
+
+def _resolve_gcode_path(gcode_file_path=None):
+    """Resolves a G-code argument (relative to STL_DEFAULT_FOLDER, or the last sliced file)."""
+    if not gcode_file_path:
+        gcode_file_path = shared_variables.last_gcode_path
+        if not gcode_file_path:
+            return None, "Sir, non ho ancora generato G-code in questa sessione: indicami quale file usare."
+    if not os.path.isabs(gcode_file_path):
+        default_folder = os.getenv("STL_DEFAULT_FOLDER")
+        if not default_folder:
+            return None, "Sir, hai fornito solo un nome file per il G-code, ma non so dove cercarlo."
+        gcode_file_path = os.path.join(default_folder, gcode_file_path)
+    if not os.path.exists(gcode_file_path):
+        logging.error(f"G-code file not found: {gcode_file_path}")
+        return None, f"Sir, il file G-code non esiste: {os.path.basename(gcode_file_path)}."
+    return gcode_file_path, None
+
+# Oltre questo numero di layer il dettaglio per layer viene riassunto per l'LLM
+MAX_LAYERS_IN_RESPONSE = 50
+
+@tool(read_only=True)
+def analyze_gcode(gcode_file_path: str = None):
+    """
+    Analyzes a G-code file and reports print statistics.
+
+    Reports layer count, extrusion per layer, filament length and mass, travel
+    distance, bounding box and feed-rate histograms. A summary table is printed
+    to the console.
+
+    Args:
+        gcode_file_path (str, optional): The G-code file (name in the default folder or full path).
+                                         Defaults to the last G-code produced by slice_model.
+    """
+    import gcode_analyzer
+    actual_gcode_path, error = _resolve_gcode_path(gcode_file_path)
+    if error:
+        return {"status": "error", "message": error}
+
+    try:
+        stats = gcode_analyzer.analyze(actual_gcode_path)
+    except Exception as e:
+        logging.error(f"Errore durante l'analisi del G-code {actual_gcode_path}: {e}")
+        return {"status": "error", "message": f"Sir, non sono riuscito ad analizzare il G-code: {e}"}
+
+    table = Table(title=f"Analisi G-code: {os.path.basename(actual_gcode_path)}", style="cyan", title_style="bold magenta")
+    table.add_column("Statistica", style="dim cyan")
+    table.add_column("Valore", style="green", justify="right")
+    bbox = stats["bounding_box_mm"]
+    for label, value in (
+        ("Layer", stats["layer_count"]),
+        ("Filamento", f"{stats['filament_length_mm'] / 1000:.2f} m"),
+        ("Peso", f"{stats['filament_mass_g']:.1f} g"),
+        ("Distanza in stampa", f"{stats['print_distance_mm'] / 1000:.1f} m"),
+        ("Distanza di travel", f"{stats['travel_distance_mm'] / 1000:.1f} m"),
+        ("Ingombro (X×Y×Z)", " × ".join(f"{hi - lo:.1f}" for lo, hi in zip(bbox["min"], bbox["max"])) + " mm" if bbox else "-"),
+        ("Tempo stimato (slicer)", stats["slicer_estimated_time"] or "-"),
+    ):
+        table.add_row(label, str(value))
+    rprint(table)
+
+    # Risposta compatta per l'LLM: niente intervalli vuoti e dettaglio per layer riassunto
+    summary = dict(stats)
+    for key in ("print_feedrate_histogram", "travel_feedrate_histogram"):
+        summary[key] = [row for row in stats[key] if row["moves"]]
+    per_layer = stats["extrusion_per_layer_mm"]
+    if len(per_layer) > MAX_LAYERS_IN_RESPONSE:
+        summary["extrusion_per_layer_mm"] = _summarize_per_layer(per_layer, "heaviest_layer")
+        del summary["layer_z_mm"]
+    return {"status": "success", "stats": summary}
+
+def _summarize_per_layer(values, peak_name):
+    """Replaces a long per-layer list with min/max/mean and the (1-based) layer holding the maximum."""
+    peak = max(range(len(values)), key=values.__getitem__)
+    return {
+        "min": min(values),
+        "max": max(values),
+        "mean": round(sum(values) / len(values), 2),
+        peak_name: peak + 1,
+    }
+
+@tool(read_only=True)
+def estimate_print_time(gcode_file_path: str = None):
+    """
+    Estimates how long a G-code file takes to print with a kinematic model.
+
+    Accounts for acceleration, cornering (junction deviation/jerk) and the
+    printer's per-axis speed limits, and compares the result with the slicer's
+    own estimate. A summary table is printed to the console.
+
+    Args:
+        gcode_file_path (str, optional): The G-code file (name in the default folder or full path).
+                                         Defaults to the last G-code produced by slice_model.
+    """
+    import print_time_estimator
+    actual_gcode_path, error = _resolve_gcode_path(gcode_file_path)
+    if error:
+        return {"status": "error", "message": error}
+
+    try:
+        estimate = print_time_estimator.estimate(actual_gcode_path)
+    except Exception as e:
+        logging.error(f"Errore durante la stima del tempo di stampa di {actual_gcode_path}: {e}")
+        return {"status": "error", "message": f"Sir, non sono riuscito a stimare il tempo di stampa: {e}"}
+
+    per_layer = estimate["seconds_per_layer"]
+    table = Table(title=f"Tempo di stampa: {os.path.basename(actual_gcode_path)}", style="cyan", title_style="bold magenta")
+    table.add_column("Statistica", style="dim cyan")
+    table.add_column("Valore", style="green", justify="right")
+    for label, value in (
+        ("Tempo stimato", estimate["estimated_time"]),
+        ("Tempo stimato (slicer)", estimate["slicer_estimated_time"] or "-"),
+        ("Differenza", f"{estimate['error_percent']:+.1f}%" if estimate["error_percent"] is not None else "-"),
+        ("Layer", estimate["layer_count"]),
+        ("Layer più lento", f"{max(per_layer):.0f} s" if per_layer else "-"),
+        ("Movimenti", estimate["moves"]),
+    ):
+        table.add_row(label, str(value))
+    rprint(table)
+
+    summary = dict(estimate)
+    if len(per_layer) > MAX_LAYERS_IN_RESPONSE:
+        summary["seconds_per_layer"] = _summarize_per_layer(per_layer, "slowest_layer")
+    return {"status": "success", "estimate": summary}
+
+# --- Coda di stampa sulla farm ---
+_print_scheduler = None
+_print_scheduler_lock = threading.Lock()
+
+def _prepare_print_job(job):
+    """Slices a queued model (if needed) and estimates its print time; runs on the scheduler's worker."""
+    import print_time_estimator
+    if job.kind == "model":
+        result = slice_model(job.source)
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("message", "slicing fallito"))
+        job.gcode_path = result["gcode_path"]
+    try:
+        estimate = print_time_estimator.estimate(job.gcode_path)
+        job.estimated_seconds = estimate["estimated_seconds"] or estimate.get("slicer_estimated_seconds")
+    except Exception as e:
+        logging.warning(f"Stima del tempo non disponibile per {job.gcode_path}: {e}")
+
+def _get_print_scheduler():
+    global _print_scheduler
+    with _print_scheduler_lock:
+        if _print_scheduler is None:
+            _print_scheduler = print_scheduler.PrintScheduler(
+                octoprint_client.get_registry(),
+                os.getenv("PRINT_QUEUE_FILE", print_scheduler.DEFAULT_QUEUE_FILE),
+                prepare=_prepare_print_job,
+                poll_seconds=float(os.getenv("PRINT_SCHEDULER_POLL_SECONDS", print_scheduler.DEFAULT_POLL_SECONDS)),
+            )
+            _print_scheduler.start()
+        return _print_scheduler
+
+def resume_print_queue():
+    """Restarts the print scheduler at startup if a saved queue has unfinished jobs."""
+    queue_path = os.getenv("PRINT_QUEUE_FILE", print_scheduler.DEFAULT_QUEUE_FILE)
+    if os.path.exists(queue_path) and octoprint_client.get_registry().names():
+        scheduler = _get_print_scheduler()
+        pending = [j for j in scheduler.list() if j.status not in print_scheduler.FINAL_STATES]
+        if pending:
+            logging.info(f"Coda di stampa ripresa con {len(pending)} lavori da completare.") # This will be INFO level
+
+@tool()
+def schedule_print(file_path: str, printer: str = None):
+    """
+    Adds a model or a G-code file to the print queue of the printer farm.
+
+    Models are sliced first. The scheduler assigns each job to the printer that becomes
+    free first (using the estimated print times and the live printer state), uploads the
+    G-code and starts the print; the queue survives restarts. Returns the print job id.
+
+    Args:
+        file_path (str): A G-code file (name in the default folder or full path), or a
+                         model identifier as for slice_model (name, id from list_stl_files or full path).
+        printer (str, optional): Name of the printer to use. If omitted, any free printer is used.
+    """
+    registry = octoprint_client.get_registry()
+    if not registry.names():
+        return {"status": "error", "message": "OctoPrint configuration missing."}
+    if printer:
+        client = registry.get_client(printer)
+        if client is None:
+            return {"status": "error", "message": f"Sir, non conosco la stampante {printer}. Stampanti configurate: {', '.join(registry.names())}."}
+        printer = client.name
+
+    if str(file_path).lower().endswith(".gcode"):
+        path, error = _resolve_gcode_path(file_path)
+        kind = "gcode"
+    else:
+        path, error = _resolve_model_path(file_path)
+        kind = "model"
+    if error:
+        return {"status": "error", "message": error}
+
+    job = _get_print_scheduler().submit(path, kind, printer=printer)
+    where = f"sulla stampante {printer}" if printer else "sulla prima stampante libera"
+    return {"status": "success", "job_id": job.id,
+            "message": f"Ok, Glitch, ho messo in coda {os.path.basename(path)} (lavoro {job.id}): partirà {where}."}
+
+@tool(read_only=True)
+def get_print_queue():
+    """
+    Shows the print queue of the printer farm: status (queued, preparing, uploading, printing,
+    done, failed, cancelled), assigned printer, estimated duration and expected start of every job.
+    """
+    jobs = _get_print_scheduler().list()
+    if not jobs:
+        return {"status": "success", "message": "Sir, la coda di stampa è vuota.", "jobs": []}
+
+    table = Table(title="Coda di Stampa", style="cyan", title_style="bold magenta")
+    table.add_column("#", style="dim cyan", justify="right")
+    table.add_column("File", style="green", overflow="fold")
+    table.add_column("Stato")
+    table.add_column("Stampante")
+    table.add_column("Durata", justify="right")
+    table.add_column("Inizio", justify="right")
+    for job in jobs:
+        duration = latency_stats.format_duration(job.estimated_seconds) if job.estimated_seconds else "-"
+        if job.status == print_scheduler.QUEUED and job.planned_start_seconds is not None:
+            start = "subito" if job.planned_start_seconds == 0 else f"tra {latency_stats.format_duration(job.planned_start_seconds)}"
+        else:
+            start = "-"
+        table.add_row(job.id, job.name, job.status, job.assigned_printer or job.printer or "-", duration, start)
+    rprint(table)
+
+    active = sum(1 for j in jobs if j.status not in print_scheduler.FINAL_STATES)
+    return {"status": "success", "message": f"Sir, ci sono {active} lavori attivi in coda.",
+            "jobs": [job.to_dict() for job in jobs]}
+
+@tool()
+def cancel_print_job(job_id: str):
+    """
+    Removes a job from the print queue; if it is already printing, the print is cancelled on its printer.
+
+    Args:
+        job_id (str): The id returned by schedule_print.
+    """
+    scheduler = _get_print_scheduler()
+    job = scheduler.get(job_id)
+    if job is None:
+        return {"status": "error", "message": f"Sir, non trovo il lavoro di stampa {job_id}."}
+    if job.status in print_scheduler.FINAL_STATES:
+        return {"status": "error", "message": f"Il lavoro {job_id} è già terminato ({job.status})."}
+    try:
+        scheduler.cancel(job_id)
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Errore nell'annullare la stampa del lavoro {job_id}: {e}")
+        return {"status": "error", "message": f"Error connecting to OctoPrint or API issue: {e}"}
+    return {"status": "success", "message": f"Ok, Glitch, ho annullato il lavoro di stampa {job_id}."}
+
+@tool(read_only=True, cache_seconds=60, max_concurrency=4)
 def fetch_local_url_content(url: str) -> str:
     """
-    Fetches content from a local URL and returns it as markdown or plain text.
+    Fetches the textual content of a URL on the local network (e.g. documentation or status pages of
+    local devices) and returns it as markdown or plain text.
     Args:
-        url: The local URL to fetch (e.g., http://octoprint.local/api/job).
+        url (str): The full local URL to fetch (e.g. http://192.168.1.100/status).
     """
+    import markdownify # Or from bs4 import BeautifulSoup
     try:
         response = requests.get(url, timeout=5) # Add timeout
         response.raise_for_status() # Raise an exception for HTTP errors
@@ -0,0 +1,248 @@
+# tts.py
+"""
+Sintesi vocale locale (offline) delle risposte di Arturo.
+
+Le frasi vengono sintetizzate una alla volta in WAV in memoria (niente più
+speech.mp3 temporanei) da un motore locale: Piper, se TTS_VOICE indica un
+modello .onnx, altrimenti espeak-ng se è installato. Lo ``Speaker`` di
+voice_pipeline chiama ``prepare`` appena una frase è pronta, così la sintesi
+della frase successiva avviene mentre la precedente è in riproduzione e la
+voce parte dopo la prima frase. La riproduzione usa un canale riservato di
+pygame.mixer e aspetta la fine della frase o l'interruzione su un evento,
+senza interrogare ``get_busy()`` ogni 50 ms.
+
+L'audio delle frasi già pronunciate resta in una cache LRU in memoria
+(TTS_CACHE_MAX_ENTRIES); le frasi brevi, come il saluto e le conferme più
+comuni, vengono salvate anche su disco (TTS_CACHE_DIR) e sono subito pronte
+agli avvii successivi. La chiave comprende motore e voce.
+"""
+import io
+import os
+import wave
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CACHE_ENTRIES = 128
+DEFAULT_CACHE_DIR = ".tts_cache"
+DISK_CACHE_MAX_CHARS = 120   # solo le frasi brevi, quelle che tornano spesso, finiscono su disco
+SYNTHESIS_TIMEOUT_SECONDS = 30
+
+
+def _rewrite_wav(data):
+    """Rewrites a WAV with correct header sizes (espeak writes placeholders when streaming to stdout)."""
+    with wave.open(io.BytesIO(data), "rb") as source:
+        params = source.getparams()
+        frames = source.readframes(source.getnframes())
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as target:
+        target.setnchannels(params.nchannels)
+        target.setsampwidth(params.sampwidth)
+        target.setframerate(params.framerate)
+        target.writeframes(frames)
+    return buffer.getvalue()
+
+
+class PiperEngine:
+    """Piper neural voices (piper-tts), e.g. it_IT-paola-medium.onnx."""
+
+    def __init__(self, model_path):
+        from piper import PiperVoice
+        self.voice = PiperVoice.load(model_path)
+        self.id = f"piper:{os.path.basename(model_path)}"
+
+    def synthesize(self, text):
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            if hasattr(self.voice, "synthesize_wav"):   # piper-tts 1.3+
+                self.voice.synthesize_wav(text, wav)
+            else:
+                self.voice.synthesize(text, wav)
+        return buffer.getvalue()
+
+
+class EspeakEngine:
+    """espeak-ng (or espeak) run as a subprocess, WAV read from its stdout."""
+
+    def __init__(self, voice="it"):
+        self.executable = shutil.which("espeak-ng") or shutil.which("espeak")
+        if self.executable is None:
+            raise RuntimeError("espeak-ng non trovato nel PATH")
+        self.voice = voice
+        self.id = f"espeak:{voice}"
+
+    def synthesize(self, text):
+        result = subprocess.run([self.executable, "-v", self.voice, "--stdout", text],
+                                capture_output=True, check=True, timeout=SYNTHESIS_TIMEOUT_SECONDS)
+        return _rewrite_wav(result.stdout)
+
+
+def load_engine(name="auto", voice=None):
+    """
+    Loads a local TTS engine.
+
+    Args:
+        name (str, optional): "piper", "espeak", "auto" (Piper if a voice model is given, else espeak) or "none".
+        voice (str, optional): Path of the Piper .onnx model, or the espeak voice name.
+
+    Returns:
+        The engine, or None if no engine is available.
+    """
+    name = (name or "auto").lower()
+    if name in ("none", "off", "0"):
+        return None
+    if name in ("piper", "auto") and voice and voice.endswith(".onnx"):
+        try:
+            return PiperEngine(voice)
+        except Exception as e:
+            logging.warning(f"Voce Piper {voice} non disponibile: {e}")
+            if name == "piper":
+                return None
+    if name in ("espeak", "auto"):
+        try:
+            return EspeakEngine(voice if voice and not voice.endswith(".onnx") else "it")
+        except Exception as e:
+            (logging.warning if name == "espeak" else logging.info)(f"espeak non disponibile: {e}")
+    return None
+
+
+class TextToSpeech:
+    """Sentence-level synthesis with look-ahead, an audio cache and interruptible playback."""
+
+    def __init__(self, engine, mixer, cache_entries=DEFAULT_CACHE_ENTRIES, cache_dir=DEFAULT_CACHE_DIR):
+        self.engine = engine
+        self._mixer = mixer
+        self._mixer.set_reserved(1)
+        self._channel = mixer.Channel(0)   # una frase alla volta, sempre sullo stesso canale
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")   # sintesi in ordine
+        self._pending = {}              # testo -> future della sintesi anticipata
+        self._cache = OrderedDict()     # testo -> WAV
+        self.cache_entries = cache_entries
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, mixer):
+        """Builds the subsystem from TTS_ENGINE, TTS_VOICE, TTS_CACHE_MAX_ENTRIES and TTS_CACHE_DIR; None without an engine."""
+        engine = load_engine(os.getenv("TTS_ENGINE", "auto"), os.getenv("TTS_VOICE"))
+        if engine is None:
+            return None
+        try:
+            cache_entries = int(os.getenv("TTS_CACHE_MAX_ENTRIES", DEFAULT_CACHE_ENTRIES))
+        except ValueError:
+            logging.warning("TTS_CACHE_MAX_ENTRIES non valido, uso il valore predefinito.")
+            cache_entries = DEFAULT_CACHE_ENTRIES
+        cache_dir = os.getenv("TTS_CACHE_DIR", DEFAULT_CACHE_DIR)
+        return cls(engine, mixer, cache_entries=max(0, cache_entries), cache_dir=cache_dir or None)
+
+    @staticmethod
+    def _key(text):
+        return " ".join(text.split())
+
+    def _disk_path(self, key):
+        if not self.cache_dir or len(key) > DISK_CACHE_MAX_CHARS:
+            return None
+        digest = hashlib.sha256(f"{self.engine.id}\n{key}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".wav")
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._cache[key] = data
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def audio(self, text):
+        """Returns the WAV bytes for a sentence, from the cache or synthesized now."""
+        key = self._key(text)
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return data
+        path = self._disk_path(key)
+        if path is not None and os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            self.disk_hits += 1
+        else:
+            data = self.engine.synthesize(key)
+            self.misses += 1
+            if path is not None:
+                try:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    with open(path, "wb") as f:
+                        f.write(data)
+                except OSError as e:
+                    logging.warning(f"Impossibile salvare l'audio in cache {path}: {e}")
+        self._remember(key, data)
+        return data
+
+    def prepare(self, text):
+        """Starts synthesizing a sentence in the background, ahead of its playback."""
+        key = self._key(text)
+        with self._lock:
+            if not key or key in self._cache or key in self._pending:
+                return
+            future = self._pool.submit(self.audio, key)
+            self._pending[key] = future
+        future.add_done_callback(lambda _: self._forget(key, future))
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def cancel_pending(self):
+        """Drops the syntheses not started yet (the answer they belong to was interrupted)."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.cancel()
+
+    def speak(self, text, interrupted):
+        """
+        Plays a sentence and returns when it has been played, or as soon as interrupted is set.
+
+        Args:
+            text (str): The sentence.
+            interrupted (threading.Event): Set to stop the playback.
+        """
+        key = self._key(text)
+        with self._lock:
+            future = self._pending.get(key)
+        data = None
+        if future is not None:
+            try:
+                data = future.result()
+            except Exception:   # annullata o fallita: si riprova qui sotto
+                data = None
+        if data is None:
+            data = self.audio(key)
+        if interrupted.is_set():
+            return
+        sound = self._mixer.Sound(file=io.BytesIO(data))
+        self._channel.play(sound)
+        # Fine della frase o interruzione, senza controllare get_busy() a intervalli
+        if interrupted.wait(sound.get_length()):
+            self._channel.stop()
+
+    def busy(self):
+        return self._channel.get_busy()
+
+    def stop(self):
+        self.cancel_pending()
+        self._channel.stop()
+
+    def stats(self):
+        with self._lock:
+            return {"engine": self.engine.id, "entries": len(self._cache), "hits": self.hits,
+                    "disk_hits": self.disk_hits, "misses": self.misses}
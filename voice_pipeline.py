@@ -0,0 +1,223 @@
+# voice_pipeline.py
+"""
+Pipeline della conversazione vocale: ascolto, risposta dell'LLM e voce
+girano in stadi separati, ciascuno sul proprio thread.
+
+- Il riconoscimento vocale continua ad ascoltare mentre l'LLM risponde e
+  mentre Arturo parla, e le trascrizioni arrivano al ciclo principale da
+  una coda (shared_variables.transcripts).
+- Ogni domanda diventa un turno (``VoicePipeline.submit``) eseguito su un
+  thread dedicato: le frasi complete della risposta passano allo
+  ``Speaker`` man mano che arrivano, senza aspettare la risposta intera.
+- Lo ``Speaker`` pronuncia le frasi in ordine e segnala quando ha finito
+  davvero di parlare, al posto di una pausa stimata dalla lunghezza della
+  risposta.
+- Una nuova domanda mentre un turno è in corso (barge-in) annulla la
+  richiesta all'LLM e ferma subito la voce.
+"""
+import re
+import time
+import queue
+import logging
+import threading
+
+SENTENCE_END = re.compile(r"[.!?…](\s+|$)")
+WAIT_SLICE_SECONDS = 0.5   # attese spezzate in intervalli brevi, così Ctrl+C resta attivo anche su Windows
+
+
+class SentenceSplitter:
+    """Turns streamed text chunks into complete sentences."""
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, chunk):
+        """Adds a chunk and returns the sentences it completed."""
+        self._buffer += chunk
+        sentences = []
+        while True:
+            match = SENTENCE_END.search(self._buffer)
+            if not match:
+                break
+            sentence = self._buffer[:match.end()].strip()
+            self._buffer = self._buffer[match.end():]
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self):
+        """Returns the text left after the last sentence end (if any) and empties the buffer."""
+        rest, self._buffer = self._buffer.strip(), ""
+        return rest
+
+
+class Speaker:
+    """
+    Playback stage: speaks queued sentences in order on its own thread.
+
+    ``speak(sentence, interrupted)`` must block until the sentence has been played and return
+    early once the ``interrupted`` event is set. Without an engine (voice replies disabled) the
+    speaker stays idle and every sentence is dropped. The optional ``prepare(sentence)`` is called
+    as soon as a sentence is queued, so the engine can synthesize it while the previous one is
+    playing, and ``cancel()`` when the queued sentences are dropped.
+    """
+
+    def __init__(self, speak=None, prepare=None, cancel=None):
+        self._speak = speak
+        self._prepare = prepare
+        self._cancel = cancel
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._generation = 0
+        self._interrupted = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self.last_played_at = None   # perf_counter della fine dell'ultima frase pronunciata
+        if speak is not None:
+            threading.Thread(target=self._run, daemon=True, name="speaker").start()
+
+    @property
+    def enabled(self):
+        return self._speak is not None
+
+    def say(self, sentence):
+        """Queues a sentence to be spoken after the ones already queued."""
+        if self._speak is None or not sentence.strip():
+            return
+        with self._lock:
+            self._pending += 1
+            self._idle.clear()
+            self._queue.put((self._generation, sentence))
+        if self._prepare is not None:
+            try:
+                self._prepare(sentence)
+            except Exception as e:
+                logging.error(f"Errore durante la preparazione della risposta vocale: {e}")
+
+    def stop(self):
+        """Interrupts the sentence being spoken and drops the queued ones."""
+        with self._lock:
+            self._generation += 1
+            self._interrupted.set()
+            dropped = 0
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                dropped += 1
+            self._pending -= dropped
+            if self._pending <= 0:
+                self._pending = 0
+                self._idle.set()
+        if self._cancel is not None:
+            self._cancel()
+
+    def busy(self):
+        return not self._idle.is_set()
+
+    def wait_idle(self, timeout=None):
+        """Blocks until everything queued has been spoken (or dropped); returns False on timeout."""
+        return self._idle.wait(timeout)
+
+    def _run(self):
+        while True:
+            generation, sentence = self._queue.get()
+            with self._lock:
+                stale = generation != self._generation   # presa dalla coda appena prima di uno stop()
+                if not stale:
+                    self._interrupted.clear()
+            if not stale:
+                try:
+                    self._speak(sentence, self._interrupted)
+                except Exception as e:
+                    logging.error(f"Errore durante la riproduzione della risposta: {e}")
+            with self._lock:
+                if not stale:
+                    self.last_played_at = time.perf_counter()
+                self._pending -= 1
+                if self._pending <= 0:
+                    self._pending = 0
+                    self._idle.set()
+
+
+class VoicePipeline:
+    """
+    LLM stage: runs one turn at a time on a worker thread and feeds its sentences to the speaker.
+
+    ``answer(question, speech_end=..., cancel=..., on_sentence=...)`` must return the complete answer text,
+    calling ``on_sentence`` for every complete sentence as soon as it is available and stopping
+    early once the ``cancel`` event is set.
+    """
+
+    def __init__(self, answer, speaker):
+        self._answer = answer
+        self.speaker = speaker
+        self._thread = None
+        self._cancel = None
+        self._lock = threading.Lock()
+        self.last_answer = ""
+        self.last_reply_end = None   # perf_counter di fine dell'ultima risposta (voce compresa)
+        self.turns_interrupted = 0
+
+    def busy(self):
+        """A turn is running or its answer is still being spoken."""
+        return (self._thread is not None and self._thread.is_alive()) or self.speaker.busy()
+
+    def speaking(self):
+        return self.speaker.busy()
+
+    def submit(self, question, speech_end=None):
+        """Starts a turn for the question, interrupting the current one first (barge-in)."""
+        with self._lock:
+            self.barge_in()
+            self.last_answer = ""
+            cancel = threading.Event()
+            thread = threading.Thread(target=self._run_turn, args=(question, cancel, speech_end),
+                                      daemon=True, name="turn")
+            self._cancel, self._thread = cancel, thread
+            thread.start()
+        return thread
+
+    def barge_in(self):
+        """
+        Interrupts the running turn: the LLM request is cancelled and the voice stops at once.
+        Waits for the turn thread to finish, so two turns never use the chat session together;
+        a tool that is already running is allowed to finish.
+        """
+        thread = self._thread
+        interrupted = thread is not None and thread.is_alive()
+        if interrupted or self.speaker.busy():
+            self.turns_interrupted += 1
+            if self._cancel is not None:
+                self._cancel.set()
+            self.speaker.stop()
+        if interrupted:
+            while thread.is_alive():
+                thread.join(WAIT_SLICE_SECONDS)
+        return interrupted
+
+    def wait(self):
+        """Blocks until the current turn has been answered and spoken."""
+        thread = self._thread
+        if thread is not None:
+            while thread.is_alive():
+                thread.join(WAIT_SLICE_SECONDS)
+        while not self.speaker.wait_idle(WAIT_SLICE_SECONDS):
+            pass
+
+    def _run_turn(self, question, cancel, speech_end):
+        try:
+            answer = self._answer(question, speech_end=speech_end, cancel=cancel, on_sentence=self.speaker.say)
+        except Exception as e:
+            logging.error(f"Errore durante il turno di conversazione: {e}")
+            return
+        if cancel.is_set():
+            return
+        # Il turno finisce quando la risposta è stata pronunciata, non dopo una pausa stimata
+        while not self.speaker.wait_idle(WAIT_SLICE_SECONDS):
+            if cancel.is_set():
+                return
+        self.last_answer = answer
+        self.last_reply_end = time.perf_counter()